@@ -5,21 +5,46 @@ Typing Replay Engine
 主入口和便捷 API
 """
 
-__version__ = '1.0.0'
+from version import __version__
 __author__ = 'Claude'
 
+from pathlib import Path
+
 # 导出核心类
-from buffer import TextBuffer, Selection, TextStyle, EditorState
+from buffer import TextBuffer, Selection, TextStyle, EditorState, EditorStateView
 from actions import (
     Action,
     TypeTextAction, InsertTextAction, BackspaceAction, DeleteAction,
     MoveCursorAction, SetSelectionAction, DeleteSelectionAction,
-    SetStyleAction, PauseAction, ReplaceTextAction,
-    type_text, pause, backspace, move_cursor, select, delete_selection, set_style
+    SetStyleAction, PauseAction, ReplaceTextAction, RepeatAction,
+    type_text, pause, backspace, move_cursor, select, delete_selection, set_style, repeat,
+    expand_emoji_shortcuts, register_emoji_shortcuts, load_emoji_shortcuts
 )
 from scheduler import PlaybackScheduler, InteractiveScheduler, PlaybackEvent
+from events import (
+    EventBus, Subscription, ThreadSubscription, AsyncioSubscription, Backpressure
+)
+from compiler import Program, Op, compile_actions, iter_keystrokes
+from optimizer import optimize_actions
+from dry_run import DryRunReport, DryRunIssue, dry_run
 from script_parser import ScriptParser, ScriptBuilder, load_demo_script
-from console import ConsoleRenderer, EventLogger, SimpleDisplay
+from diff_synth import DiffSynthesizer, synthesize, synthesize_revisions
+from keylog import KeylogImporter, import_keylog, convert_keylog
+from template import ScriptTemplate, TemplateRenderer, render_variants
+from timing import (
+    TimingModel, GaussianTimingModel, BigramTimingModel, KeyboardTimingModel,
+    register_timing_model
+)
+from binary_script import BinaryScript, SegmentedScript, encode_actions, write_binary
+from script_cache import ScriptCache
+from viewport import Viewport
+from asciicast import CastScreen, write_cast, export_cast
+from svg_export import SvgAnimation, write_svg, export_svg
+from html_export import DeltaRecorder, iter_deltas, write_html, export_html
+from frame_export import iter_frames, export_frames
+from console import (
+    ConsoleRenderer, IncrementalRenderer, ThrottledDisplay, EventLogger, SimpleDisplay
+)
 
 
 # 便捷 API
@@ -55,7 +80,7 @@ def create_replay(actions=None):
     return scheduler
 
 
-def quick_play(script, real_time=False, show_output=True):
+def quick_play(script, real_time=False, show_output=True, max_fps=None):
     """
     快速播放脚本的便捷函数
     
@@ -63,12 +88,24 @@ def quick_play(script, real_time=False, show_output=True):
         script: 脚本（字典、列表或动作）
         real_time: 是否实时播放
         show_output: 是否显示输出
+        max_fps: 指定时在独立线程中以不超过该帧率原地刷新显示，
+            只渲染最新状态，结束后打印渲染/丢弃的帧数
     
     Returns:
         最终文本
     """
     scheduler = create_replay(script)
     
+    if show_output and max_fps is not None:
+        display = ThrottledDisplay(max_fps=max_fps)
+        scheduler.on_state_changed(display.submit)
+        with display:
+            scheduler.play(real_time=real_time)
+        stats = display.stats
+        print(f"Frames rendered: {stats['frames_rendered']} | "
+              f"dropped: {stats['frames_dropped']}")
+        return scheduler.buffer.text
+    
     if show_output:
         display = SimpleDisplay()
         scheduler.on_state_changed(
@@ -91,6 +128,12 @@ def load_and_play(filepath, real_time=False):
     Returns:
         PlaybackScheduler
     """
+    if Path(filepath).suffix == '.jsonl':
+        # JSON Lines 脚本流式播放，不在内存中保留全部动作
+        scheduler = PlaybackScheduler()
+        scheduler.play_stream(ScriptParser.iter_parse(filepath), real_time=real_time)
+        return scheduler
+    
     actions = ScriptParser.parse(filepath)
     scheduler = create_replay(actions)
     scheduler.play(real_time=real_time)
@@ -104,19 +147,30 @@ __all__ = [
     '__version__',
     
     # 核心类
-    'TextBuffer', 'Selection', 'TextStyle', 'EditorState',
+    'TextBuffer', 'Selection', 'TextStyle', 'EditorState', 'EditorStateView',
     'Action', 'PlaybackScheduler', 'InteractiveScheduler', 'PlaybackEvent',
-    'ScriptParser', 'ScriptBuilder',
-    'ConsoleRenderer', 'EventLogger', 'SimpleDisplay',
+    'ScriptParser', 'ScriptBuilder', 'DiffSynthesizer', 'KeylogImporter', 'Program', 'Op',
+    'ScriptTemplate', 'TemplateRenderer',
+    'TimingModel', 'GaussianTimingModel', 'BigramTimingModel', 'KeyboardTimingModel',
+    'DryRunReport', 'DryRunIssue', 'BinaryScript', 'SegmentedScript', 'ScriptCache',
+    'ConsoleRenderer', 'IncrementalRenderer', 'ThrottledDisplay', 'EventLogger', 'SimpleDisplay',
+    'Viewport', 'CastScreen', 'SvgAnimation', 'DeltaRecorder',
+    'EventBus', 'Subscription', 'ThreadSubscription', 'AsyncioSubscription', 'Backpressure',
     
     # 动作类
     'TypeTextAction', 'InsertTextAction', 'BackspaceAction', 'DeleteAction',
     'MoveCursorAction', 'SetSelectionAction', 'DeleteSelectionAction',
-    'SetStyleAction', 'PauseAction', 'ReplaceTextAction',
+    'SetStyleAction', 'PauseAction', 'ReplaceTextAction', 'RepeatAction',
     
     # 便捷函数
     'type_text', 'pause', 'backspace', 'move_cursor', 'select', 
-    'delete_selection', 'set_style',
+    'delete_selection', 'set_style', 'repeat',
+    'expand_emoji_shortcuts', 'register_emoji_shortcuts', 'load_emoji_shortcuts',
+    'compile_actions', 'iter_keystrokes', 'optimize_actions', 'dry_run',
+    'encode_actions', 'write_binary', 'synthesize', 'synthesize_revisions',
+    'import_keylog', 'convert_keylog', 'register_timing_model', 'render_variants',
+    'write_cast', 'export_cast', 'write_svg', 'export_svg',
+    'iter_deltas', 'write_html', 'export_html', 'iter_frames', 'export_frames',
     'create_replay', 'quick_play', 'load_and_play', 'load_demo_script',
 ]
 
@@ -4,9 +4,12 @@
 """
 
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
-from typing import Optional, Callable
+from dataclasses import dataclass, field
+from typing import Optional, Callable, Iterable, Iterator
+import hashlib
+import json
 import random
+import re
 import time
 
 from buffer import TextBuffer, TextStyle
@@ -75,20 +78,110 @@ EMOJI_SHORTCUTS = {
 }
 
 
+def _build_emoji_pattern(shortcuts) -> Optional[re.Pattern]:
+    """
+    把快捷码表编译成按前缀分叉的正则（trie 形式）
+    
+    相同前缀只匹配一次，长码优先，整段文本只需扫描一遍。
+    """
+    if not shortcuts:
+        return None
+    
+    # 构建前缀树，'' 键标记一个快捷码在此结束
+    trie: dict = {}
+    for code in shortcuts:
+        node = trie
+        for char in code:
+            node = node.setdefault(char, {})
+        node[''] = True
+    
+    def to_regex(node: dict) -> str:
+        terminal = '' in node
+        branches = [re.escape(char) + to_regex(child)
+                    for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        if len(branches) == 1:
+            body = branches[0]
+            if terminal:
+                return f"(?:{body})?"
+            return body
+        body = '(?:' + '|'.join(branches) + ')'
+        # 可选分组是贪婪的，会先尝试更长的快捷码
+        return body + '?' if terminal else body
+    
+    return re.compile(to_regex(trie))
+
+
+def _fingerprint_emoji_table(shortcuts) -> str:
+    """快捷码表的内容指纹"""
+    digest = hashlib.sha1()
+    for code, emoji in sorted(shortcuts.items()):
+        digest.update(f"{code}\0{emoji}\0".encode('utf-8'))
+    return digest.hexdigest()
+
+
+# 导入时编译一次，之后所有 TypeTextAction 共用
+_emoji_table: dict[str, str] = dict(EMOJI_SHORTCUTS)
+_emoji_pattern: Optional[re.Pattern] = _build_emoji_pattern(_emoji_table)
+_emoji_fingerprint: str = _fingerprint_emoji_table(_emoji_table)
+
+
+def register_emoji_shortcuts(shortcuts: dict[str, str]) -> None:
+    """
+    注册（或覆盖）emoji 快捷码并重新编译匹配器
+    
+    Args:
+        shortcuts: 快捷码到 emoji 的映射，如 {':taco:': '🌮'}
+    """
+    global _emoji_table, _emoji_pattern, _emoji_fingerprint
+    EMOJI_SHORTCUTS.update(shortcuts)
+    _emoji_table = dict(EMOJI_SHORTCUTS)
+    _emoji_pattern = _build_emoji_pattern(_emoji_table)
+    _emoji_fingerprint = _fingerprint_emoji_table(_emoji_table)
+
+
+def emoji_shortcuts_fingerprint() -> str:
+    """
+    当前生效的快捷码表指纹
+    
+    快捷码表变化会改变解析结果，缓存解析结果时应把它计入键中。
+    """
+    return _emoji_fingerprint
+
+
+def load_emoji_shortcuts(filepath) -> int:
+    """
+    从 JSON 文件加载快捷码表（如完整的 1800+ 条 shortcode 集合）
+    
+    Args:
+        filepath: JSON 文件路径，内容为 {快捷码: emoji} 映射
+    
+    Returns:
+        加载的快捷码数量
+    """
+    with open(filepath, 'r', encoding='utf-8') as f:
+        shortcuts = json.load(f)
+    register_emoji_shortcuts(shortcuts)
+    return len(shortcuts)
+
+
 def expand_emoji_shortcuts(text: str) -> str:
     """
     展开文本中的 emoji 快捷码
     
+    使用预编译的匹配器单遍扫描；重叠时取最长的快捷码。
+    
     Args:
         text: 包含快捷码的文本，如 "Hello :smile:"
     
     Returns:
         展开后的文本，如 "Hello 😊"
     """
-    result = text
-    for shortcut, emoji in EMOJI_SHORTCUTS.items():
-        result = result.replace(shortcut, emoji)
-    return result
+    if _emoji_pattern is None:
+        return text
+    table = _emoji_table
+    return _emoji_pattern.sub(lambda match: table[match.group()], text)
 
 
 class Action(ABC):
@@ -132,11 +225,15 @@ class TypeTextAction(Action):
     avg_char_delay: float = 0.1  # 平均每字符延迟（秒）
     delay_variance: float = 0.05  # 延迟抖动范围
     expand_emoji: bool = True  # 是否展开 emoji 快捷码
+    char_delays: Optional[list[float]] = None  # 每个字符的固定延迟（如录制的按键间隔）
+    timing_model: Optional['TimingModel'] = field(default=None, repr=False, compare=False)
     
     def __post_init__(self):
-        """初始化后处理 - 展开 emoji"""
+        """初始化后处理 - 展开 emoji，并由时间模型生成逐字符延迟"""
         if self.expand_emoji:
             self.text = expand_emoji_shortcuts(self.text)
+        if self.timing_model is not None and self.char_delays is None:
+            self.char_delays = self.timing_model.delays(self.text)
     
     def execute(self, buffer: TextBuffer) -> None:
         """一次性插入所有文本（用于非实时播放）"""
@@ -160,15 +257,20 @@ class TypeTextAction(Action):
     
     def get_char_delay(self, char_index: int) -> float:
         """获取指定字符的延迟"""
+        if self.char_delays is not None and char_index < len(self.char_delays):
+            return self.char_delays[char_index]
         delay = random.gauss(self.avg_char_delay, self.delay_variance)
         return max(0.01, delay)  # 最小延迟 10ms
     
+    def get_char_delays(self) -> list[float]:
+        """获取所有字符的延迟"""
+        if self.char_delays is not None and len(self.char_delays) >= len(self.text):
+            return self.char_delays[:len(self.text)]
+        return [self.get_char_delay(i) for i in range(len(self.text))]
+    
     def get_duration(self) -> float:
         """计算总持续时间"""
-        total = 0.0
-        for i in range(len(self.text)):
-            total += self.get_char_delay(i)
-        return total
+        return sum(self.get_char_delays())
     
     def __repr__(self) -> str:
         preview = self.text[:20] + "..." if len(self.text) > 20 else self.text
@@ -445,9 +547,62 @@ class CompositeAction(Action):
         return f"CompositeAction({len(self.actions)} actions)"
 
 
+@dataclass
+class RepeatAction(Action):
+    """
+    重复动作
+    按次数重复执行同一组子动作，不复制子动作对象
+    """
+    count: int
+    actions: list[Action]
+    
+    def __post_init__(self):
+        """检查重复次数（负数会产生负的时长，破坏回放时间线）"""
+        if isinstance(self.count, bool) or not isinstance(self.count, int) or self.count < 0:
+            raise ValueError(f"Repeat count must be a non-negative integer: {self.count!r}")
+    
+    def execute(self, buffer: TextBuffer) -> None:
+        for _ in range(self.count):
+            for action in self.actions:
+                action.execute(buffer)
+    
+    def get_duration(self) -> float:
+        return self.count * sum(action.get_duration() for action in self.actions)
+    
+    def iter_actions(self) -> Iterator[Action]:
+        """惰性展开：逐次产出每一轮的子动作"""
+        for _ in range(self.count):
+            for action in self.actions:
+                if isinstance(action, RepeatAction):
+                    yield from action.iter_actions()
+                else:
+                    yield action
+    
+    def __repr__(self) -> str:
+        return f"RepeatAction({self.count} x {len(self.actions)} actions)"
+
+
+def iter_expanded(actions: Iterable[Action]) -> Iterator[Action]:
+    """
+    惰性展开动作序列中的 RepeatAction
+    
+    Args:
+        actions: 动作序列
+    
+    Yields:
+        展开后的动作（其余动作原样产出）
+    """
+    for action in actions:
+        if isinstance(action, RepeatAction):
+            yield from action.iter_actions()
+        else:
+            yield action
+
+
 # ==================== 便捷工厂函数 ====================
 
-def type_text(text: str, wpm: int = 60, variance: float = 0.3) -> TypeTextAction:
+def type_text(text: str, wpm: int = 60, variance: float = 0.3,
+              timing_model: Optional['TimingModel'] = None) -> TypeTextAction:
     """
     创建打字动作的便捷函数
     
@@ -455,6 +610,7 @@ def type_text(text: str, wpm: int = 60, variance: float = 0.3) -> TypeTextAction
         text: 要打字的文本
         wpm: 每分钟单词数 (假设平均 5 字符/单词)
         variance: 延迟方差系数 (0.0-1.0)
+        timing_model: 时间模型（可选，替代独立的随机延迟）
     
     Returns:
         TypeTextAction
@@ -464,7 +620,7 @@ def type_text(text: str, wpm: int = 60, variance: float = 0.3) -> TypeTextAction
     avg_delay = 1.0 / chars_per_second
     delay_variance = avg_delay * variance
     
-    return TypeTextAction(text, avg_delay, delay_variance)
+    return TypeTextAction(text, avg_delay, delay_variance, timing_model=timing_model)
 
 
 def pause(seconds: float) -> PauseAction:
@@ -500,3 +656,8 @@ def delete_selection() -> DeleteSelectionAction:
 def set_style(style: TextStyle) -> SetStyleAction:
     """设置样式"""
     return SetStyleAction(style)
+
+
+def repeat(count: int, *actions: Action) -> RepeatAction:
+    """重复一组动作"""
+    return RepeatAction(count, list(actions))
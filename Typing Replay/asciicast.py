@@ -0,0 +1,219 @@
+"""
+asciinema 录像导出 (Asciicast Exporter)
+把回放的逐键时间线直接写成 asciinema v2 的 .cast 文件
+
+每条指令执行后只比较视口内发生变化的行，输出从第一个不同的单元格开始的
+ANSI 片段，而不是整屏重绘。事件边生成边写入，内存占用与回放长度无关。
+"""
+
+import json
+import sys
+import time
+from pathlib import Path
+from typing import IO, Iterable, Optional, Union
+
+from buffer import TextBuffer
+from actions import Action
+from compiler import iter_keystrokes
+from viewport import Viewport
+
+
+CAST_VERSION = 2
+
+# 选中的字符用反显表示
+REVERSE_ON = '\033[7m'
+REVERSE_OFF = '\033[27m'
+
+
+class CastScreen:
+    """
+    跟随光标滚动的虚拟终端屏幕
+    
+    记录上一次输出的各行单元格，update() 返回把屏幕更新到当前缓冲区状态
+    所需的最少 ANSI 输出。
+    """
+    
+    def __init__(self, width: int = 80, height: int = 24):
+        """
+        Args:
+            width: 终端列数
+            height: 终端行数
+        """
+        self.viewport = Viewport(width, height)
+        # 上一次显示的各行文本、各行的选区范围和已显示的单元格
+        self._lines: list[Optional[str]] = [None] * height
+        self._selections: list[tuple[int, int]] = [(0, 0)] * height
+        self._rows: list[list[tuple[str, bool]]] = [[] for _ in range(height)]
+        self._cursor: Optional[tuple[int, int]] = None
+    
+    def update(self, text: str, cursor: int, selection=None) -> str:
+        """
+        计算屏幕更新
+        
+        Args:
+            text: 当前文本
+            cursor: 光标位置
+            selection: 当前选区（None 或空选区表示无选区）
+        
+        Returns:
+            ANSI 输出；屏幕没有变化时为空串
+        """
+        viewport = self.viewport
+        redraw = viewport.update(text, cursor, selection)
+        lines, selections = viewport.lines, viewport.selections
+        
+        output = []
+        old_lines, old_selections = self._lines, self._selections
+        for row in range(viewport.height):
+            if redraw or lines[row] != old_lines[row] or selections[row] != old_selections[row]:
+                self._draw_row(output, row, viewport.cells(row), selections[row])
+        self._lines, self._selections = lines, selections
+        
+        cursor_at = (viewport.cursor_row, viewport.cursor_column)
+        if output or cursor_at != self._cursor:
+            self._cursor = cursor_at
+            output.append(f'\033[{cursor_at[0] + 1};{cursor_at[1] + 1}H')
+        return ''.join(output)
+    
+    def _draw_row(self, output: list[str], row: int, cells: list[tuple[str, bool]],
+                  selection: tuple[int, int]) -> None:
+        """输出一行从第一个不同单元格开始的部分"""
+        old = self._rows[row]
+        self._rows[row] = cells
+        
+        same = 0
+        limit = min(len(old), len(cells))
+        while same < limit and old[same] == cells[same]:
+            same += 1
+        # 不从宽字符的后半格开始输出
+        if same < len(cells) and cells[same][0] == '':
+            same -= 1
+        if same == len(cells) == len(old):
+            return
+        
+        parts = [f'\033[{row + 1};{same + 1}H']
+        if selection[0] == selection[1]:
+            parts.extend([char for char, _ in cells[same:]])
+        else:
+            reversed_on = False
+            for char, selected in cells[same:]:
+                if selected != reversed_on:
+                    parts.append(REVERSE_ON if selected else REVERSE_OFF)
+                    reversed_on = selected
+                parts.append(char)
+            if reversed_on:
+                parts.append(REVERSE_OFF)
+        if len(cells) < len(old):
+            parts.append('\033[K')
+        output.append(''.join(parts))
+
+
+class CastWriter:
+    """
+    asciinema v2 录像写入器
+    
+    每个输出事件写为一行 JSON：[时间, "o", 数据]。
+    """
+    
+    def __init__(self, stream: IO[str], width: int = 80, height: int = 24,
+                 title: Optional[str] = None, idle_time_limit: Optional[float] = None):
+        """
+        Args:
+            stream: 文本输出流
+            width: 终端列数
+            height: 终端行数
+            title: 录像标题
+            idle_time_limit: 播放时压缩超过该时长（秒）的空闲
+        """
+        self.stream = stream
+        self.events = 0
+        header = {
+            'version': CAST_VERSION,
+            'width': width,
+            'height': height,
+            'timestamp': int(time.time()),
+            'env': {'TERM': 'xterm-256color'},
+        }
+        if title is not None:
+            header['title'] = title
+        if idle_time_limit is not None:
+            header['idle_time_limit'] = idle_time_limit
+        stream.write(json.dumps(header))
+        stream.write('\n')
+    
+    def output(self, timestamp: float, data: str) -> None:
+        """写入一个输出事件"""
+        self.stream.write(json.dumps([round(timestamp, 6), 'o', data], ensure_ascii=False))
+        self.stream.write('\n')
+        self.events += 1
+
+
+def write_cast(actions: Iterable[Action], stream: IO[str], width: int = 80,
+               height: int = 24, speed: float = 1.0, title: Optional[str] = None,
+               idle_time_limit: Optional[float] = None,
+               buffer: Optional[TextBuffer] = None) -> int:
+    """
+    把动作序列的回放写为 asciinema v2 录像
+    
+    Args:
+        actions: 动作序列（可以是 ScriptParser.iter_parse 等迭代器）
+        stream: 文本输出流
+        width: 终端列数
+        height: 终端行数
+        speed: 播放速度倍率
+        title: 录像标题
+        idle_time_limit: 播放时压缩超过该时长（秒）的空闲
+        buffer: 回放使用的缓冲区（默认新建）
+    
+    Returns:
+        写入的事件数
+    """
+    if speed <= 0:
+        raise ValueError("Speed must be positive")
+    if buffer is None:
+        buffer = TextBuffer()
+    
+    writer = CastWriter(stream, width, height, title, idle_time_limit)
+    screen = CastScreen(width, height)
+    # 清屏后画出初始状态
+    writer.output(0.0, '\033[2J\033[H' + screen.update(buffer.text, buffer.cursor,
+                                                        buffer.selection))
+    
+    for timestamp, _ in iter_keystrokes(actions, buffer):
+        data = screen.update(buffer.text, buffer.cursor, buffer.selection)
+        if data:
+            writer.output(timestamp / speed, data)
+    return writer.events
+
+
+def export_cast(actions: Iterable[Action], output: Union[str, Path], **options) -> int:
+    """
+    把动作序列的回放导出为 .cast 文件
+    
+    Args:
+        actions: 动作序列
+        output: 输出文件路径
+        **options: 传给 write_cast 的参数
+    
+    Returns:
+        写入的事件数
+    """
+    with open(output, 'w', encoding='utf-8') as f:
+        return write_cast(actions, f, **options)
+
+
+def main(argv: list[str]) -> int:
+    """asciicast.py SCRIPT OUTPUT.cast [SPEED]：把脚本导出为 asciinema 录像"""
+    if len(argv) < 2:
+        print("usage: asciicast.py SCRIPT OUTPUT.cast [SPEED]")
+        return 2
+    from script_parser import ScriptParser
+    
+    speed = float(argv[2]) if len(argv) > 2 else 1.0
+    count = export_cast(ScriptParser.iter_file(argv[0]), argv[1], speed=speed)
+    print(f"Wrote {count} events to {argv[1]}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
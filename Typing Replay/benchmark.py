@@ -0,0 +1,120 @@
+"""
+性能基准
+测量引擎关键路径的吞吐量
+"""
+
+import time
+
+from buffer import TextBuffer
+from actions import TypeTextAction, BackspaceAction, MoveCursorAction, PauseAction
+from compiler import compile_actions
+from script_parser import ScriptParser
+
+
+def _timed(func, *args):
+    """执行函数并返回 (结果, 耗时秒数)"""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def bench_interpreter(keystrokes: int = 1_000_000) -> dict:
+    """
+    测量操作码解释器的原始按键吞吐量
+    
+    Args:
+        keystrokes: 大致的指令数量
+    
+    Returns:
+        包含编译耗时、执行耗时和每秒百万操作数的字典
+    """
+    block = [
+        TypeTextAction("hello world ", avg_char_delay=0.05, delay_variance=0.0),
+        MoveCursorAction(offset=-6),
+        MoveCursorAction(offset=6),
+        BackspaceAction(count=12),
+        PauseAction(0.2),
+    ]
+    # 每个块打字后全部删除，文档保持很短，测到的是解释器本身的开销
+    per_block = len(block[0].text) + 2 + block[3].count + 1
+    actions = block * max(1, keystrokes // per_block)
+    
+    program, compile_time = _timed(compile_actions, actions)
+    _, run_time = _timed(program.run, TextBuffer())
+    
+    return {
+        'instructions': len(program),
+        'compile_seconds': compile_time,
+        'run_seconds': run_time,
+        'mops_per_second': len(program) / run_time / 1e6 if run_time else 0.0,
+    }
+
+
+def _legacy_parse_actions(actions_data: list) -> list:
+    """旧的分派方式：每个动作都 lower() 后查方法名再 getattr"""
+    result = []
+    for action_data in actions_data:
+        action_type = action_data['type'].lower()
+        if action_type not in ScriptParser.ACTION_TYPES:
+            raise ValueError(f"Unknown action type: {action_type}")
+        result.append(getattr(ScriptParser, ScriptParser.ACTION_TYPES[action_type])(action_data))
+    return result
+
+
+def bench_parse(actions: int = 1_000_000) -> dict:
+    """
+    测量脚本解析吞吐量
+    
+    同时给出旧的 getattr 分派作为对照。耗时主要在动作的构造上，
+    两种分派方式的差别在测量波动范围内，注册表的意义在于可扩展而不是速度。
+    
+    Args:
+        actions: 动作数量
+    
+    Returns:
+        包含两种分派方式耗时、每秒动作数和耗时之比的字典
+    """
+    block = [
+        {'type': 'type', 'text': 'hello', 'wpm': 60},
+        {'type': 'pause', 'duration': 0.2},
+        {'type': 'backspace', 'count': 2},
+        {'type': 'cursor', 'offset': -1},
+    ]
+    data = block * max(1, actions // len(block))
+    
+    _, legacy_time = _timed(_legacy_parse_actions, data)
+    _, registry_time = _timed(ScriptParser.parse_actions, data)
+    
+    return {
+        'actions': len(data),
+        'legacy_seconds': legacy_time,
+        'registry_seconds': registry_time,
+        'actions_per_second': len(data) / registry_time if registry_time else 0.0,
+        'ratio': legacy_time / registry_time if registry_time else 0.0,
+    }
+
+
+def run_all_benchmarks() -> None:
+    """运行所有基准并打印结果"""
+    print("=" * 60)
+    print("Interpreter throughput")
+    print("=" * 60)
+    result = bench_interpreter()
+    print(f"Instructions: {result['instructions']:,}")
+    print(f"Compile: {result['compile_seconds']:.3f}s")
+    print(f"Run: {result['run_seconds']:.3f}s "
+          f"({result['mops_per_second']:.2f} Mops/s)")
+    
+    print("=" * 60)
+    print("Parse throughput")
+    print("=" * 60)
+    result = bench_parse()
+    print(f"Actions: {result['actions']:,}")
+    print(f"Registry dispatch: {result['registry_seconds']:.3f}s "
+          f"({result['actions_per_second']:,.0f} actions/s)")
+    print(f"getattr dispatch (reference): {result['legacy_seconds']:.3f}s "
+          f"(legacy / registry = {result['ratio']:.2f})")
+
+
+if __name__ == '__main__':
+    run_all_benchmarks()
@@ -0,0 +1,532 @@
+"""
+二进制脚本格式
+紧凑的版本化动作编码，通过 mmap 按需解码
+
+文件布局（小端序）：
+    header         魔数、版本、动作数与各段偏移
+    action data    顶层动作记录：类型码 + varint 操作数 + float64 时长参数
+    action index   uint64[动作数]，每个顶层动作记录的起始偏移
+    timing         float64[动作数 + 1]，写入时采样的各动作起始时间（最后一项为总时长）
+    string offsets uint64[字符串数 + 1]，字符串表中各字符串的起止偏移
+    string table   UTF-8 字节，按上述偏移切分，相同字符串只存一份
+"""
+
+import mmap
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Union
+
+from buffer import TextStyle
+from actions import (
+    Action, TypeTextAction, InsertTextAction, BackspaceAction, DeleteAction,
+    ReplaceTextAction, MoveCursorAction, SetSelectionAction, SelectRangeAction,
+    ClearSelectionAction, DeleteSelectionAction, SetStyleAction, PauseAction,
+    CompositeAction, RepeatAction
+)
+
+
+MAGIC = b'TRPB'
+FORMAT_VERSION = 2
+BINARY_SUFFIX = '.trb'
+
+# magic, version, flags, action_count, string_count,
+# data_offset, index_offset, timing_offset, string_offsets_offset, strings_offset
+_HEADER = struct.Struct('<4sHHQQQQQQQ')
+_F64 = struct.Struct('<d')
+
+# 文件为小端序；本机字节序相同时数组段可直接映射，否则需要复制并交换字节序
+_NATIVE_LITTLE_ENDIAN = sys.byteorder == 'little'
+
+# 记录类型码
+TAG_TYPE = 1
+TAG_INSERT = 2
+TAG_BACKSPACE = 3
+TAG_DELETE = 4
+TAG_REPLACE = 5
+TAG_MOVE = 6
+TAG_SELECT = 7
+TAG_SELECT_RANGE = 8
+TAG_CLEAR_SELECTION = 9
+TAG_DELETE_SELECTION = 10
+TAG_STYLE = 11
+TAG_PAUSE = 12
+TAG_COMPOSITE = 13
+TAG_REPEAT = 14
+TAG_TYPE_TIMED = 15  # 带逐字符延迟表的打字（版本 2）
+
+# MOVE 记录标志位
+_MOVE_HAS_POSITION = 1
+_MOVE_HAS_OFFSET = 2
+_MOVE_CLEAR = 4
+
+_STYLES = list(TextStyle)
+_STYLE_INDEX = {style: index for index, style in enumerate(_STYLES)}
+
+
+# ==================== varint ====================
+
+def _write_varint(out: bytearray, value: int) -> None:
+    """写入无符号 LEB128 varint"""
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _write_svarint(out: bytearray, value: int) -> None:
+    """写入有符号 varint（zigzag 编码）"""
+    _write_varint(out, value << 1 if value >= 0 else (-value << 1) - 1)
+
+
+def _read_varint(data, pos: int) -> tuple[int, int]:
+    """读取无符号 varint，返回 (值, 新位置)"""
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _read_svarint(data, pos: int) -> tuple[int, int]:
+    """读取 zigzag 编码的有符号 varint"""
+    value, pos = _read_varint(data, pos)
+    return (value >> 1) ^ -(value & 1), pos
+
+
+# ==================== 编码 ====================
+
+def _little_endian_array(data: memoryview, typecode: str):
+    """
+    把小端序的数组段解释为 typecode 类型的序列
+    
+    小端序主机上直接返回零拷贝的 memoryview；大端序主机上复制为 array 并交换字节序。
+    """
+    if _NATIVE_LITTLE_ENDIAN:
+        return data.cast(typecode)
+    values = array(typecode, data.tobytes())
+    values.byteswap()
+    data.release()
+    return values
+
+
+class BinaryScriptWriter:
+    """二进制脚本编码器"""
+    
+    def __init__(self):
+        self._data = bytearray()
+        self._index: list[int] = []
+        self._times: list[float] = [0.0]
+        self._strings: list[bytes] = []
+        self._string_index: dict[str, int] = {}
+    
+    def add(self, action: Action) -> None:
+        """追加一个顶层动作"""
+        self._index.append(len(self._data))
+        self._encode(action, self._data)
+        self._times.append(self._times[-1] + action.get_duration())
+    
+    def add_all(self, actions: Iterable[Action]) -> 'BinaryScriptWriter':
+        """追加多个顶层动作"""
+        for action in actions:
+            self.add(action)
+        return self
+    
+    def to_bytes(self) -> bytes:
+        """生成完整的二进制脚本"""
+        string_offsets = [0]
+        for encoded in self._strings:
+            string_offsets.append(string_offsets[-1] + len(encoded))
+        
+        data_offset = _HEADER.size
+        index_offset = _align(data_offset + len(self._data))
+        timing_offset = index_offset + 8 * len(self._index)
+        string_offsets_offset = timing_offset + 8 * len(self._times)
+        strings_offset = string_offsets_offset + 8 * len(string_offsets)
+        
+        out = bytearray(_HEADER.pack(
+            MAGIC, FORMAT_VERSION, 0, len(self._index), len(self._strings),
+            data_offset, index_offset, timing_offset, string_offsets_offset, strings_offset
+        ))
+        out += self._data
+        out += b'\0' * (index_offset - len(out))
+        out += struct.pack(f'<{len(self._index)}Q', *self._index)
+        out += struct.pack(f'<{len(self._times)}d', *self._times)
+        out += struct.pack(f'<{len(string_offsets)}Q', *string_offsets)
+        out += b''.join(self._strings)
+        return bytes(out)
+    
+    def save(self, filepath: Union[str, Path]) -> None:
+        """写入文件"""
+        with open(filepath, 'wb') as f:
+            f.write(self.to_bytes())
+    
+    # ==================== 记录编码 ====================
+    
+    def _intern(self, text: str) -> int:
+        index = self._string_index.get(text)
+        if index is None:
+            index = len(self._strings)
+            self._strings.append(text.encode('utf-8'))
+            self._string_index[text] = index
+        return index
+    
+    def _encode(self, action: Action, out: bytearray) -> None:
+        action_type = type(action)
+        
+        if action_type is TypeTextAction:
+            timed = action.char_delays is not None
+            out.append(TAG_TYPE_TIMED if timed else TAG_TYPE)
+            _write_varint(out, self._intern(action.text))
+            out += _F64.pack(action.avg_char_delay)
+            out += _F64.pack(action.delay_variance)
+            if timed:
+                _write_varint(out, len(action.char_delays))
+                out += struct.pack(f'<{len(action.char_delays)}d', *action.char_delays)
+        elif action_type is InsertTextAction:
+            out.append(TAG_INSERT)
+            _write_varint(out, self._intern(action.text))
+            out += _F64.pack(action.duration)
+        elif action_type is BackspaceAction or action_type is DeleteAction:
+            out.append(TAG_BACKSPACE if action_type is BackspaceAction else TAG_DELETE)
+            _write_varint(out, action.count)
+            out += _F64.pack(action.char_delay)
+        elif action_type is ReplaceTextAction:
+            out.append(TAG_REPLACE)
+            _write_svarint(out, action.start)
+            _write_svarint(out, action.end)
+            _write_varint(out, self._intern(action.new_text))
+            out += _F64.pack(action.duration)
+        elif action_type is MoveCursorAction:
+            out.append(TAG_MOVE)
+            flags = _MOVE_CLEAR if action.clear_selection else 0
+            if action.position is not None:
+                flags |= _MOVE_HAS_POSITION
+            if action.offset is not None:
+                flags |= _MOVE_HAS_OFFSET
+            out.append(flags)
+            if action.position is not None:
+                _write_svarint(out, action.position)
+            if action.offset is not None:
+                _write_svarint(out, action.offset)
+            out += _F64.pack(action.duration)
+        elif action_type is SetSelectionAction:
+            out.append(TAG_SELECT)
+            _write_svarint(out, action.start)
+            _write_svarint(out, action.end)
+            out += _F64.pack(action.duration)
+        elif action_type is SelectRangeAction:
+            out.append(TAG_SELECT_RANGE)
+            _write_svarint(out, action.start)
+            _write_svarint(out, action.length)
+            out += _F64.pack(action.duration)
+        elif action_type is ClearSelectionAction:
+            out.append(TAG_CLEAR_SELECTION)
+            out += _F64.pack(action.duration)
+        elif action_type is DeleteSelectionAction:
+            out.append(TAG_DELETE_SELECTION)
+            out += _F64.pack(action.duration)
+        elif action_type is SetStyleAction:
+            out.append(TAG_STYLE)
+            out.append(_STYLE_INDEX[action.style])
+            out += _F64.pack(action.duration)
+        elif action_type is PauseAction:
+            out.append(TAG_PAUSE)
+            out += _F64.pack(action.duration)
+        elif action_type is CompositeAction:
+            out.append(TAG_COMPOSITE)
+            _write_varint(out, len(action.actions))
+            for sub_action in action.actions:
+                self._encode(sub_action, out)
+        elif action_type is RepeatAction:
+            out.append(TAG_REPEAT)
+            _write_varint(out, action.count)
+            _write_varint(out, len(action.actions))
+            for sub_action in action.actions:
+                self._encode(sub_action, out)
+        else:
+            raise ValueError(f"Action cannot be encoded in binary format: {action!r}")
+
+
+def _align(offset: int, alignment: int = 8) -> int:
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def encode_actions(actions: Iterable[Action]) -> bytes:
+    """把动作序列编码为二进制脚本"""
+    return BinaryScriptWriter().add_all(actions).to_bytes()
+
+
+def write_binary(actions: Iterable[Action], filepath: Union[str, Path]) -> None:
+    """把动作序列写为二进制脚本文件"""
+    BinaryScriptWriter().add_all(actions).save(filepath)
+
+
+def is_binary_script(filepath: Union[str, Path]) -> bool:
+    """检查文件是否为二进制脚本（按魔数判断）"""
+    try:
+        with open(filepath, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+# ==================== 解码 ====================
+
+class BinaryScript:
+    """
+    只读的二进制脚本
+    
+    以序列方式访问顶层动作，动作在访问时才解码；
+    索引、时间和字符串偏移数组直接是底层缓冲区上的 memoryview。
+    可用作上下文管理器以及时释放 mmap。
+    """
+    
+    def __init__(self, source: Union[str, Path, bytes, bytearray, memoryview]):
+        """
+        Args:
+            source: 文件路径（通过 mmap 打开）或已在内存中的二进制脚本
+        """
+        self._file = None
+        self._mmap: Optional[mmap.mmap] = None
+        
+        if isinstance(source, (str, Path)):
+            self._file = open(source, 'rb')
+            try:
+                self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                self._file.close()
+                raise ValueError(f"Empty binary script: {source}")
+            self._data = memoryview(self._mmap)
+        else:
+            self._data = memoryview(source)
+        
+        if len(self._data) < _HEADER.size:
+            self.close()
+            raise ValueError("Truncated binary script header")
+        
+        (magic, version, _flags, self._count, self._string_count,
+         self._data_offset, index_offset, timing_offset,
+         string_offsets_offset, self._strings_offset) = _HEADER.unpack_from(self._data)
+        
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("Not a binary typing script (bad magic)")
+        if version > FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"Unsupported binary script version: {version}")
+        
+        # 各段首尾相接、长度与动作数和字符串数一致，且都在缓冲区之内
+        size = len(self._data)
+        if not (_HEADER.size <= self._data_offset <= index_offset
+                and timing_offset == index_offset + 8 * self._count
+                and string_offsets_offset == timing_offset + 8 * (self._count + 1)
+                and self._strings_offset == string_offsets_offset + 8 * (self._string_count + 1)
+                and self._strings_offset <= size):
+            self.close()
+            raise ValueError("Truncated or corrupt binary script (bad section offsets)")
+        
+        self._index = _little_endian_array(self._data[index_offset:timing_offset], 'Q')
+        self.times = _little_endian_array(self._data[timing_offset:string_offsets_offset], 'd')
+        self._string_offsets = _little_endian_array(
+            self._data[string_offsets_offset:self._strings_offset], 'Q')
+        
+        if (self._string_offsets[self._string_count] > size - self._strings_offset
+                or (self._count and self._index[self._count - 1] >= index_offset - self._data_offset)):
+            self.close()
+            raise ValueError("Truncated or corrupt binary script (tables out of range)")
+    
+    # ==================== 序列接口 ====================
+    
+    def __len__(self) -> int:
+        return self._count
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("binary script index out of range")
+        action, _ = self._decode(self._data_offset + self._index[index])
+        return action
+    
+    def __iter__(self) -> Iterator[Action]:
+        pos = self._data_offset + (self._index[0] if self._count else 0)
+        for _ in range(self._count):
+            action, pos = self._decode(pos)
+            yield action
+    
+    @property
+    def total_duration(self) -> float:
+        """写入时采样的总时长"""
+        return self.times[self._count]
+    
+    # ==================== 资源管理 ====================
+    
+    def close(self) -> None:
+        """释放 mmap 和文件句柄"""
+        for view in ('_index', 'times', '_string_offsets', '_data'):
+            if isinstance(getattr(self, view, None), memoryview):
+                getattr(self, view).release()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+    
+    def __enter__(self) -> 'BinaryScript':
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+    
+    def __repr__(self) -> str:
+        return f"BinaryScript({self._count} actions, {self._string_count} strings)"
+    
+    # ==================== 记录解码 ====================
+    
+    def _string(self, index: int) -> str:
+        start = self._strings_offset + self._string_offsets[index]
+        end = self._strings_offset + self._string_offsets[index + 1]
+        return str(self._data[start:end], 'utf-8')
+    
+    def _f64(self, pos: int) -> tuple[float, int]:
+        return _F64.unpack_from(self._data, pos)[0], pos + 8
+    
+    def _decode(self, pos: int) -> tuple[Action, int]:
+        data = self._data
+        tag = data[pos]
+        pos += 1
+        
+        if tag == TAG_TYPE or tag == TAG_TYPE_TIMED:
+            string, pos = _read_varint(data, pos)
+            avg_delay, pos = self._f64(pos)
+            variance, pos = self._f64(pos)
+            char_delays = None
+            if tag == TAG_TYPE_TIMED:
+                count, pos = _read_varint(data, pos)
+                char_delays = list(struct.unpack_from(f'<{count}d', data, pos))
+                pos += 8 * count
+            # 编码时文本已展开过 emoji，这里不再重复展开
+            return TypeTextAction(self._string(string), avg_delay, variance,
+                                  expand_emoji=False, char_delays=char_delays), pos
+        if tag == TAG_INSERT:
+            string, pos = _read_varint(data, pos)
+            duration, pos = self._f64(pos)
+            return InsertTextAction(self._string(string), duration), pos
+        if tag == TAG_BACKSPACE or tag == TAG_DELETE:
+            count, pos = _read_varint(data, pos)
+            char_delay, pos = self._f64(pos)
+            cls = BackspaceAction if tag == TAG_BACKSPACE else DeleteAction
+            return cls(count, char_delay), pos
+        if tag == TAG_REPLACE:
+            start, pos = _read_svarint(data, pos)
+            end, pos = _read_svarint(data, pos)
+            string, pos = _read_varint(data, pos)
+            duration, pos = self._f64(pos)
+            return ReplaceTextAction(start, end, self._string(string), duration), pos
+        if tag == TAG_MOVE:
+            flags = data[pos]
+            pos += 1
+            position = offset = None
+            if flags & _MOVE_HAS_POSITION:
+                position, pos = _read_svarint(data, pos)
+            if flags & _MOVE_HAS_OFFSET:
+                offset, pos = _read_svarint(data, pos)
+            duration, pos = self._f64(pos)
+            return MoveCursorAction(position, offset, bool(flags & _MOVE_CLEAR), duration), pos
+        if tag == TAG_SELECT or tag == TAG_SELECT_RANGE:
+            start, pos = _read_svarint(data, pos)
+            end, pos = _read_svarint(data, pos)
+            duration, pos = self._f64(pos)
+            cls = SetSelectionAction if tag == TAG_SELECT else SelectRangeAction
+            return cls(start, end, duration), pos
+        if tag == TAG_CLEAR_SELECTION:
+            duration, pos = self._f64(pos)
+            return ClearSelectionAction(duration), pos
+        if tag == TAG_DELETE_SELECTION:
+            duration, pos = self._f64(pos)
+            return DeleteSelectionAction(duration), pos
+        if tag == TAG_STYLE:
+            style = _STYLES[data[pos]]
+            duration, pos = self._f64(pos + 1)
+            return SetStyleAction(style, duration), pos
+        if tag == TAG_PAUSE:
+            duration, pos = self._f64(pos)
+            return PauseAction(duration), pos
+        if tag == TAG_COMPOSITE:
+            count, pos = _read_varint(data, pos)
+            sub_actions = []
+            for _ in range(count):
+                sub_action, pos = self._decode(pos)
+                sub_actions.append(sub_action)
+            return CompositeAction(sub_actions), pos
+        if tag == TAG_REPEAT:
+            repeat_count, pos = _read_varint(data, pos)
+            count, pos = _read_varint(data, pos)
+            sub_actions = []
+            for _ in range(count):
+                sub_action, pos = self._decode(pos)
+                sub_actions.append(sub_action)
+            return RepeatAction(repeat_count, sub_actions), pos
+        
+        raise ValueError(f"Unknown binary action tag {tag} at offset {pos - 1}")
+
+
+class SegmentedScript:
+    """
+    由多个二进制脚本段顺序拼接而成的只读脚本
+    
+    并行解析时每个工作进程产出一段，按原顺序拼接；
+    接口与 BinaryScript 一致（序列访问、按需解码、上下文管理器）。
+    """
+    
+    def __init__(self, segments: Iterable[BinaryScript]):
+        self.segments = list(segments)
+        # 各段首个动作的全局下标
+        self._starts = list(accumulate((len(segment) for segment in self.segments), initial=0))
+    
+    def __len__(self) -> int:
+        return self._starts[-1]
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("segmented script index out of range")
+        segment = bisect_right(self._starts, index) - 1
+        return self.segments[segment][index - self._starts[segment]]
+    
+    def __iter__(self) -> Iterator[Action]:
+        for segment in self.segments:
+            yield from segment
+    
+    @property
+    def total_duration(self) -> float:
+        """写入时采样的总时长"""
+        return sum(segment.total_duration for segment in self.segments)
+    
+    def close(self) -> None:
+        """释放所有段"""
+        for segment in self.segments:
+            segment.close()
+    
+    def __enter__(self) -> 'SegmentedScript':
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+    
+    def __repr__(self) -> str:
+        return f"SegmentedScript({len(self)} actions, {len(self.segments)} segments)"
@@ -4,8 +4,13 @@
 """
 
 from dataclasses import dataclass, field
-from typing import Optional, Tuple
+from typing import Callable, Optional, Tuple
 from enum import Enum
+import itertools
+
+
+# 文本版本号全局递增，不同缓冲区的修改也不会得到相同的版本号
+_versions = itertools.count(1)
 
 
 class TextStyle(Enum):
@@ -58,6 +63,59 @@ class EditorState:
                 f"style={self.current_style.value})")
 
 
+class EditorStateView:
+    """
+    编辑器状态的轻量只读视图
+    
+    属性与 EditorState 相同，可以代替它传给回调。构造时只保存各字段的引用
+    （文本是不可变字符串，引用即快照），不创建数据类；只读取光标或时间戳的
+    回调几乎没有额外开销。需要真正的 EditorState 时调用 materialize()。
+    """
+    
+    __slots__ = ('_text', 'cursor_pos', 'selection', 'current_style', 'timestamp', '_state')
+    
+    def __init__(self, text: str, cursor_pos: int, selection: Optional[Selection],
+                 current_style: TextStyle, timestamp: float):
+        self._text = text
+        self.cursor_pos = cursor_pos
+        self.selection = selection
+        self.current_style = current_style
+        self.timestamp = timestamp
+        self._state: Optional[EditorState] = None
+    
+    @property
+    def text(self) -> str:
+        """快照时的文本"""
+        return self._text
+    
+    def materialize(self) -> EditorState:
+        """转换为 EditorState（结果会被缓存）"""
+        if self._state is None:
+            self._state = EditorState(
+                text=self._text,
+                cursor_pos=self.cursor_pos,
+                selection=self.selection,
+                current_style=self.current_style,
+                timestamp=self.timestamp
+            )
+        return self._state
+    
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (EditorStateView, EditorState)):
+            return (self.cursor_pos == other.cursor_pos and self.timestamp == other.timestamp
+                    and self.selection == other.selection
+                    and self.current_style == other.current_style and self._text == other.text)
+        return NotImplemented
+    
+    __hash__ = None
+    
+    def __repr__(self) -> str:
+        sel_repr = f", selection={self.selection}" if self.selection else ""
+        return (f"EditorStateView(text_len={len(self._text)}, "
+                f"cursor={self.cursor_pos}{sel_repr}, "
+                f"style={self.current_style.value})")
+
+
 class TextBuffer:
     """
     文本缓冲区管理器
@@ -70,6 +128,8 @@ class TextBuffer:
         self._selection: Optional[Selection] = None
         self._current_style: TextStyle = TextStyle.NORMAL
         self._style_ranges: list[Tuple[int, int, TextStyle]] = []
+        self._edit_listeners: list[Callable[[int, int, str], None]] = []
+        self._version: int = 0
     
     # ==================== 基础属性 ====================
     
@@ -98,6 +158,11 @@ class TextBuffer:
         """获取文本长度"""
         return len(self._text)
     
+    @property
+    def version(self) -> int:
+        """文本版本号：每次修改文本时更新，版本号相同则文本相同"""
+        return self._version
+    
     # ==================== 光标操作 ====================
     
     def move_cursor(self, position: int, clear_selection: bool = True) -> None:
@@ -176,6 +241,9 @@ class TextBuffer:
         insert_pos = self._cursor if at_cursor else 0
         
         # 插入文本
+        if self._edit_listeners:
+            self._notify_edit(insert_pos, insert_pos, text)
+        self._version = next(_versions)
         self._text = (self._text[:insert_pos] + 
                      text + 
                      self._text[insert_pos:])
@@ -212,6 +280,9 @@ class TextBuffer:
             delete_pos = self._cursor - 1
         
         # 删除字符
+        if self._edit_listeners:
+            self._notify_edit(delete_pos, delete_pos + 1, '')
+        self._version = next(_versions)
         self._text = self._text[:delete_pos] + self._text[delete_pos + 1:]
         
         # 更新光标
@@ -231,6 +302,9 @@ class TextBuffer:
             return False
         
         # 删除选区文本
+        if self._edit_listeners:
+            self._notify_edit(self._selection.start, self._selection.end, '')
+        self._version = next(_versions)
         self._text = (self._text[:self._selection.start] + 
                      self._text[self._selection.end:])
         
@@ -254,10 +328,32 @@ class TextBuffer:
         start = max(0, min(start, self.length))
         end = max(start, min(end, self.length))
         
+        if self._edit_listeners:
+            self._notify_edit(start, end, new_text)
+        self._version = next(_versions)
         self._text = self._text[:start] + new_text + self._text[end:]
         self._cursor = start + len(new_text)
         self._selection = None
     
+    # ==================== 编辑监听 ====================
+    
+    def add_edit_listener(self, listener: Callable[[int, int, str], None]) -> None:
+        """
+        注册编辑监听器
+        
+        每次文本修改之前调用 listener(start, end, text)：把旧文本的 [start, end)
+        替换为 text。调用时 self.text 仍是修改前的文本。
+        """
+        self._edit_listeners.append(listener)
+    
+    def remove_edit_listener(self, listener: Callable[[int, int, str], None]) -> None:
+        """移除编辑监听器"""
+        self._edit_listeners.remove(listener)
+    
+    def _notify_edit(self, start: int, end: int, text: str) -> None:
+        for listener in self._edit_listeners:
+            listener(start, end, text)
+    
     # ==================== 样式操作 ====================
     
     def set_style(self, style: TextStyle) -> None:
@@ -276,7 +372,7 @@ class TextBuffer:
         
         Args:
             timestamp: 时间戳
-            
+        
         Returns:
             EditorState 对象
         """
@@ -288,6 +384,45 @@ class TextBuffer:
             timestamp=timestamp
         )
     
+    def get_state_view(self, timestamp: float = 0.0) -> EditorStateView:
+        """
+        获取当前状态的轻量视图（用于回调和回放事件）
+        
+        Args:
+            timestamp: 时间戳
+        
+        Returns:
+            EditorStateView 对象
+        """
+        return EditorStateView(self._text, self._cursor, self._selection,
+                               self._current_style, timestamp)
+    
+    def fingerprint(self) -> tuple:
+        """
+        状态指纹：文本版本号、光标、选区和样式
+        
+        不读取文本内容，开销与文档长度无关。指纹相同则 get_state() 的内容相同
+        （时间戳除外），可用于跳过重复帧。
+        """
+        selection = self._selection
+        return (self._version, self._cursor,
+                None if selection is None else (selection.start, selection.end),
+                self._current_style)
+    
+    def copy(self) -> 'TextBuffer':
+        """
+        复制缓冲区（用于在分支点保存状态）
+        
+        Returns:
+            状态完全相同、互不影响的新缓冲区
+        """
+        clone = TextBuffer.__new__(TextBuffer)
+        clone.__dict__.update(self.__dict__)
+        clone._style_ranges = self._style_ranges.copy()
+        # 监听器属于原缓冲区；版本号保留，副本此后的修改会得到新的版本号
+        clone._edit_listeners = []
+        return clone
+    
     def get_visible_text(self, before: int = 20, after: int = 20) -> str:
         """
         获取光标周围的可见文本（用于调试）
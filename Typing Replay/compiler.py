@@ -0,0 +1,359 @@
+"""
+动作编译器 (Compiler)
+把动作列表降级为扁平的操作码程序，由同一个解释器循环执行
+"""
+
+from array import array
+from enum import IntEnum
+from itertools import accumulate, repeat
+from typing import Callable, Iterable, Iterator, Optional
+
+from buffer import TextBuffer, TextStyle
+from actions import (
+    Action, TypeTextAction, InsertTextAction, BackspaceAction, DeleteAction,
+    ReplaceTextAction, MoveCursorAction, SetSelectionAction, SelectRangeAction,
+    ClearSelectionAction, DeleteSelectionAction, SetStyleAction, PauseAction,
+    CompositeAction, RepeatAction
+)
+
+
+class Op(IntEnum):
+    """操作码"""
+    INSERT = 0            # a: 字符串表索引
+    DELETE_BACK = 1       # 退格一个字符
+    DELETE_FWD = 2        # Delete 一个字符
+    MOVE = 3              # a: 位置或偏移, b: 标志位 (MOVE_RELATIVE | MOVE_CLEAR)
+    SELECT = 4            # a: start, b: end
+    STYLE = 5             # a: 样式表索引
+    WAIT = 6              # 仅消耗时间
+    CLEAR_SELECTION = 7
+    DELETE_SELECTION = 8
+    REPLACE = 9           # a: start, b: end, c: 字符串表索引
+    CALL = 10             # a: 对象表索引，执行对象的 execute(buffer)
+
+
+# MOVE 标志位
+MOVE_RELATIVE = 1
+MOVE_CLEAR = 2
+
+# 样式表（STYLE 的操作数即此表中的索引）
+STYLES = list(TextStyle)
+_STYLE_INDEX = {style: index for index, style in enumerate(STYLES)}
+
+
+class Program:
+    """
+    扁平操作码程序
+    
+    每条指令由并行数组中的同一下标描述：
+        ops[i]    操作码
+        arg_a/b/c 操作数
+        times[i]  指令完成时的时间戳（秒，相对开始）
+        source[i] 指令来源的顶层动作下标
+    
+    ends[k] 为第 k 个顶层动作之后的指令下标（由 ActionCompiler.compile 记录），
+    没有产生指令的动作与前一个动作的结束下标相同。
+    """
+    
+    __slots__ = ('ops', 'arg_a', 'arg_b', 'arg_c', 'times', 'source', 'ends',
+                 'strings', 'objects', '_string_index')
+    
+    def __init__(self):
+        self.ops = array('B')
+        self.arg_a = array('q')
+        self.arg_b = array('q')
+        self.arg_c = array('q')
+        self.times = array('d')
+        self.source = array('q')
+        self.ends = array('q')
+        self.strings: list[str] = []
+        self.objects: list[Action] = []
+        self._string_index: dict[str, int] = {}
+    
+    # ==================== 构建 ====================
+    
+    def intern(self, text: str) -> int:
+        """把字符串放入字符串表，返回索引（相同字符串只存一份）"""
+        index = self._string_index.get(text)
+        if index is None:
+            index = len(self.strings)
+            self.strings.append(text)
+            self._string_index[text] = index
+        return index
+    
+    def emit(self, op: Op, delay: float, source: int,
+             a: int = 0, b: int = 0, c: int = 0) -> None:
+        """追加一条指令"""
+        times = self.times
+        times.append((times[-1] if times else 0.0) + delay)
+        self.ops.append(op)
+        self.arg_a.append(a)
+        self.arg_b.append(b)
+        self.arg_c.append(c)
+        self.source.append(source)
+    
+    def emit_run(self, op: Op, delays: list[float], source: int,
+                 arg_a: Optional[list[int]] = None) -> None:
+        """批量追加一串同类指令（如逐字符插入、连续退格）"""
+        count = len(delays)
+        if count == 1:
+            self.emit(op, delays[0], source, arg_a[0] if arg_a is not None else 0)
+            return
+        self.ops.extend(bytes([op]) * count)
+        self.arg_a.extend(arg_a if arg_a is not None else repeat(0, count))
+        self.arg_b.extend(repeat(0, count))
+        self.arg_c.extend(repeat(0, count))
+        times = accumulate(delays, initial=self.total_duration)
+        next(times)  # 跳过起始时间本身
+        self.times.extend(times)
+        self.source.extend(repeat(source, count))
+    
+    # ==================== 查询 ====================
+    
+    @property
+    def total_duration(self) -> float:
+        """程序总时长"""
+        return self.times[-1] if self.times else 0.0
+    
+    def __len__(self) -> int:
+        return len(self.ops)
+    
+    def index_at_time(self, timestamp: float, start: int = 0) -> int:
+        """返回第一条完成时间晚于 timestamp 的指令下标"""
+        times = self.times
+        lo, hi = start, len(times)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if times[mid] <= timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+    
+    # ==================== 解释执行 ====================
+    
+    def run(self, buffer: TextBuffer, start: int = 0, stop: Optional[int] = None) -> int:
+        """
+        执行 [start, stop) 范围内的指令
+        
+        Args:
+            buffer: 文本缓冲区
+            start: 起始指令下标
+            stop: 结束指令下标（不含），None 表示执行到末尾
+        
+        Returns:
+            下一条待执行指令的下标
+        """
+        if stop is None:
+            stop = len(self.ops)
+        return self.runner(buffer)(start, stop)
+    
+    def runner(self, buffer: TextBuffer) -> Callable[[int, int], int]:
+        """
+        返回绑定到 buffer 的解释器 run(start, stop)
+        
+        操作数数组和缓冲区方法在闭包中只查找一次，适合逐个动作多次调用的场景。
+        """
+        ops, arg_a, arg_b, arg_c = self.ops, self.arg_a, self.arg_b, self.arg_c
+        strings, objects = self.strings, self.objects
+        insert_text = buffer.insert_text
+        delete_char = buffer.delete_char
+        
+        def run(start: int, stop: int) -> int:
+            for pc in range(start, stop):
+                op = ops[pc]
+                if op == 0:      # INSERT
+                    insert_text(strings[arg_a[pc]])
+                elif op == 1:    # DELETE_BACK
+                    delete_char(False)
+                elif op == 2:    # DELETE_FWD
+                    delete_char(True)
+                elif op == 3:    # MOVE
+                    flags = arg_b[pc]
+                    if flags & MOVE_RELATIVE:
+                        buffer.move_cursor_relative(arg_a[pc], bool(flags & MOVE_CLEAR))
+                    else:
+                        buffer.move_cursor(arg_a[pc], bool(flags & MOVE_CLEAR))
+                elif op == 4:    # SELECT
+                    buffer.set_selection(arg_a[pc], arg_b[pc])
+                elif op == 5:    # STYLE
+                    buffer.set_style(STYLES[arg_a[pc]])
+                elif op == 6:    # WAIT
+                    pass
+                elif op == 7:    # CLEAR_SELECTION
+                    buffer.clear_selection()
+                elif op == 8:    # DELETE_SELECTION
+                    buffer.delete_selection()
+                elif op == 9:    # REPLACE
+                    buffer.replace_text(arg_a[pc], arg_b[pc], strings[arg_c[pc]])
+                else:            # CALL
+                    objects[arg_a[pc]].execute(buffer)
+            return stop if stop > start else start
+        
+        return run
+    
+    def run_until(self, buffer: TextBuffer, timestamp: float, start: int = 0) -> int:
+        """执行所有在 timestamp 之前（含）完成的指令，返回下一条指令下标"""
+        return self.run(buffer, start, self.index_at_time(timestamp, start))
+    
+    def __repr__(self) -> str:
+        return (f"Program(ops={len(self.ops)}, strings={len(self.strings)}, "
+                f"duration={self.total_duration:.2f}s)")
+
+
+class ActionCompiler:
+    """
+    把动作降级为操作码的编译器
+    
+    按动作的确切类型查表分派；子类和未知动作可能重写了 execute，
+    统一降级为 CALL 指令以保持原有行为。
+    
+    per_key 为 False 时 TypeTextAction 降级为一条整段插入（与 execute 相同），
+    适合只在动作边界观察状态的回放；为 True 时逐字符插入，帧回放能看到打字过程。
+    """
+    
+    def __init__(self, per_key: bool = True):
+        self.per_key = per_key
+        self.program = Program()
+        self._lowerers = {
+            TypeTextAction: self._lower_type_text,
+            InsertTextAction: self._lower_insert_text,
+            BackspaceAction: self._lower_backspace,
+            DeleteAction: self._lower_delete,
+            ReplaceTextAction: self._lower_replace_text,
+            MoveCursorAction: self._lower_move_cursor,
+            SetSelectionAction: self._lower_set_selection,
+            SelectRangeAction: self._lower_select_range,
+            ClearSelectionAction: self._lower_clear_selection,
+            DeleteSelectionAction: self._lower_delete_selection,
+            SetStyleAction: self._lower_set_style,
+            PauseAction: self._lower_pause,
+            CompositeAction: self._lower_composite,
+            RepeatAction: self._lower_repeat,
+        }
+    
+    def compile(self, actions: Iterable[Action]) -> Program:
+        """编译动作序列"""
+        lowerers, lower_call = self._lowerers, self._lower_call
+        ops, ends = self.program.ops, self.program.ends
+        for index, action in enumerate(actions):
+            lowerers.get(type(action), lower_call)(action, index)
+            ends.append(len(ops))
+        return self.program
+    
+    def lower(self, action: Action, source: int) -> None:
+        """降级单个动作"""
+        lowerer = self._lowerers.get(type(action), self._lower_call)
+        lowerer(action, source)
+    
+    # ==================== 各动作的降级规则 ====================
+    
+    def _lower_type_text(self, action: TypeTextAction, source: int) -> None:
+        # 逐字符插入，每个字符带自己的延迟
+        text = action.text
+        intern = self.program.intern
+        delays = action.get_char_delays()
+        if not self.per_key:
+            self.program.emit(Op.INSERT, sum(delays), source, intern(text))
+            return
+        if not text:
+            # 空文本不插入字符，但与 execute 一样会删除选区
+            self.program.emit(Op.INSERT, 0.0, source, intern(text))
+            return
+        self.program.emit_run(Op.INSERT, delays, source, [intern(char) for char in text])
+    
+    def _lower_insert_text(self, action: InsertTextAction, source: int) -> None:
+        self.program.emit(Op.INSERT, action.get_duration(), source,
+                          self.program.intern(action.text))
+    
+    def _lower_backspace(self, action: BackspaceAction, source: int) -> None:
+        self.program.emit_run(Op.DELETE_BACK, [action.char_delay] * max(0, action.count), source)
+    
+    def _lower_delete(self, action: DeleteAction, source: int) -> None:
+        self.program.emit_run(Op.DELETE_FWD, [action.char_delay] * max(0, action.count), source)
+    
+    def _lower_replace_text(self, action: ReplaceTextAction, source: int) -> None:
+        self.program.emit(Op.REPLACE, action.get_duration(), source,
+                          action.start, action.end, self.program.intern(action.new_text))
+    
+    def _lower_move_cursor(self, action: MoveCursorAction, source: int) -> None:
+        flags = MOVE_CLEAR if action.clear_selection else 0
+        if action.position is not None:
+            self.program.emit(Op.MOVE, action.get_duration(), source, action.position, flags)
+        elif action.offset is not None:
+            self.program.emit(Op.MOVE, action.get_duration(), source,
+                              action.offset, flags | MOVE_RELATIVE)
+        else:
+            raise ValueError("Must specify either position or offset")
+    
+    def _lower_set_selection(self, action: SetSelectionAction, source: int) -> None:
+        self.program.emit(Op.SELECT, action.get_duration(), source, action.start, action.end)
+    
+    def _lower_select_range(self, action: SelectRangeAction, source: int) -> None:
+        self.program.emit(Op.SELECT, action.get_duration(), source,
+                          action.start, action.start + action.length)
+    
+    def _lower_clear_selection(self, action: ClearSelectionAction, source: int) -> None:
+        self.program.emit(Op.CLEAR_SELECTION, action.get_duration(), source)
+    
+    def _lower_delete_selection(self, action: DeleteSelectionAction, source: int) -> None:
+        self.program.emit(Op.DELETE_SELECTION, action.get_duration(), source)
+    
+    def _lower_set_style(self, action: SetStyleAction, source: int) -> None:
+        self.program.emit(Op.STYLE, action.get_duration(), source, _STYLE_INDEX[action.style])
+    
+    def _lower_pause(self, action: PauseAction, source: int) -> None:
+        self.program.emit(Op.WAIT, action.get_duration(), source)
+    
+    def _lower_composite(self, action: CompositeAction, source: int) -> None:
+        for sub_action in action.actions:
+            self.lower(sub_action, source)
+    
+    def _lower_repeat(self, action: RepeatAction, source: int) -> None:
+        # 扁平程序需要逐轮展开；每轮重新采样打字延迟
+        for sub_action in action.iter_actions():
+            self.lower(sub_action, source)
+    
+    def _lower_call(self, action: Action, source: int) -> None:
+        # 回调及自定义动作：保留原对象，由解释器调用 execute
+        self.program.objects.append(action)
+        self.program.emit(Op.CALL, action.get_duration(), source, len(self.program.objects) - 1)
+
+
+def compile_actions(actions: Iterable[Action], per_key: bool = True) -> Program:
+    """
+    把动作序列编译为操作码程序
+    
+    Args:
+        actions: 动作序列
+        per_key: 是否把打字动作展开为逐字符指令
+    
+    Returns:
+        Program
+    """
+    return ActionCompiler(per_key).compile(actions)
+
+
+def iter_keystrokes(actions: Iterable[Action], buffer: TextBuffer) -> Iterator[tuple[float, int]]:
+    """
+    流式执行动作，每执行一条指令产出一次
+    
+    每次只编译一个顶层动作，内存占用与动作总数无关，适合 iter_parse 产出的超大脚本。
+    
+    Args:
+        actions: 动作序列（可以是迭代器）
+        buffer: 文本缓冲区，产出时已执行到该指令
+    
+    Yields:
+        (timestamp, source)：指令完成时的时间戳和来源顶层动作下标
+    """
+    compiler = ActionCompiler()
+    offset = 0.0
+    for index, action in enumerate(actions):
+        program = compiler.program = Program()
+        compiler.lower(action, index)
+        times = program.times
+        for pc in range(len(program)):
+            program.run(buffer, pc, pc + 1)
+            yield offset + times[pc], index
+        offset += program.total_duration
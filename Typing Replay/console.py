@@ -3,27 +3,34 @@
 用于可视化回放过程
 """
 
+import shutil
 import sys
-from typing import Optional
+import threading
+import time
+from typing import Optional, TextIO
 from datetime import timedelta
 
-from buffer import EditorState, TextStyle
+from buffer import EditorState, Selection, TextStyle
 from scheduler import PlaybackEvent
+from viewport import clip_line
 
 
 class ConsoleRenderer:
     """控制台渲染器"""
     
-    def __init__(self, show_cursor: bool = True, show_selection: bool = True):
+    def __init__(self, show_cursor: bool = True, show_selection: bool = True,
+                 viewport_lines: Optional[int] = None):
         """
         初始化渲染器
         
         Args:
             show_cursor: 是否显示光标
             show_selection: 是否显示选区
+            viewport_lines: 只显示光标周围的行数（None 表示显示全部）
         """
         self.show_cursor = show_cursor
         self.show_selection = show_selection
+        self.viewport_lines = viewport_lines
         self._last_line_count = 0
     
     def render_state(self, state: EditorState, clear_previous: bool = False) -> None:
@@ -37,6 +44,16 @@ class ConsoleRenderer:
         if clear_previous:
             self.clear_lines(self._last_line_count)
         
+        lines = self._build_lines(state)
+        
+        # 输出
+        output = '\n'.join(lines)
+        print(output, flush=True)
+        
+        self._last_line_count = len(lines)
+    
+    def _build_lines(self, state: EditorState) -> list[str]:
+        """构建一帧的所有输出行"""
         lines = []
         
         # 标题
@@ -52,66 +69,105 @@ class ConsoleRenderer:
         lines.extend(text_lines)
         
         lines.append("=" * 60)
-        
-        # 输出
-        output = '\n'.join(lines)
-        print(output, flush=True)
-        
-        self._last_line_count = len(lines)
+        return lines
     
     def _format_text(self, state: EditorState) -> list[str]:
         """格式化文本，添加光标和选区标记"""
         text = state.text
         cursor = state.cursor_pos
-        selection = state.selection
         
         if not text:
             return ["(empty)" if not self.show_cursor else "|"]
         
-        # 分行显示
-        lines = text.split('\n')
+        # 只格式化视口内的行
+        if self.viewport_lines is None:
+            start, end = 0, len(text)
+        else:
+            start, end = self._viewport(text, cursor)
+        
+        selection = state.selection
+        if not (self.show_selection and selection and not selection.is_empty):
+            selection = None
+        
         result = []
-        char_pos = 0
-        
-        for line_idx, line in enumerate(lines):
-            line_start = char_pos
-            line_end = char_pos + len(line)
-            
-            # 构建带标记的行
-            marked_line = ""
-            
-            for i, char in enumerate(line):
-                abs_pos = line_start + i
-                
-                # 检查是否在选区内
-                in_selection = False
-                if self.show_selection and selection and not selection.is_empty:
-                    in_selection = selection.start <= abs_pos < selection.end
-                
-                # 检查是否是光标位置
-                is_cursor = self.show_cursor and abs_pos == cursor
-                
-                # 添加字符（带标记）
-                if in_selection:
-                    marked_line += f"[{char}]"
-                else:
-                    marked_line += char
-                
-                # 添加光标
-                if is_cursor:
-                    marked_line += "|"
-            
-            # 行尾光标
-            if self.show_cursor and cursor == line_end:
-                marked_line += "|"
-            
-            result.append(marked_line if marked_line else "(empty line)")
-            
+        if start > 0:
+            hidden = text.count('\n', 0, start)
+            result.append(f"... ({hidden} lines above)")
+        
+        line_start = start
+        for line in text[start:end].split('\n'):
+            result.append(self._format_line(line, line_start, cursor, selection))
             # 移动到下一行（包括换行符）
-            char_pos = line_end + 1
+            line_start += len(line) + 1
         
+        if end < len(text):
+            hidden = text.count('\n', end)
+            result.append(f"... ({hidden} lines below)")
         return result
     
+    def _format_line(self, line: str, line_start: int, cursor: int,
+                     selection: Optional[Selection]) -> str:
+        """按光标和选区边界切片格式化一行：选中的字符为 [c]，光标 | 在所在字符之后"""
+        length = len(line)
+        cuts = {0, length}
+        
+        # 选区与本行的交集（行内偏移）
+        sel_start = sel_end = 0
+        if selection is not None:
+            sel_start = min(max(selection.start - line_start, 0), length)
+            sel_end = min(max(selection.end - line_start, 0), length)
+            cuts.add(sel_start)
+            cuts.add(sel_end)
+        
+        # 光标标记插入的位置：光标所在字符之后，或行尾
+        mark = -1
+        if self.show_cursor and line_start <= cursor <= line_start + length:
+            mark = min(cursor - line_start + 1, length)
+            cuts.add(mark)
+        
+        pieces = []
+        if mark == 0:
+            pieces.append("|")
+        bounds = sorted(cuts)
+        for a, b in zip(bounds, bounds[1:]):
+            segment = line[a:b]
+            if sel_start <= a and b <= sel_end:
+                pieces.append("[" + "][".join(segment) + "]")
+            else:
+                pieces.append(segment)
+            if b == mark:
+                pieces.append("|")
+        
+        marked_line = "".join(pieces)
+        return marked_line if marked_line else "(empty line)"
+    
+    def _viewport(self, text: str, cursor: int) -> tuple[int, int]:
+        """
+        光标周围 viewport_lines 行的字符范围 [start, end)
+        
+        只向前后查找换行符，耗时与视口大小成正比，与文档长度无关。
+        """
+        total = max(1, self.viewport_lines)
+        start = text.rfind('\n', 0, cursor) + 1
+        end = text.find('\n', cursor)
+        end = len(text) if end < 0 else end
+        
+        # 光标上方取约一半，某一方向到头时把余量让给另一方向
+        above_target = (total - 1) // 2
+        above = below = 0
+        while above + below + 1 < total:
+            can_up, can_down = start > 0, end < len(text)
+            if can_up and (above < above_target or not can_down):
+                start = text.rfind('\n', 0, start - 1) + 1
+                above += 1
+            elif can_down:
+                next_end = text.find('\n', end + 1)
+                end = len(text) if next_end < 0 else next_end
+                below += 1
+            else:
+                break
+        return start, end
+    
     def render_event(self, event: PlaybackEvent) -> None:
         """
         渲染回放事件
@@ -147,9 +203,202 @@ class ConsoleRenderer:
     @staticmethod
     def clear_lines(count: int) -> None:
         """清除指定行数"""
-        for _ in range(count):
-            sys.stdout.write("\033[F\033[K")  # 上移并清除行
-        sys.stdout.flush()
+        if count > 0:
+            # 一次上移 count 行并清除到屏幕末尾
+            sys.stdout.write(f"\033[{count}F\033[J")
+            sys.stdout.flush()
+
+
+class IncrementalRenderer(ConsoleRenderer):
+    """
+    增量控制台渲染器
+    
+    与上一帧逐行比较，只用 ANSI 光标定位重写发生变化的行；
+    每帧的全部输出拼接后一次写入，避免闪烁。
+    超过终端宽度的行按显示宽度截断（宽字符占两列），以保证行数与屏幕行一一对应。
+    """
+    
+    def __init__(self, show_cursor: bool = True, show_selection: bool = True,
+                 stream: Optional[TextIO] = None, width: Optional[int] = None,
+                 viewport_lines: Optional[int] = None):
+        """
+        Args:
+            show_cursor: 是否显示光标
+            show_selection: 是否显示选区
+            stream: 输出流（默认 sys.stdout）
+            width: 最大行宽（默认取终端宽度）
+            viewport_lines: 只显示光标周围的行数（None 表示显示全部）
+        """
+        super().__init__(show_cursor, show_selection, viewport_lines)
+        self.stream = stream
+        self.width = width
+        self._last_lines: list[str] = []
+        self.lines_written = 0
+    
+    def render_state(self, state: EditorState, clear_previous: bool = True) -> None:
+        """
+        渲染编辑器状态
+        
+        Args:
+            state: 编辑器状态
+            clear_previous: 为 True 时原地更新上一帧，否则在下方输出新的一帧
+        """
+        if not clear_previous:
+            self._last_lines = []
+        
+        width = self.width or shutil.get_terminal_size().columns
+        lines = [clip_line(line, width - 1) for line in self._build_lines(state)]
+        output = self._diff(self._last_lines, lines)
+        
+        stream = self.stream or sys.stdout
+        stream.write(output)
+        stream.flush()
+        
+        self._last_lines = lines
+        self._last_line_count = len(lines)
+    
+    def reset(self) -> None:
+        """忘记上一帧（下一帧完整输出）"""
+        self._last_lines = []
+        self._last_line_count = 0
+    
+    def _diff(self, old: list[str], new: list[str]) -> str:
+        """
+        生成把屏幕上的 old 更新为 new 的转义序列
+        
+        约定：每帧输出后光标停在帧下方一行的行首。
+        """
+        out = []
+        row = len(old)
+        
+        for index in range(min(len(old), len(new))):
+            if old[index] != new[index]:
+                out.append(self._move(row, index))
+                out.append("\033[2K")
+                out.append(new[index])
+                row = index
+                self.lines_written += 1
+        
+        if len(new) > len(old):
+            # 新增的行追加在上一帧下方（必要时滚屏）
+            out.append(self._move(row, len(old)))
+            out.append('\n'.join(new[len(old):]))
+            out.append('\n')
+            self.lines_written += len(new) - len(old)
+        else:
+            out.append(self._move(row, len(new)))
+            if len(old) > len(new):
+                out.append("\033[J")
+        
+        return ''.join(out)
+    
+    @staticmethod
+    def _move(row: int, target: int) -> str:
+        """从 row 行移动到 target 行的行首"""
+        if target < row:
+            return f"\033[{row - target}F"
+        if target > row:
+            return f"\033[{target - row}E"
+        return "\r"
+
+
+class ThrottledDisplay:
+    """
+    限帧的控制台显示
+    
+    回放线程只通过 submit 交出最新状态（加锁赋值，开销极小），
+    显示线程以不超过 max_fps 的频率渲染当时最新的状态，中间被覆盖的状态直接丢弃。
+    
+    Example:
+        with ThrottledDisplay(max_fps=30) as display:
+            scheduler.on_state_changed(display.submit)
+            scheduler.play(real_time=True)
+        print(display.stats)
+    """
+    
+    def __init__(self, renderer: Optional[ConsoleRenderer] = None, max_fps: float = 30.0):
+        """
+        Args:
+            renderer: 渲染器（默认 IncrementalRenderer）
+            max_fps: 每秒最多渲染的帧数
+        """
+        if max_fps <= 0:
+            raise ValueError("max_fps must be positive")
+        self.renderer = renderer if renderer is not None else IncrementalRenderer()
+        self.max_fps = max_fps
+        self.frames_rendered = 0
+        self.states_submitted = 0
+        self._latest: Optional[EditorState] = None
+        self._pending = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    @property
+    def frames_dropped(self) -> int:
+        """提交后未被渲染（被更新的状态覆盖）的状态数"""
+        return self.states_submitted - self.frames_rendered
+    
+    @property
+    def stats(self) -> dict:
+        """渲染统计"""
+        return {
+            'states_submitted': self.states_submitted,
+            'frames_rendered': self.frames_rendered,
+            'frames_dropped': self.frames_dropped,
+        }
+    
+    def submit(self, state: EditorState) -> None:
+        """提交最新状态（可直接用作 on_state_changed 回调）"""
+        with self._lock:
+            self._latest = state
+            self._pending = True
+            self.states_submitted += 1
+    
+    def start(self) -> 'ThrottledDisplay':
+        """启动显示线程"""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='ThrottledDisplay',
+                                            daemon=True)
+            self._thread.start()
+        return self
+    
+    def stop(self) -> None:
+        """停止显示线程，并确保最后一个状态被渲染"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self._render_latest()
+    
+    def __enter__(self) -> 'ThrottledDisplay':
+        return self.start()
+    
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+    
+    def _run(self) -> None:
+        interval = 1.0 / self.max_fps
+        next_frame = time.perf_counter()
+        while not self._stop.is_set():
+            self._render_latest()
+            next_frame += interval
+            delay = next_frame - time.perf_counter()
+            if delay < 0:
+                # 渲染慢于帧间隔时不追帧
+                next_frame = time.perf_counter()
+                delay = 0
+            self._stop.wait(delay)
+    
+    def _render_latest(self) -> None:
+        with self._lock:
+            if not self._pending:
+                return
+            state = self._latest
+            self._pending = False
+            self.frames_rendered += 1
+        self.renderer.render_state(state, clear_previous=True)
 
 
 class EventLogger:
@@ -0,0 +1,429 @@
+"""
+差异合成器 (Diff Synthesizer)
+根据文本文件的多个版本生成把每个版本改写为下一个版本的打字脚本
+"""
+
+import sys
+from bisect import bisect_left
+from typing import Iterable, Optional, Sequence
+
+from script_parser import ScriptBuilder
+
+
+# ==================== Myers 差异算法 ====================
+
+# 默认的最大编辑距离：超过时改用唯一公共元素分段，再在各段内比较
+MAX_EDIT_DISTANCE = 1000
+
+
+def _myers_blocks(a: Sequence, b: Sequence,
+                  max_d: Optional[int] = MAX_EDIT_DISTANCE) -> Optional[list[tuple[int, int, int]]]:
+    """
+    Myers O((N+M)·D) 贪心差异算法
+    
+    每一步只保存当前编辑距离 d 覆盖的对角线 [-d, d]，回溯所需内存为 O(D²)。
+    编辑距离超过 max_d 时放弃搜索并返回 None，
+    时间和内存分别限制在 O((N+M)·max_d) 和 O(max_d²)。
+    
+    Args:
+        a: 旧序列
+        b: 新序列
+        max_d: 最大编辑距离（None 表示不限制）
+    
+    Returns:
+        匹配块列表 [(i, j, size)]，按顺序排列；超过 max_d 时为 None
+    """
+    n, m = len(a), len(b)
+    if n == 0 or m == 0:
+        return []
+    
+    limit = n + m if max_d is None else min(max_d, n + m)
+    offset = limit + 1
+    v = [0] * (2 * limit + 3)
+    trace = []
+    
+    for d in range(limit + 1):
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]
+            else:
+                x = v[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[offset + k] = x
+            if x >= n and y >= m:
+                return _backtrack(trace, d, n, m)
+        trace.append(v[offset - d:offset + d + 1])
+    
+    # 超过最大编辑距离
+    return None
+
+
+def _backtrack(trace: list[list[int]], d: int, x: int, y: int) -> list[tuple[int, int, int]]:
+    blocks = []
+    while d > 0:
+        previous = trace[d - 1]
+        k = x - y
+        # previous[k + (d - 1)] 是上一步对角线 k 上到达的 x
+        if k == -d or (k != d and previous[k - 1 + d - 1] < previous[k + 1 + d - 1]):
+            prev_k = k + 1
+        else:
+            prev_k = k - 1
+        prev_x = previous[prev_k + d - 1]
+        prev_y = prev_x - prev_k
+        # 编辑之后的对角线段
+        start_x = prev_x if prev_k == k + 1 else prev_x + 1
+        if x > start_x:
+            blocks.append((start_x, start_x - k, x - start_x))
+        x, y = prev_x, prev_y
+        d -= 1
+    if x > 0:
+        blocks.append((0, 0, x))
+    blocks.reverse()
+    return blocks
+
+
+def _unique_anchors(a: Sequence, b: Sequence) -> list[tuple[int, int]]:
+    """
+    patience 锚点：在 a 和 b 中都只出现一次的元素，取两侧顺序一致的最长子序列
+    
+    Returns:
+        [(i, j)]，i 和 j 均严格递增
+    """
+    a_counts: dict = {}
+    a_index: dict = {}
+    for index, item in enumerate(a):
+        a_counts[item] = a_counts.get(item, 0) + 1
+        a_index[item] = index
+    b_counts: dict = {}
+    b_index: dict = {}
+    for index, item in enumerate(b):
+        b_counts[item] = b_counts.get(item, 0) + 1
+        b_index[item] = index
+    pairs = sorted((a_index[item], b_index[item]) for item, count in a_counts.items()
+                   if count == 1 and b_counts.get(item) == 1)
+    
+    # 按 j 求最长递增子序列（耐心排序）
+    tails: list[int] = []
+    tail_pairs: list[int] = []
+    links: list[int] = []
+    for index, (_, j) in enumerate(pairs):
+        position = bisect_left(tails, j)
+        links.append(tail_pairs[position - 1] if position else -1)
+        if position == len(tails):
+            tails.append(j)
+            tail_pairs.append(index)
+        else:
+            tails[position] = j
+            tail_pairs[position] = index
+    anchors = []
+    index = tail_pairs[-1] if tail_pairs else -1
+    while index >= 0:
+        anchors.append(pairs[index])
+        index = links[index]
+    anchors.reverse()
+    return anchors
+
+
+def _diff_blocks(a: Sequence, b: Sequence,
+                 max_d: Optional[int]) -> list[tuple[int, int, int]]:
+    """
+    去掉公共前缀和后缀后比较中间部分，返回匹配块 [(i, j, size)]
+    
+    中间部分的编辑距离超过 max_d 时，以唯一公共元素为锚点分段，各段分别比较；
+    没有锚点的段才整段视为替换。修改分散时结果仍是局部的编辑，但不保证最少。
+    """
+    n, m = len(a), len(b)
+    prefix = 0
+    while prefix < n and prefix < m and a[prefix] == b[prefix]:
+        prefix += 1
+    suffix = 0
+    while (suffix < n - prefix and suffix < m - prefix
+           and a[n - 1 - suffix] == b[m - 1 - suffix]):
+        suffix += 1
+    
+    blocks = []
+    if prefix:
+        blocks.append((0, 0, prefix))
+    middle_a, middle_b = a[prefix:n - suffix], b[prefix:m - suffix]
+    middle = _myers_blocks(middle_a, middle_b, max_d)
+    if middle is None:
+        middle = []
+        anchors = _unique_anchors(middle_a, middle_b)
+        if anchors:
+            # 末尾的哨兵使最后一个锚点之后的部分也参与比较
+            anchors.append((len(middle_a), len(middle_b)))
+        # 没有锚点时整段视为替换
+        i = j = 0
+        for anchor_i, anchor_j in anchors:
+            for block_i, block_j, size in _diff_blocks(middle_a[i:anchor_i],
+                                                       middle_b[j:anchor_j], max_d):
+                middle.append((block_i + i, block_j + j, size))
+            if anchor_i < len(middle_a):
+                middle.append((anchor_i, anchor_j, 1))
+            i, j = anchor_i + 1, anchor_j + 1
+    for i, j, size in middle:
+        blocks.append((i + prefix, j + prefix, size))
+    if suffix:
+        blocks.append((n - suffix, m - suffix, suffix))
+    return blocks
+
+
+def diff_opcodes(a: Sequence, b: Sequence,
+                 max_d: Optional[int] = MAX_EDIT_DISTANCE) -> list[tuple[str, int, int, int, int]]:
+    """
+    计算两个序列的差异
+    
+    先去掉公共前缀和后缀，再对中间部分运行 Myers 算法。
+    中间部分的编辑距离超过 max_d 时，以两侧都只出现一次的元素为锚点（patience diff）
+    把中间部分切成小段，各段再分别比较；结果仍是局部的编辑，但不保证最少。
+    
+    Args:
+        a: 旧序列
+        b: 新序列
+        max_d: 最大编辑距离（None 表示不限制）
+    
+    Returns:
+        与 difflib.SequenceMatcher.get_opcodes 相同格式的操作码列表：
+        (tag, i1, i2, j1, j2)，tag 为 'equal' / 'replace' / 'delete' / 'insert'
+    """
+    n, m = len(a), len(b)
+    # 合并首尾相接的匹配块
+    blocks: list[list[int]] = []
+    for block_i, block_j, size in _diff_blocks(a, b, max_d):
+        if blocks and blocks[-1][0] + blocks[-1][2] == block_i \
+                and blocks[-1][1] + blocks[-1][2] == block_j:
+            blocks[-1][2] += size
+        else:
+            blocks.append([block_i, block_j, size])
+    blocks.append([n, m, 0])
+    
+    opcodes = []
+    i = j = 0
+    for block_i, block_j, size in blocks:
+        if i < block_i and j < block_j:
+            opcodes.append(('replace', i, block_i, j, block_j))
+        elif i < block_i:
+            opcodes.append(('delete', i, block_i, j, j))
+        elif j < block_j:
+            opcodes.append(('insert', i, i, j, block_j))
+        if size:
+            opcodes.append(('equal', block_i, block_i + size, block_j, block_j + size))
+        i, j = block_i + size, block_j + size
+    return opcodes
+
+
+# ==================== 文本编辑 ====================
+
+def _intern_lines(a_lines: list[str], b_lines: list[str]) -> tuple[list[int], list[int]]:
+    """把行映射为整数，差异比较时只比较整数"""
+    ids: dict[str, int] = {}
+    a_ids = [ids.setdefault(line, len(ids)) for line in a_lines]
+    b_ids = [ids.setdefault(line, len(ids)) for line in b_lines]
+    return a_ids, b_ids
+
+
+def _char_edits(old: str, new: str, base: int, min_equal: int,
+                max_d: Optional[int]) -> list[tuple[int, int, str]]:
+    """字符级细化，过短的相等片段并入两侧的修改，避免零碎的编辑"""
+    edits: list[list[int]] = []
+    for tag, i1, i2, j1, j2 in diff_opcodes(old, new, max_d):
+        if tag == 'equal':
+            continue
+        if edits and i1 - edits[-1][1] < min_equal:
+            # 与上一处修改之间只隔着很短的相等片段：连同该片段合并为一处
+            edits[-1][1] = i2
+            edits[-1][3] = j2
+        else:
+            edits.append([i1, i2, j1, j2])
+    return [(i1 + base, i2 + base, new[j1:j2]) for i1, i2, j1, j2 in edits]
+
+
+def text_edits(old: str, new: str, refine_limit: int = 4000, min_equal: int = 3,
+               max_d: Optional[int] = MAX_EDIT_DISTANCE) -> list[tuple[int, int, str]]:
+    """
+    计算把 old 改写为 new 的编辑列表
+    
+    先按行比较，替换块在合计长度不超过 refine_limit 时再做字符级细化。
+    
+    Args:
+        old: 旧文本
+        new: 新文本
+        refine_limit: 字符级细化的最大块长度（字符数）
+        min_equal: 字符级细化时保留的最短相等片段
+        max_d: 差异比较的最大编辑距离（见 diff_opcodes）
+    
+    Returns:
+        [(start, end, text)]：把 old[start:end] 替换为 text，按位置升序且互不重叠，
+        位置均为 old 中的字符偏移
+    """
+    a_lines = old.splitlines(keepends=True)
+    b_lines = new.splitlines(keepends=True)
+    a_ids, b_ids = _intern_lines(a_lines, b_lines)
+    
+    # 每行在旧文本中的起始偏移
+    a_starts = [0]
+    for line in a_lines:
+        a_starts.append(a_starts[-1] + len(line))
+    
+    edits = []
+    for tag, i1, i2, j1, j2 in diff_opcodes(a_ids, b_ids, max_d):
+        if tag == 'equal':
+            continue
+        start, end = a_starts[i1], a_starts[i2]
+        text = ''.join(b_lines[j1:j2])
+        if tag == 'replace' and (end - start) + len(text) <= refine_limit:
+            edits.extend(_char_edits(old[start:end], text, start, min_equal, max_d))
+        else:
+            edits.append((start, end, text))
+    return edits
+
+
+# ==================== 脚本合成 ====================
+
+class DiffSynthesizer:
+    """
+    把文本修改合成为打字动作
+    
+    光标移动尽量自然：
+        - 纯插入：移动到插入点后打字
+        - 短删除（不超过 backspace_limit 个字符）：移动到删除末尾后退格
+        - 长删除或替换：选中后删除或直接打字覆盖
+        - 光标已在目标位置时不产生移动
+    """
+    
+    def __init__(self, builder: Optional[ScriptBuilder] = None, wpm: int = 60,
+                 backspace_limit: int = 8, edit_pause: float = 0.3,
+                 refine_limit: int = 4000, max_d: Optional[int] = MAX_EDIT_DISTANCE):
+        """
+        Args:
+            builder: 追加动作的构建器（默认新建）
+            wpm: 打字速度
+            backspace_limit: 用退格而不是选中删除的最大字符数
+            edit_pause: 两处不相邻的修改之间的停顿（秒）
+            refine_limit: 字符级细化的最大块长度（字符数）
+            max_d: 差异比较的最大编辑距离（见 diff_opcodes）
+        """
+        self.builder = builder if builder is not None else ScriptBuilder()
+        self.wpm = wpm
+        self.backspace_limit = backspace_limit
+        self.edit_pause = edit_pause
+        self.refine_limit = refine_limit
+        self.max_d = max_d
+        # 当前文档长度与光标位置
+        self.length = 0
+        self.cursor = 0
+    
+    def reset(self, text: str) -> ScriptBuilder:
+        """以即时插入的方式放入初始文本"""
+        if text:
+            self.builder.insert(text)
+        self.length = len(text)
+        self.cursor = self.length
+        return self.builder
+    
+    def transform(self, old: str, new: str) -> ScriptBuilder:
+        """追加把 old 改写为 new 的动作（当前文档内容应为 old）"""
+        delta = 0
+        first = True
+        for start, end, text in text_edits(old, new, self.refine_limit, max_d=self.max_d):
+            position = start + delta
+            if not first and self.edit_pause > 0 and self.cursor != position:
+                self.builder.pause(self.edit_pause)
+            first = False
+            self._edit(position, end - start, text)
+            delta += len(text) - (end - start)
+        return self.builder
+    
+    def _move(self, position: int) -> None:
+        if self.cursor != position:
+            self.builder.move_cursor(position=position)
+            self.cursor = position
+    
+    def _edit(self, position: int, length: int, text: str) -> None:
+        builder = self.builder
+        if length == 0:
+            self._move(position)
+        elif length <= self.backspace_limit:
+            self._move(position + length)
+            builder.backspace(length)
+        else:
+            builder.select(position, position + length)
+            if not text:
+                builder.delete_selection()
+        if text:
+            # 打字覆盖选区；原样输入，不展开 emoji 快捷码
+            builder.type(text, wpm=self.wpm, expand_emoji=False)
+        self.length += len(text) - length
+        self.cursor = position + len(text)
+
+
+def synthesize(old: str, new: str, wpm: int = 60, **options) -> ScriptBuilder:
+    """
+    生成把 old 改写为 new 的脚本（脚本开头即时插入 old）
+    
+    Args:
+        old: 旧文本
+        new: 新文本
+        wpm: 打字速度
+        **options: 传给 DiffSynthesizer 的其他参数
+    
+    Returns:
+        ScriptBuilder
+    """
+    return synthesize_revisions([old, new], wpm=wpm, **options)
+
+
+def synthesize_revisions(revisions: Iterable[str], wpm: int = 60,
+                         revision_pause: float = 1.0, type_initial: bool = False,
+                         builder: Optional[ScriptBuilder] = None,
+                         **options) -> ScriptBuilder:
+    """
+    生成依次经过各个版本的脚本
+    
+    Args:
+        revisions: 文本的各个版本（按时间顺序，可以是生成器）
+        wpm: 打字速度
+        revision_pause: 两个版本之间的停顿（秒）
+        type_initial: 是否逐字打出第一个版本（默认即时插入）
+        builder: 追加动作的构建器（默认新建）
+        **options: 传给 DiffSynthesizer 的其他参数
+    
+    Returns:
+        ScriptBuilder
+    """
+    synthesizer = DiffSynthesizer(builder, wpm=wpm, **options)
+    previous = None
+    for revision in revisions:
+        if previous is None:
+            if type_initial:
+                synthesizer.transform('', revision)
+            else:
+                synthesizer.reset(revision)
+        else:
+            if revision_pause > 0:
+                synthesizer.builder.pause(revision_pause)
+            synthesizer.transform(previous, revision)
+        previous = revision
+    return synthesizer.builder
+
+
+def main(argv: list[str]) -> int:
+    """diff_synth.py OUTPUT REVISION1 REVISION2 [...]：把多个文件版本合成为脚本"""
+    if len(argv) < 3:
+        print("usage: diff_synth.py OUTPUT REVISION1 REVISION2 [...]")
+        return 2
+    
+    def read_revisions():
+        for path in argv[1:]:
+            with open(path, 'r', encoding='utf-8') as f:
+                yield f.read()
+    
+    synthesize_revisions(read_revisions()).save(argv[0])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,244 @@
+"""
+符号化试运行 (Dry Run)
+只跟踪文档长度、光标、选区和时间，不构建文本，用于快速校验脚本
+"""
+
+import sys
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+from buffer import Selection
+from actions import (
+    Action, TypeTextAction, InsertTextAction, BackspaceAction, DeleteAction,
+    ReplaceTextAction, MoveCursorAction, SetSelectionAction, SelectRangeAction,
+    ClearSelectionAction, DeleteSelectionAction, SetStyleAction, PauseAction,
+    CompositeAction, RepeatAction
+)
+
+
+@dataclass
+class DryRunIssue:
+    """试运行发现的问题"""
+    index: int  # 顶层动作下标
+    action: Action
+    kind: str  # 'clamped' | 'invalid_range' | 'invalid' | 'opaque'
+    message: str
+    
+    def __repr__(self) -> str:
+        return f"DryRunIssue(#{self.index} {self.kind}: {self.message})"
+
+
+@dataclass
+class DryRunReport:
+    """试运行结果"""
+    length: int
+    cursor: int
+    selection: Optional[Selection]
+    duration: float
+    actions: int
+    issues: list[DryRunIssue] = field(default_factory=list)
+    
+    @property
+    def ok(self) -> bool:
+        """是否没有无效范围或无效动作（截断只是提示）"""
+        return not any(issue.kind in ('invalid_range', 'invalid') for issue in self.issues)
+    
+    def __repr__(self) -> str:
+        return (f"DryRunReport(length={self.length}, cursor={self.cursor}, "
+                f"duration={self.duration:.2f}s, issues={len(self.issues)})")
+
+
+class DryRunExecutor:
+    """
+    符号化执行器
+    
+    按 TextBuffer 的语义推演长度、光标和选区，记录截断和无效范围。
+    回调及自定义动作无法推演，视为不改变状态并记为 'opaque'。
+    """
+    
+    def __init__(self, length: int = 0):
+        self.length = length
+        self.cursor = length
+        self.selection: Optional[Selection] = None
+        self.duration = 0.0
+        self.issues: list[DryRunIssue] = []
+        self._index = 0
+        self._action: Optional[Action] = None
+        self._handlers = {
+            TypeTextAction: self._insert_text,
+            InsertTextAction: self._insert_text,
+            BackspaceAction: self._backspace,
+            DeleteAction: self._delete,
+            ReplaceTextAction: self._replace_text,
+            MoveCursorAction: self._move_cursor,
+            SetSelectionAction: self._set_selection,
+            SelectRangeAction: self._select_range,
+            ClearSelectionAction: self._clear_selection,
+            DeleteSelectionAction: self._delete_selection,
+            SetStyleAction: self._no_op,
+            PauseAction: self._no_op,
+            CompositeAction: self._composite,
+            RepeatAction: self._repeat,
+        }
+    
+    def run(self, actions: Iterable[Action]) -> DryRunReport:
+        """试运行动作序列"""
+        count = 0
+        for index, action in enumerate(actions):
+            self._index = index
+            self._execute(action)
+            count += 1
+        return DryRunReport(
+            length=self.length,
+            cursor=self.cursor,
+            selection=self.selection,
+            duration=self.duration,
+            actions=count,
+            issues=self.issues
+        )
+    
+    def _execute(self, action: Action) -> None:
+        self._action = action
+        handler = self._handlers.get(type(action), self._opaque)
+        handler(action)
+        if type(action) not in (CompositeAction, RepeatAction):
+            self.duration += action.get_duration()
+    
+    def _report(self, kind: str, message: str) -> None:
+        self.issues.append(DryRunIssue(self._index, self._action, kind, message))
+    
+    def _clamp(self, position: int, what: str) -> int:
+        if position < 0 or position > self.length:
+            clamped = max(0, min(position, self.length))
+            self._report('clamped', f"{what} {position} clamped to {clamped} "
+                                    f"(length {self.length})")
+            return clamped
+        return position
+    
+    # ==================== 编辑语义 ====================
+    
+    def _drop_selection(self) -> bool:
+        """删除非空选区，返回是否删除"""
+        selection = self.selection
+        if selection is None or selection.is_empty:
+            return False
+        self.length -= selection.length
+        self.cursor = selection.start
+        self.selection = None
+        return True
+    
+    def _insert_text(self, action: Action) -> None:
+        self._drop_selection()
+        self.length += len(action.text)
+        self.cursor += len(action.text)
+    
+    def _backspace(self, action: BackspaceAction) -> None:
+        remaining = action.count
+        if remaining > 0 and self._drop_selection():
+            remaining -= 1
+        deleted = min(remaining, self.cursor)
+        self.length -= deleted
+        self.cursor -= deleted
+        if deleted < remaining:
+            self._report('clamped', f"backspace {action.count} stopped at document start")
+    
+    def _delete(self, action: DeleteAction) -> None:
+        remaining = action.count
+        if remaining > 0 and self._drop_selection():
+            remaining -= 1
+        deleted = min(remaining, self.length - self.cursor)
+        self.length -= deleted
+        if deleted < remaining:
+            self._report('clamped', f"delete {action.count} stopped at document end")
+    
+    def _replace_text(self, action: ReplaceTextAction) -> None:
+        if action.end < action.start:
+            self._report('invalid_range', f"replace range [{action.start}:{action.end}] "
+                                          f"ends before it starts")
+        start = self._clamp(action.start, 'replace start')
+        end = max(start, self._clamp(action.end, 'replace end'))
+        self.length += len(action.new_text) - (end - start)
+        self.cursor = start + len(action.new_text)
+        self.selection = None
+    
+    def _move_cursor(self, action: MoveCursorAction) -> None:
+        if action.position is not None:
+            self.cursor = self._clamp(action.position, 'cursor position')
+        elif action.offset is not None:
+            self.cursor = self._clamp(self.cursor + action.offset, 'cursor target')
+        else:
+            self._report('invalid', "move_cursor needs either position or offset")
+            return
+        if action.clear_selection:
+            self.selection = None
+    
+    def _select(self, start: int, end: int) -> None:
+        start = self._clamp(start, 'selection start')
+        end = self._clamp(end, 'selection end')
+        self.selection = Selection(start, end)
+        self.cursor = end
+    
+    def _set_selection(self, action: SetSelectionAction) -> None:
+        self._select(action.start, action.end)
+    
+    def _select_range(self, action: SelectRangeAction) -> None:
+        if action.length < 0:
+            self._report('invalid_range', f"select_range length {action.length} is negative")
+        self._select(action.start, action.start + action.length)
+    
+    def _clear_selection(self, action: Action) -> None:
+        self.selection = None
+    
+    def _delete_selection(self, action: Action) -> None:
+        self._drop_selection()
+    
+    def _no_op(self, action: Action) -> None:
+        pass
+    
+    def _composite(self, action: CompositeAction) -> None:
+        for sub_action in action.actions:
+            self._execute(sub_action)
+        self._action = action
+    
+    def _repeat(self, action: RepeatAction) -> None:
+        for sub_action in action.iter_actions():
+            self._execute(sub_action)
+        self._action = action
+    
+    def _opaque(self, action: Action) -> None:
+        self._report('opaque', f"{action.__class__.__name__} cannot be checked symbolically")
+
+
+def dry_run(actions: Iterable[Action], initial_length: int = 0) -> DryRunReport:
+    """
+    符号化试运行动作序列
+    
+    Args:
+        actions: 动作序列
+        initial_length: 初始文档长度（光标位于末尾）
+    
+    Returns:
+        DryRunReport
+    """
+    return DryRunExecutor(initial_length).run(actions)
+
+
+def main(argv: list[str]) -> int:
+    """校验命令行给出的脚本文件，存在无效范围时返回非零"""
+    from script_parser import ScriptParser
+    
+    failed = 0
+    for path in argv:
+        report = dry_run(ScriptParser.parse(path))
+        status = "OK" if report.ok else "FAIL"
+        print(f"{status} {path}: length={report.length} cursor={report.cursor} "
+              f"duration={report.duration:.2f}s")
+        for issue in report.issues:
+            print(f"    #{issue.index} {issue.kind}: {issue.message}")
+        if not report.ok:
+            failed += 1
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,338 @@
+"""
+事件总线 (Event Bus)
+把回放事件分发给多个订阅者，每个订阅者有自己的投递方式
+
+投递方式：
+    sync     在回放线程中直接调用回调
+    thread   放入有界队列，由订阅者自己的工作线程成批调用回调
+    asyncio  放入有界队列，在事件循环中以 async for 成批读取
+
+队列满时的背压策略：
+    block        回放线程等待消费者腾出空间（不丢事件）
+    drop_oldest  丢弃最早的未投递事件
+    coalesce     只保留最新的一个未投递事件（适合只关心最新状态的显示）
+
+除 block 外，慢速消费者不会拖慢回放。
+"""
+
+import asyncio
+import threading
+from collections import deque
+from enum import Enum
+from typing import Any, AsyncIterator, Callable, Optional
+
+
+# 主题
+ACTION_EXECUTED = 'action'  # PlaybackEvent
+STATE_CHANGED = 'state'     # EditorState
+TOPICS = (ACTION_EXECUTED, STATE_CHANGED)
+
+
+class Backpressure(Enum):
+    """队列满时的背压策略"""
+    BLOCK = "block"
+    DROP_OLDEST = "drop_oldest"
+    COALESCE = "coalesce"
+
+
+class _Mailbox:
+    """线程安全的有界队列，按背压策略处理溢出"""
+    
+    def __init__(self, maxsize: int, backpressure: Backpressure):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        self.maxsize = 1 if backpressure is Backpressure.COALESCE else maxsize
+        self.backpressure = backpressure
+        self.dropped = 0
+        self.closed = False
+        self._items: deque = deque()
+        self._condition = threading.Condition()
+    
+    def put(self, item: Any) -> bool:
+        """放入一个事件，返回放入前队列是否为空（消费者可能需要唤醒）"""
+        with self._condition:
+            if self.closed:
+                self.dropped += 1
+                return False
+            items = self._items
+            if len(items) >= self.maxsize:
+                if self.backpressure is Backpressure.BLOCK:
+                    while len(items) >= self.maxsize and not self.closed:
+                        self._condition.wait()
+                    if self.closed:
+                        self.dropped += 1
+                        return False
+                else:
+                    items.popleft()
+                    self.dropped += 1
+            was_empty = not items
+            items.append(item)
+            self._condition.notify_all()
+            return was_empty
+    
+    def take(self, limit: int, block: bool = True) -> list:
+        """
+        取出最多 limit 个事件
+        
+        block 为 True 时等待到有事件或队列关闭；返回空列表表示已关闭且取完（或非阻塞时为空）。
+        """
+        with self._condition:
+            items = self._items
+            while block and not items and not self.closed:
+                self._condition.wait()
+            batch = [items.popleft() for _ in range(min(limit, len(items)))]
+            if batch:
+                self._condition.notify_all()
+            return batch
+    
+    def close(self) -> None:
+        """关闭队列：不再接收事件，已有事件仍可取出，等待中的生产者和消费者被唤醒"""
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+
+class Subscription:
+    """
+    同步订阅：在发布者的线程中直接调用 callback(item)
+    
+    delivered 为已投递的事件数，dropped 为因背压或关闭丢弃的事件数。
+    """
+    
+    mode = 'sync'
+    
+    def __init__(self, topic: str, callback: Optional[Callable]):
+        self.topic = topic
+        self.callback = callback
+        self.delivered = 0
+        self.closed = False
+        self._bus: Optional['EventBus'] = None
+    
+    @property
+    def dropped(self) -> int:
+        return 0
+    
+    @property
+    def stats(self) -> dict:
+        """投递统计"""
+        return {'delivered': self.delivered, 'dropped': self.dropped}
+    
+    def publish(self, item: Any) -> None:
+        """投递一个事件"""
+        self.callback(item)
+        self.delivered += 1
+    
+    def close(self) -> None:
+        """取消订阅"""
+        self.closed = True
+        if self._bus is not None:
+            self._bus._remove(self)
+            self._bus = None
+    
+    def __enter__(self) -> 'Subscription':
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+    
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(topic={self.topic!r}, delivered={self.delivered})"
+
+
+class ThreadSubscription(Subscription):
+    """
+    线程订阅：事件放入有界队列，工作线程每次取出已积累的事件（最多 batch_size 个）
+    调用 callback(batch)
+    
+    回调抛出的异常记录在 errors 中，不会中断投递。close() 会等待队列中剩余的事件投递完毕。
+    """
+    
+    mode = 'thread'
+    
+    def __init__(self, topic: str, callback: Callable[[list], None], batch_size: int = 64,
+                 maxsize: int = 1024, backpressure: Backpressure = Backpressure.BLOCK):
+        super().__init__(topic, callback)
+        if batch_size <= 0:
+            raise ValueError("batch_size must be positive")
+        self.batch_size = batch_size
+        self.batches = 0
+        self.errors: list[Exception] = []
+        self._mailbox = _Mailbox(maxsize, backpressure)
+        self._thread = threading.Thread(target=self._run, name=f'Subscription-{topic}',
+                                        daemon=True)
+        self._thread.start()
+    
+    @property
+    def dropped(self) -> int:
+        return self._mailbox.dropped
+    
+    def publish(self, item: Any) -> None:
+        self._mailbox.put(item)
+    
+    def close(self) -> None:
+        """取消订阅，并等待剩余事件投递完毕"""
+        super().close()
+        self._mailbox.close()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+    
+    def _run(self) -> None:
+        mailbox = self._mailbox
+        while True:
+            batch = mailbox.take(self.batch_size)
+            if not batch:
+                return
+            try:
+                self.callback(batch)
+            except Exception as e:
+                self.errors.append(e)
+            self.delivered += len(batch)
+            self.batches += 1
+
+
+class AsyncioSubscription(Subscription):
+    """
+    asyncio 订阅：事件放入有界队列，在事件循环中成批读取
+    
+    Example:
+        subscription = scheduler.subscribe('state', mode='asyncio')
+        await loop.run_in_executor(None, scheduler.play, True)
+        subscription.close()
+        async for batch in subscription:
+            ...
+    
+    使用 block 策略时回放不能运行在事件循环所在的线程中，否则会互相等待。
+    """
+    
+    mode = 'asyncio'
+    
+    def __init__(self, topic: str, loop: Optional[asyncio.AbstractEventLoop] = None,
+                 batch_size: int = 64, maxsize: int = 1024,
+                 backpressure: Backpressure = Backpressure.BLOCK):
+        super().__init__(topic, None)
+        if batch_size <= 0:
+            raise ValueError("batch_size must be positive")
+        self.batch_size = batch_size
+        self.loop = loop if loop is not None else asyncio.get_running_loop()
+        self._mailbox = _Mailbox(maxsize, backpressure)
+        self._ready = asyncio.Event()
+    
+    @property
+    def dropped(self) -> int:
+        return self._mailbox.dropped
+    
+    def publish(self, item: Any) -> None:
+        # 只在队列由空变为非空时唤醒读取方，每个事件不必都跨线程通知
+        if self._mailbox.put(item):
+            self.loop.call_soon_threadsafe(self._ready.set)
+    
+    def close(self) -> None:
+        """取消订阅；读取方取完剩余事件后结束迭代"""
+        super().close()
+        self._mailbox.close()
+        self.loop.call_soon_threadsafe(self._ready.set)
+    
+    async def get_batch(self) -> list:
+        """
+        等待并取出已积累的事件（最多 batch_size 个）
+        
+        Returns:
+            事件列表；订阅已关闭且事件取完时为空列表
+        """
+        mailbox = self._mailbox
+        while True:
+            batch = mailbox.take(self.batch_size, block=False)
+            if batch or mailbox.closed:
+                self.delivered += len(batch)
+                return batch
+            # 唤醒回调在事件循环线程中执行，总是晚于这里的清除，不会丢失唤醒
+            self._ready.clear()
+            await self._ready.wait()
+    
+    def __aiter__(self) -> AsyncIterator[list]:
+        return self._iterate()
+    
+    async def _iterate(self) -> AsyncIterator[list]:
+        while True:
+            batch = await self.get_batch()
+            if not batch:
+                return
+            yield batch
+
+
+class EventBus:
+    """
+    多订阅者事件总线
+    
+    发布者调用 publish(topic, item)；没有订阅者的主题只需一次字典查找。
+    """
+    
+    def __init__(self):
+        self._subscriptions: dict[str, list[Subscription]] = {topic: [] for topic in TOPICS}
+    
+    def subscribe(self, topic: str, callback: Optional[Callable] = None, mode: str = 'sync',
+                  batch_size: int = 64, maxsize: int = 1024,
+                  backpressure: str = 'block',
+                  loop: Optional[asyncio.AbstractEventLoop] = None) -> Subscription:
+        """
+        订阅一个主题
+        
+        Args:
+            topic: 'action'（PlaybackEvent）或 'state'（EditorState）
+            callback: sync 模式为 callback(item)，thread 模式为 callback(batch)；
+                      asyncio 模式不需要回调，用 async for 读取
+            mode: 'sync'、'thread' 或 'asyncio'
+            batch_size: 每批最多的事件数（thread / asyncio）
+            maxsize: 队列容量（thread / asyncio）
+            backpressure: 'block'、'drop_oldest' 或 'coalesce'（thread / asyncio）
+            loop: asyncio 模式使用的事件循环（默认当前正在运行的循环）
+        
+        Returns:
+            订阅对象，调用 close() 取消订阅
+        """
+        if topic not in self._subscriptions:
+            raise ValueError(f"Unknown topic: {topic!r} (expected one of {TOPICS})")
+        policy = Backpressure(backpressure)
+        
+        if mode == 'sync':
+            if callback is None:
+                raise ValueError("sync subscriptions require a callback")
+            subscription = Subscription(topic, callback)
+        elif mode == 'thread':
+            if callback is None:
+                raise ValueError("thread subscriptions require a callback")
+            subscription = ThreadSubscription(topic, callback, batch_size, maxsize, policy)
+        elif mode == 'asyncio':
+            subscription = AsyncioSubscription(topic, loop, batch_size, maxsize, policy)
+        else:
+            raise ValueError(f"Unknown delivery mode: {mode!r}")
+        
+        subscription._bus = self
+        # 复制后替换，发布过程中增删订阅不影响正在进行的遍历
+        self._subscriptions[topic] = self._subscriptions[topic] + [subscription]
+        return subscription
+    
+    def _remove(self, subscription: Subscription) -> None:
+        self._subscriptions[subscription.topic] = [
+            s for s in self._subscriptions[subscription.topic] if s is not subscription
+        ]
+    
+    def has_subscribers(self, topic: str) -> bool:
+        """主题是否有订阅者"""
+        return bool(self._subscriptions[topic])
+    
+    def publish(self, topic: str, item: Any) -> None:
+        """向主题的所有订阅者投递事件"""
+        for subscription in self._subscriptions[topic]:
+            subscription.publish(item)
+    
+    def subscriptions(self, topic: Optional[str] = None) -> list[Subscription]:
+        """当前的订阅（默认所有主题）"""
+        if topic is not None:
+            return list(self._subscriptions[topic])
+        return [s for subscriptions in self._subscriptions.values() for s in subscriptions]
+    
+    def close(self) -> None:
+        """关闭所有订阅（等待线程订阅投递完毕）"""
+        for subscription in self.subscriptions():
+            subscription.close()
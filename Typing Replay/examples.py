@@ -13,7 +13,7 @@ from actions import (
 )
 from scheduler import PlaybackScheduler, InteractiveScheduler
 from script_parser import ScriptParser, ScriptBuilder, load_demo_script
-from console import ConsoleRenderer, EventLogger, SimpleDisplay
+from console import ConsoleRenderer, IncrementalRenderer, EventLogger, SimpleDisplay
 
 
 def example_basic_typing():
@@ -85,8 +85,8 @@ def example_selection_and_replace():
         type_text("Python", wpm=60),
     ])
     
-    # 实时播放
-    renderer = ConsoleRenderer()
+    # 实时播放（只重写变化的行）
+    renderer = IncrementalRenderer()
     scheduler.on_state_changed(
         lambda state: renderer.render_state(state, clear_previous=True)
     )
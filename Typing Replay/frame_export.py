@@ -0,0 +1,140 @@
+"""
+并行帧导出 (Parallel Frame Export)
+把固定帧率的时间线切分为若干分片，由多个进程同时渲染，再按顺序拼接
+
+主进程只执行一遍编译好的程序，在每个分片起点保存缓冲区关键帧；
+工作进程从关键帧出发执行本分片的指令并渲染各帧。
+输出与 PlaybackScheduler.play_with_frame_callback 逐帧调用的结果完全一致。
+"""
+
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, Optional, Union
+
+from buffer import TextBuffer, EditorState
+from actions import Action
+from compiler import Program, compile_actions
+
+
+FrameRenderer = Callable[[EditorState, float], Any]
+
+
+def frame_count(duration: float, fps: int) -> int:
+    """与 play_with_frame_callback 相同的帧数：所有满足 i / fps <= duration 的帧 i"""
+    frame_duration = 1.0 / fps
+    count = int(duration / frame_duration) + 1
+    # 浮点除法可能差一帧，按逐帧判断的条件修正
+    while count > 0 and (count - 1) * frame_duration > duration:
+        count -= 1
+    while count * frame_duration <= duration:
+        count += 1
+    return count
+
+
+def _render_range(program: Program, render: FrameRenderer, fps: int,
+                  start: int, stop: int, pc: int, buffer: TextBuffer) -> list:
+    """从关键帧 (pc, buffer) 出发渲染 [start, stop) 帧"""
+    frame_duration = 1.0 / fps
+    results = []
+    for frame_index in range(start, stop):
+        timestamp = frame_index * frame_duration
+        pc = program.run_until(buffer, timestamp, pc)
+        results.append(render(buffer.get_state(timestamp), timestamp))
+    return results
+
+
+# 工作进程中的程序和渲染函数，由 _init_worker 设置，每个进程只传输一次
+_worker_program: Optional[Program] = None
+_worker_render: Optional[FrameRenderer] = None
+
+
+def _init_worker(program: Program, render: FrameRenderer) -> None:
+    global _worker_program, _worker_render
+    _worker_program = program
+    _worker_render = render
+
+
+def _render_shard(fps: int, start: int, stop: int, pc: int, buffer: TextBuffer) -> list:
+    return _render_range(_worker_program, _worker_render, fps, start, stop, pc, buffer)
+
+
+def _picklable(*objects) -> bool:
+    try:
+        pickle.dumps(objects)
+    except Exception:
+        return False
+    return True
+
+
+def iter_frames(source: Union[Program, Iterable[Action]], render: FrameRenderer,
+                fps: int = 30, workers: Optional[int] = None,
+                shards_per_worker: int = 4,
+                buffer: Optional[TextBuffer] = None) -> Iterator[Any]:
+    """
+    并行渲染固定帧率的帧，按帧顺序产出渲染结果
+    
+    程序含有无法序列化的动作（如回调）或渲染函数无法序列化时，在当前进程中顺序渲染。
+    
+    Args:
+        source: 编译好的程序或动作序列
+        render: 渲染函数 render(state, timestamp)，返回值须可序列化；
+                使用多进程时必须定义在模块顶层
+        fps: 帧率
+        workers: 工作进程数（默认 CPU 核数）
+        shards_per_worker: 每个进程分到的分片数，越多负载越均衡
+        buffer: 起始缓冲区（默认新建）；结束时停在最后一帧的状态
+    
+    Yields:
+        各帧的渲染结果
+    """
+    program = source if isinstance(source, Program) else compile_actions(source)
+    if buffer is None:
+        buffer = TextBuffer()
+    if workers is None:
+        workers = os.cpu_count() or 1
+    
+    total = frame_count(program.total_duration, fps)
+    shard_count = min(total, max(1, workers * shards_per_worker))
+    if workers <= 1 or shard_count <= 1 or not _picklable(program, render):
+        yield from _render_range(program, render, fps, 0, total, 0, buffer)
+        return
+    
+    # 分片边界，以及主进程顺序执行得到的各分片起点关键帧
+    bounds = [total * index // shard_count for index in range(shard_count + 1)]
+    frame_duration = 1.0 / fps
+    keyframes = []
+    pc = 0
+    for start in bounds[:-1]:
+        pc = program.run_until(buffer, start * frame_duration, pc)
+        keyframes.append((pc, buffer.copy()))
+    program.run_until(buffer, (total - 1) * frame_duration, pc)
+    
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(program, render)) as pool:
+        futures = [pool.submit(_render_shard, fps, start, stop, pc, keyframe)
+                   for (pc, keyframe), start, stop in zip(keyframes, bounds, bounds[1:])]
+        try:
+            for future in futures:
+                yield from future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def export_frames(source: Union[Program, Iterable[Action]], render: FrameRenderer,
+                  fps: int = 30, workers: Optional[int] = None, **options) -> list:
+    """
+    并行渲染所有帧
+    
+    Args:
+        source: 编译好的程序或动作序列
+        render: 渲染函数 render(state, timestamp)
+        fps: 帧率
+        workers: 工作进程数（默认 CPU 核数）
+        **options: 传给 iter_frames 的其他参数
+    
+    Returns:
+        按帧顺序排列的渲染结果
+    """
+    return list(iter_frames(source, render, fps, workers, **options))
@@ -14,10 +14,10 @@ import time
 from buffer import TextBuffer, TextStyle
 from actions import (
     type_text, pause, backspace, move_cursor, select,
-    delete_selection, set_style, TypeTextAction, InsertTextAction,
-    BackspaceAction, DeleteAction, ReplaceTextAction
+    delete_selection, set_style, InsertTextAction, ReplaceTextAction
 )
 from scheduler import PlaybackScheduler, InteractiveScheduler
+from compiler import compile_actions
 from script_parser import ScriptParser, ScriptBuilder, load_demo_script
 from console import SimpleDisplay
 
@@ -531,64 +531,29 @@ Typing Replay Engine - 使用帮助
             self.reset_playback_state()
     
     def _play_char_by_char(self, actions, speed):
-        """逐字符播放动作"""
+        """逐字符播放动作（按编译后的逐键指令执行）"""
         try:
             buffer = TextBuffer()
+            program = compile_actions(actions)
             total_actions = len(actions)
+            previous_time = 0.0
             
-            for action_idx, action in enumerate(actions):
+            for pc in range(len(program)):
                 if not self.is_playing:
                     break
                 
-                # 处理不同类型的动作
-                if isinstance(action, TypeTextAction):
-                    # 逐字符打字
-                    for char_idx in range(len(action.text)):
-                        if not self.is_playing:
-                            break
-                        
-                        buffer.insert_text(action.text[char_idx])
-                        self.root.after(0, self.update_preview_from_buffer, buffer)
-                        
-                        # 计算延迟
-                        delay = action.get_char_delay(char_idx) / speed
-                        time.sleep(delay)
+                # 执行一条指令（一次按键或一个即时动作）
+                program.run(buffer, pc, pc + 1)
+                self.root.after(0, self.update_preview_from_buffer, buffer)
                 
-                elif isinstance(action, BackspaceAction):
-                    # 逐字符删除
-                    for step in range(action.count):
-                        if not self.is_playing:
-                            break
-                        
-                        buffer.delete_char(forward=False)
-                        self.root.after(0, self.update_preview_from_buffer, buffer)
-                        
-                        delay = action.char_delay / speed
-                        time.sleep(delay)
+                # 计算延迟
+                delay = (program.times[pc] - previous_time) / speed
+                previous_time = program.times[pc]
+                if delay > 0:
+                    time.sleep(delay)
                 
-                elif isinstance(action, DeleteAction):
-                    # 逐字符删除
-                    for step in range(action.count):
-                        if not self.is_playing:
-                            break
-                        
-                        buffer.delete_char(forward=True)
-                        self.root.after(0, self.update_preview_from_buffer, buffer)
-                        
-                        delay = action.char_delay / speed
-                        time.sleep(delay)
-                
-                else:
-                    # 其他动作一次性执行
-                    action.execute(buffer)
-                    self.root.after(0, self.update_preview_from_buffer, buffer)
-                    
-                    delay = action.get_duration() / speed
-                    if delay > 0:
-                        time.sleep(delay)
-                
-                # 更新进度
-                progress = ((action_idx + 1) / total_actions) * 100
+                # 更新进度（按来源动作计）
+                progress = ((program.source[pc] + 1) / total_actions) * 100
                 self.root.after(0, self.progress_var.set, progress)
             
             # 播放完成
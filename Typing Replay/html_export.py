@@ -0,0 +1,279 @@
+"""
+HTML 播放器导出 (HTML Exporter)
+把回放导出为单个自包含的 HTML 文件：一个小型 JS 播放器 + 紧凑的增量流
+
+增量流的每条记录是一个数组：
+    [dt, cursor]                                 只移动光标
+    [dt, cursor, pos, del, ins]                  把 [pos, pos + del) 替换为 ins
+    [dt, cursor, pos, del, ins, sel_start, sel_end]  同上，并设置选区
+dt 为距上一条记录的毫秒数；没有选区字段表示无选区。
+所有位置都是 UTF-16 码元偏移，浏览器直接用 Text.insertData / deleteData 应用，
+每条记录的 DOM 更新量与编辑大小成正比，与文档长度无关。
+"""
+
+import json
+import sys
+from pathlib import Path
+from typing import IO, Iterable, Iterator, Optional, Union
+from xml.sax.saxutils import escape
+
+from buffer import TextBuffer
+from actions import Action
+from compiler import iter_keystrokes
+
+
+def _utf16_length(text: str) -> int:
+    """文本在 JavaScript 中的长度（BMP 之外的字符占两个码元）"""
+    if text.isascii():
+        return len(text)
+    return len(text.encode('utf-16-le')) // 2
+
+
+class DeltaRecorder:
+    """
+    通过缓冲区的编辑监听器收集增量
+    
+    文档中没有 BMP 之外的字符时，UTF-16 偏移与字符偏移相同；否则从上一次换算的
+    位置（锚点）开始编码计算，光标附近的连续编辑每次只需编码一小段。
+    """
+    
+    def __init__(self, buffer: TextBuffer):
+        self.buffer = buffer
+        # 本条指令产生的编辑 [(pos, del, ins)]，位置为 UTF-16 偏移
+        self.edits: list[tuple[int, int, str]] = []
+        # 文档中 BMP 之外的字符数，以及锚点 (字符偏移, UTF-16 偏移)
+        self._astral = _utf16_length(buffer.text) - len(buffer.text)
+        self._anchor = (0, 0)
+        buffer.add_edit_listener(self._on_edit)
+    
+    def close(self) -> None:
+        """停止监听"""
+        self.buffer.remove_edit_listener(self._on_edit)
+    
+    def offset(self, position: int) -> int:
+        """字符偏移 -> UTF-16 偏移"""
+        if not self._astral:
+            return position
+        anchor, anchor16 = self._anchor
+        text = self.buffer.text
+        if position >= anchor:
+            result = anchor16 + _utf16_length(text[anchor:position])
+        else:
+            result = anchor16 - _utf16_length(text[position:anchor])
+        self._anchor = (position, result)
+        return result
+    
+    def _on_edit(self, start: int, end: int, text: str) -> None:
+        # 调用时缓冲区仍是修改前的文本；编辑不改变 start 之前的内容，锚点移到 start 后仍然有效
+        if self._astral:
+            removed = self.buffer.text[start:end]
+            position, deleted = self.offset(start), _utf16_length(removed)
+            self._astral -= deleted - len(removed)
+        else:
+            position, deleted = start, end - start
+            self._anchor = (start, start)
+        self._astral += _utf16_length(text) - len(text)
+        self.edits.append((position, deleted, text))
+
+
+def iter_deltas(actions: Iterable[Action],
+                buffer: Optional[TextBuffer] = None) -> Iterator[tuple[float, list]]:
+    """
+    流式生成增量记录
+    
+    Args:
+        actions: 动作序列（可以是迭代器）
+        buffer: 回放使用的缓冲区（默认新建）
+    
+    Yields:
+        (timestamp, record)：record 的格式见模块说明，dt 位置为 0，由调用方做差分
+    """
+    if buffer is None:
+        buffer = TextBuffer()
+    recorder = DeltaRecorder(buffer)
+    cursor = recorder.offset(buffer.cursor)
+    selection = None
+    try:
+        for timestamp, _ in iter_keystrokes(actions, buffer):
+            edits = recorder.edits
+            recorder.edits = []
+            
+            new_cursor = recorder.offset(buffer.cursor)
+            current = buffer.selection
+            if current is not None and not current.is_empty:
+                new_selection = [recorder.offset(current.start), recorder.offset(current.end)]
+            else:
+                new_selection = None
+            
+            if not edits and new_cursor == cursor and new_selection == selection:
+                continue
+            cursor, selection = new_cursor, new_selection
+            
+            # 一条指令可能产生多处编辑（如先删除选区再插入），光标和选区只放在最后一条
+            for position, deleted, text in edits[:-1]:
+                yield timestamp, [0, cursor, position, deleted, text]
+            record = [0, cursor]
+            if edits or selection is not None:
+                record.extend(edits[-1] if edits else (0, 0, ''))
+            if selection is not None:
+                record.extend(selection)
+            yield timestamp, record
+    finally:
+        recorder.close()
+
+
+PLAYER_STYLE = """
+body{margin:0;background:#1e1e1e;color:#d4d4d4;font:14px/1.4 monospace}
+#replay{position:relative;margin:16px;white-space:pre-wrap;word-wrap:break-word}
+#replay-caret{position:absolute;width:2px;background:#d4d4d4;animation:blink 1s steps(1) infinite}
+@keyframes blink{50%{opacity:0}}
+::highlight(replay-selection){background:#264f78}
+""".strip()
+
+PLAYER_SCRIPT = """
+(function () {
+  var data = JSON.parse(document.getElementById('replay-data').textContent);
+  var records = data.records, speed = data.speed;
+  var box = document.getElementById('replay');
+  var caret = document.getElementById('replay-caret');
+  var node, index, clock, cursor, selection, start;
+  var highlights = window.CSS && CSS.highlights && window.Highlight;
+  
+  function reset() {
+    if (node) box.removeChild(node);
+    node = document.createTextNode(data.text);
+    box.insertBefore(node, caret);
+    index = 0; clock = 0; cursor = data.cursor; selection = null; start = null;
+  }
+  
+  function apply(record) {
+    cursor = record[1];
+    if (record.length > 2) {
+      if (record[3]) node.deleteData(record[2], record[3]);
+      if (record[4]) node.insertData(record[2], record[4]);
+    }
+    selection = record.length > 5 ? record.slice(5) : null;
+  }
+  
+  function render() {
+    var range = document.createRange();
+    range.setStart(node, Math.min(cursor, node.length));
+    range.collapse(true);
+    var rects = range.getClientRects(), origin = box.getBoundingClientRect();
+    var rect = rects.length ? rects[0] : origin;
+    caret.style.left = (rect.left - origin.left) + 'px';
+    caret.style.top = (rect.top - origin.top) + 'px';
+    caret.style.height = (rects.length ? rect.height : 18) + 'px';
+    if (highlights) {
+      CSS.highlights.delete('replay-selection');
+      if (selection) {
+        var selected = document.createRange();
+        selected.setStart(node, selection[0]);
+        selected.setEnd(node, selection[1]);
+        CSS.highlights.set('replay-selection', new Highlight(selected));
+      }
+    }
+  }
+  
+  function frame(now) {
+    if (start === null) start = now;
+    var elapsed = (now - start) * speed;
+    var changed = false;
+    while (index < records.length && clock + records[index][0] <= elapsed) {
+      clock += records[index][0];
+      apply(records[index++]);
+      changed = true;
+    }
+    if (changed) render();
+    if (index < records.length) requestAnimationFrame(frame);
+  }
+  
+  box.addEventListener('click', function () { reset(); render(); requestAnimationFrame(frame); });
+  reset();
+  render();
+  requestAnimationFrame(frame);
+})();
+""".strip()
+
+
+def write_html(actions: Iterable[Action], stream: IO[str], title: str = "Typing Replay",
+               speed: float = 1.0, buffer: Optional[TextBuffer] = None) -> int:
+    """
+    把动作序列的回放写为自包含的 HTML 播放器
+    
+    记录边生成边写入，内存占用与回放长度无关。
+    
+    Args:
+        actions: 动作序列（可以是 ScriptParser.iter_parse 等迭代器）
+        stream: 文本输出流
+        title: 页面标题
+        speed: 播放速度倍率
+        buffer: 回放使用的缓冲区（默认新建）
+    
+    Returns:
+        写入的记录数
+    """
+    if speed <= 0:
+        raise ValueError("Speed must be positive")
+    if buffer is None:
+        buffer = TextBuffer()
+    
+    def dumps(value) -> str:
+        # 放在 <script> 中：转义 < > &，文本中的 "</script>" 或 "<!--" 不会改变脚本的解析方式
+        text = json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+        return text.replace('<', '\\u003c').replace('>', '\\u003e').replace('&', '\\u0026')
+    
+    stream.write(
+        '<!DOCTYPE html>\n<html><head><meta charset="utf-8">'
+        f'<title>{escape(title)}</title>\n<style>{PLAYER_STYLE}</style></head>\n'
+        '<body><div id="replay"><span id="replay-caret"></span></div>\n'
+        '<script type="application/json" id="replay-data">'
+        f'{{"speed":{dumps(speed)},"text":{dumps(buffer.text)},'
+        f'"cursor":{_utf16_length(buffer.text[:buffer.cursor])},"records":['
+    )
+    
+    count = 0
+    previous = 0
+    for timestamp, record in iter_deltas(actions, buffer):
+        # 时间以毫秒累计取整后再做差分，避免舍入误差累积
+        milliseconds = round(timestamp * 1000)
+        record[0] = milliseconds - previous
+        previous = milliseconds
+        stream.write((',' if count else '') + dumps(record))
+        count += 1
+    
+    stream.write(f']}}</script>\n<script>{PLAYER_SCRIPT}</script>\n</body></html>\n')
+    return count
+
+
+def export_html(actions: Iterable[Action], output: Union[str, Path], **options) -> int:
+    """
+    把动作序列的回放导出为 .html 文件
+    
+    Args:
+        actions: 动作序列
+        output: 输出文件路径
+        **options: 传给 write_html 的参数
+    
+    Returns:
+        写入的记录数
+    """
+    with open(output, 'w', encoding='utf-8') as f:
+        return write_html(actions, f, **options)
+
+
+def main(argv: list[str]) -> int:
+    """html_export.py SCRIPT OUTPUT.html [SPEED]：把脚本导出为 HTML 播放器"""
+    if len(argv) < 2:
+        print("usage: html_export.py SCRIPT OUTPUT.html [SPEED]")
+        return 2
+    from script_parser import ScriptParser
+    
+    speed = float(argv[2]) if len(argv) > 2 else 1.0
+    count = export_html(ScriptParser.iter_file(argv[0]), argv[1], speed=speed)
+    print(f"Wrote {count} records to {argv[1]}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
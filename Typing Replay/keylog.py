@@ -0,0 +1,483 @@
+"""
+按键日志导入 (Keylog Importer)
+把录制的按键事件流式转换为引擎的动作
+
+支持的日志格式（每个事件包含时间戳、按键和修饰键）：
+    - CSV：带表头，列为 timestamp,key,modifiers（修饰键用 + 或 | 分隔）
+    - JSON Lines：每行 {"timestamp": ..., "key": ..., "modifiers": [...] 或 "shift+ctrl"}
+
+支持的编辑按键：
+    退格、删除；方向键、Home、End（光标移动）；
+    Shift + 上述移动键（选区）；Ctrl/Cmd + Home/End（文档首尾）、Ctrl/Cmd + A（全选）
+"""
+
+import csv
+import json
+import sys
+import warnings
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Union
+
+from actions import Action
+
+
+@dataclass
+class KeyEvent:
+    """单个按键事件"""
+    timestamp: float  # 秒
+    key: str
+    modifiers: frozenset = frozenset()
+
+
+# 产生字符的命名按键
+NAMED_CHARS = {
+    'enter': '\n',
+    'return': '\n',
+    'tab': '\t',
+    'space': ' ',
+}
+
+# 编辑按键 -> 动作类型
+BACKSPACE_KEYS = {'backspace'}
+DELETE_KEYS = {'delete', 'del'}
+ARROW_OFFSETS = {
+    'left': -1,
+    'arrowleft': -1,
+    'right': 1,
+    'arrowright': 1,
+}
+
+# 移动按键 -> 光标移动方式
+MOTION_KEYS = {
+    'left': 'left',
+    'arrowleft': 'left',
+    'right': 'right',
+    'arrowright': 'right',
+    'up': 'up',
+    'arrowup': 'up',
+    'down': 'down',
+    'arrowdown': 'down',
+    'home': 'home',
+    'end': 'end',
+}
+
+# 带这些修饰键的按键是快捷键，不产生文本
+SHORTCUT_MODIFIERS = {'ctrl', 'control', 'alt', 'meta', 'cmd', 'command', 'super'}
+
+# 可以映射的快捷键：(修饰键, 按键) -> 光标移动方式
+COMMAND_MODIFIERS = {'ctrl', 'control', 'cmd', 'command', 'meta'}
+COMMAND_MOTIONS = {
+    'home': 'top',
+    'end': 'bottom',
+    'a': 'all',
+}
+
+# 会移动光标或修改文本、但无法映射为动作的按键
+UNSUPPORTED_KEYS = {'pageup', 'pagedown'}
+# 剪切、粘贴、撤销、重做
+UNSUPPORTED_SHORTCUTS = {'x', 'v', 'z', 'y'}
+
+
+def _parse_modifiers(value) -> frozenset:
+    if not value:
+        return frozenset()
+    if isinstance(value, str):
+        value = value.replace('|', '+').split('+')
+    return frozenset(part.strip().lower() for part in value if part.strip())
+
+
+def iter_key_events(source: Union[str, Path, Iterable[str]], format: Optional[str] = None,
+                    time_scale: float = 1.0) -> Iterator[KeyEvent]:
+    """
+    流式读取按键日志
+    
+    Args:
+        source: 日志文件路径，或逐行产出文本的可迭代对象
+        format: 'csv' 或 'jsonl'（默认按文件后缀判断，非文件时默认 jsonl）
+        time_scale: 时间戳换算为秒的系数（毫秒时间戳用 0.001）
+    
+    Yields:
+        KeyEvent
+    """
+    if isinstance(source, (str, Path)):
+        if format is None:
+            format = 'csv' if Path(source).suffix.lower() == '.csv' else 'jsonl'
+        with open(source, 'r', encoding='utf-8', newline='') as f:
+            yield from iter_key_events(f, format, time_scale)
+        return
+    
+    if format == 'csv':
+        for row in csv.DictReader(source):
+            yield KeyEvent(float(row['timestamp']) * time_scale, row['key'],
+                           _parse_modifiers(row.get('modifiers')))
+        return
+    
+    for line_number, line in enumerate(source, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON on line {line_number}: {e}") from e
+        yield KeyEvent(float(record['timestamp']) * time_scale, record['key'],
+                       _parse_modifiers(record.get('modifiers')))
+
+
+class _Document:
+    """
+    导入过程中跟踪的文档结构：各行长度、光标和选区锚点
+    
+    语义与回放时的 TextBuffer 一致：有选区时输入和删除先删除选区，不带 Shift 的移动清除选区。
+    只保存行长度，不保存文本。
+    """
+    
+    def __init__(self):
+        self.lines = [0]  # 各行长度（不含换行符）
+        self.row = 0
+        self.col = 0
+        self.offset = 0
+        self.anchor: Optional[int] = None  # 选区锚点，None 表示没有选区
+        self._goal: Optional[int] = None   # 连续上下移动时保持的列
+    
+    @property
+    def length(self) -> int:
+        return sum(self.lines) + len(self.lines) - 1
+    
+    def _locate(self, offset: int) -> tuple[int, int]:
+        """字符偏移 -> (行, 列)"""
+        for row, size in enumerate(self.lines):
+            if offset <= size:
+                return row, offset
+            offset -= size + 1
+        return len(self.lines) - 1, self.lines[-1]
+    
+    def _delete_selection(self) -> bool:
+        anchor, self.anchor = self.anchor, None
+        if anchor is None or anchor == self.offset:
+            return False
+        start, end = min(anchor, self.offset), max(anchor, self.offset)
+        start_row, start_col = self._locate(start)
+        end_row, end_col = self._locate(end)
+        self.lines[start_row] = start_col + self.lines[end_row] - end_col
+        del self.lines[start_row + 1:end_row + 1]
+        self.row, self.col, self.offset = start_row, start_col, start
+        return True
+    
+    def insert(self, char: str) -> None:
+        self._goal = None
+        self._delete_selection()
+        if char == '\n':
+            self.lines.insert(self.row + 1, self.lines[self.row] - self.col)
+            self.lines[self.row] = self.col
+            self.row += 1
+            self.col = 0
+        else:
+            self.lines[self.row] += 1
+            self.col += 1
+        self.offset += 1
+    
+    def backspace(self) -> None:
+        self._goal = None
+        if self._delete_selection():
+            return
+        lines = self.lines
+        if self.col:
+            lines[self.row] -= 1
+            self.col -= 1
+        elif self.row:
+            self.row -= 1
+            self.col = lines[self.row]
+            lines[self.row] += lines.pop(self.row + 1)
+        else:
+            return
+        self.offset -= 1
+    
+    def delete(self) -> None:
+        self._goal = None
+        if self._delete_selection():
+            return
+        lines = self.lines
+        if self.col < lines[self.row]:
+            lines[self.row] -= 1
+        elif self.row + 1 < len(lines):
+            lines[self.row] += lines.pop(self.row + 1)
+    
+    def move(self, motion: str, select: bool) -> None:
+        """
+        按移动方式移动光标
+        
+        Args:
+            motion: left / right / up / down / home / end / top / bottom / all
+            select: 是否扩展选区（Shift），否则清除选区
+        """
+        if motion == 'all':
+            self.anchor = 0
+            motion = 'bottom'
+        elif not select:
+            self.anchor = None
+        elif self.anchor is None:
+            self.anchor = self.offset
+        
+        if motion not in ('up', 'down'):
+            self._goal = None
+        lines = self.lines
+        if motion == 'left':
+            if self.col:
+                self.col -= 1
+            elif self.row:
+                self.row -= 1
+                self.col = lines[self.row]
+            else:
+                return
+            self.offset -= 1
+        elif motion == 'right':
+            if self.col < lines[self.row]:
+                self.col += 1
+            elif self.row + 1 < len(lines):
+                self.row += 1
+                self.col = 0
+            else:
+                return
+            self.offset += 1
+        elif motion == 'up' or motion == 'down':
+            if self._goal is None:
+                self._goal = self.col
+            if motion == 'up' and self.row:
+                self.offset -= self.col + 1 + lines[self.row - 1]
+                self.row -= 1
+            elif motion == 'down' and self.row + 1 < len(lines):
+                self.offset += lines[self.row] - self.col + 1
+                self.row += 1
+            else:
+                return
+            self.col = min(self._goal, lines[self.row])
+            self.offset += self.col
+        elif motion == 'home':
+            self.offset -= self.col
+            self.col = 0
+        elif motion == 'end':
+            self.offset += lines[self.row] - self.col
+            self.col = lines[self.row]
+        elif motion == 'top':
+            self.row = self.col = self.offset = 0
+        elif motion == 'bottom':
+            self.row = len(lines) - 1
+            self.col = lines[-1]
+            self.offset = self.length
+        else:
+            raise ValueError(f"Unknown motion: {motion!r}")
+
+
+class KeylogImporter:
+    """
+    按键事件 -> 脚本动作字典的流式转换器
+    
+    - 连续的可打印按键合并为一个带 char_delays 的打字动作，延迟取录制的按键间隔
+    - 连续的退格、删除、左右方向键分别合并为一个动作
+    - 连续的上下、Home、End 合并为一个移动到绝对位置的光标动作
+    - 连续的 Shift 移动（及全选）合并为一个设置选区的动作
+    - 超过 pause_threshold 的间隔变为停顿动作
+    - 不改变文档和光标的快捷键（如复制、保存）和无法识别的按键被跳过并计数
+    - 会改变光标或文本但无法映射的按键（翻页、Ctrl+方向键、剪切、粘贴、撤销等）
+      默认抛出 ValueError；strict 为 False 时发出警告并跳过，之后的光标位置可能不准确
+    
+    为了把上下、行首行尾换算为字符偏移，导入时跟踪文档各行的长度；
+    除此之外只缓存当前一段（最多 max_run 个按键）。
+    """
+    
+    def __init__(self, pause_threshold: float = 2.0, max_run: int = 1000, strict: bool = True):
+        """
+        Args:
+            pause_threshold: 超过该间隔（秒）时插入停顿
+            max_run: 单个合并动作的最大按键数
+            strict: 遇到无法映射、但会改变光标或文本的按键时是否抛出异常（否则警告）
+        """
+        self.pause_threshold = pause_threshold
+        self.max_run = max_run
+        self.strict = strict
+        self.skipped = 0
+        self._document = _Document()
+        # 当前正在合并的一段：类型、文本片段、各按键间隔
+        self._kind: Optional[str] = None
+        self._chars: list[str] = []
+        self._delays: list[float] = []
+        self._last_time: Optional[float] = None
+    
+    def iter_records(self, events: Iterable[KeyEvent]) -> Iterator[dict]:
+        """把按键事件转换为脚本动作字典（可直接写入 JSON Lines 脚本）"""
+        for event in events:
+            kind, value = self._classify(event)
+            if kind == 'unsupported':
+                self._unsupported(event, value)
+                kind = None
+            if kind is None:
+                self.skipped += 1
+                continue
+            
+            gap = 0.0 if self._last_time is None else max(0.0, event.timestamp - self._last_time)
+            self._last_time = event.timestamp
+            
+            if gap > self.pause_threshold:
+                yield from self._flush()
+                yield {'type': 'pause', 'duration': gap}
+                gap = 0.0
+            
+            if kind != self._kind or len(self._delays) >= self.max_run:
+                yield from self._flush()
+                self._kind = kind
+            self._apply(kind, value)
+            self._delays.append(gap)
+        
+        yield from self._flush()
+    
+    def _classify(self, event: KeyEvent) -> tuple[Optional[str], str]:
+        """
+        返回 (段类型, 值)；段类型为 None 表示跳过
+        
+        值对 type 为字符，对 move / select 为移动方式，对 unsupported 为原因。
+        """
+        key = event.key
+        name = key.lower()
+        modifiers = event.modifiers
+        shortcut = modifiers & SHORTCUT_MODIFIERS
+        if shortcut:
+            if shortcut <= COMMAND_MODIFIERS and name in COMMAND_MOTIONS:
+                motion = COMMAND_MOTIONS[name]
+                return ('select' if 'shift' in modifiers or motion == 'all' else 'move'), motion
+            if name in MOTION_KEYS or name in UNSUPPORTED_KEYS:
+                return 'unsupported', "moves the cursor"
+            if name in UNSUPPORTED_SHORTCUTS:
+                return 'unsupported', "changes the text"
+            return None, ''
+        if len(key) == 1:
+            if 'shift' in modifiers and key.isalpha():
+                key = key.upper()
+            return 'type', key
+        if name in NAMED_CHARS:
+            return 'type', NAMED_CHARS[name]
+        if name in BACKSPACE_KEYS:
+            return 'backspace', ''
+        if name in DELETE_KEYS:
+            return 'delete', ''
+        if name in MOTION_KEYS:
+            motion = MOTION_KEYS[name]
+            if 'shift' in modifiers:
+                return 'select', motion
+            if name in ARROW_OFFSETS:
+                return motion, motion
+            return 'move', motion
+        if name in UNSUPPORTED_KEYS:
+            return 'unsupported', "moves the cursor"
+        return None, ''
+    
+    def _apply(self, kind: str, value: str) -> None:
+        """把按键作用到跟踪的文档上"""
+        document = self._document
+        if kind == 'type':
+            document.insert(value)
+            self._chars.append(value)
+        elif kind == 'backspace':
+            document.backspace()
+        elif kind == 'delete':
+            document.delete()
+        else:
+            document.move(value, select=kind == 'select')
+    
+    def _unsupported(self, event: KeyEvent, reason: str) -> None:
+        keys = '+'.join(sorted(event.modifiers) + [event.key])
+        message = f"Unsupported key {keys} at {event.timestamp:.3f}s {reason}"
+        if self.strict:
+            raise ValueError(message)
+        warnings.warn(f"{message}; skipped, later cursor positions may be wrong", stacklevel=3)
+    
+    def _flush(self) -> Iterator[dict]:
+        kind, delays = self._kind, self._delays
+        if kind is None or not delays:
+            return
+        count = len(delays)
+        total = sum(delays)
+        
+        if kind == 'type':
+            yield {
+                'type': 'type',
+                'text': ''.join(self._chars),
+                'avg_char_delay': total / count,
+                'delay_variance': 0.0,
+                'expand_emoji': False,
+                'char_delays': delays,
+            }
+        elif kind == 'backspace' or kind == 'delete':
+            yield {'type': kind, 'count': count, 'char_delay': total / count}
+        elif kind == 'move':
+            yield {'type': 'cursor', 'position': self._document.offset, 'duration': total}
+        elif kind == 'select':
+            document = self._document
+            yield {'type': 'select', 'start': document.anchor, 'end': document.offset,
+                   'duration': total}
+        else:
+            yield {'type': 'cursor', 'offset': count if kind == 'right' else -count,
+                   'duration': total}
+        
+        self._kind = None
+        self._chars = []
+        self._delays = []
+
+
+def import_keylog(source: Union[str, Path, Iterable[str]], format: Optional[str] = None,
+                  time_scale: float = 1.0, parser=None, **options) -> Iterator[Action]:
+    """
+    流式导入按键日志为动作
+    
+    Args:
+        source: 日志文件路径，或逐行产出文本的可迭代对象
+        format: 'csv' 或 'jsonl'（默认按文件后缀判断）
+        time_scale: 时间戳换算为秒的系数
+        parser: 解析器类（默认 ScriptParser）
+        **options: 传给 KeylogImporter 的参数
+    
+    Yields:
+        Action
+    """
+    if parser is None:
+        from script_parser import ScriptParser
+        parser = ScriptParser
+    
+    importer = KeylogImporter(**options)
+    for record in importer.iter_records(iter_key_events(source, format, time_scale)):
+        yield parser.parse_action(record)
+
+
+def convert_keylog(source: Union[str, Path], output: Union[str, Path],
+                   format: Optional[str] = None, time_scale: float = 1.0,
+                   **options) -> int:
+    """
+    把按键日志流式转换为 JSON Lines 脚本文件
+    
+    Returns:
+        写入的动作数
+    """
+    importer = KeylogImporter(**options)
+    count = 0
+    with open(output, 'w', encoding='utf-8') as f:
+        for record in importer.iter_records(iter_key_events(source, format, time_scale)):
+            f.write(json.dumps(record, ensure_ascii=False))
+            f.write('\n')
+            count += 1
+    return count
+
+
+def main(argv: list[str]) -> int:
+    """keylog.py LOG OUTPUT.jsonl [TIME_SCALE]：转换按键日志"""
+    if len(argv) < 2:
+        print("usage: keylog.py LOG OUTPUT.jsonl [TIME_SCALE]")
+        return 2
+    time_scale = float(argv[2]) if len(argv) > 2 else 1.0
+    count = convert_keylog(argv[0], argv[1], time_scale=time_scale)
+    print(f"Wrote {count} actions to {argv[1]}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
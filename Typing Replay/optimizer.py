@@ -0,0 +1,245 @@
+"""
+动作优化器 (Optimizer)
+对非实时播放的动作序列做窥孔优化
+"""
+
+from typing import Iterable, Optional
+
+from buffer import TextStyle
+from actions import (
+    Action, TypeTextAction, InsertTextAction, BackspaceAction, DeleteAction,
+    ReplaceTextAction, MoveCursorAction, SetSelectionAction, SelectRangeAction,
+    ClearSelectionAction, DeleteSelectionAction, PauseAction, SetStyleAction, CompositeAction
+)
+
+
+# 作为屏障保留、但确定不会修改当前样式的内置动作（按确切类型判断）
+_STYLE_NEUTRAL = frozenset({
+    DeleteAction, ReplaceTextAction, MoveCursorAction, SetSelectionAction,
+    SelectRangeAction, ClearSelectionAction, DeleteSelectionAction,
+})
+
+
+class ActionOptimizer:
+    """
+    窥孔优化器
+    
+    只改写确切类型为下列动作的相邻序列，其余动作原样保留并作为屏障：
+        - 相邻插入 (TypeTextAction / InsertTextAction) 合并为一次插入
+        - 插入后紧跟的退格直接抵消已插入的字符
+        - 连续的光标移动折叠为一次移动
+        - 停顿并入相邻的优化后动作，零时长停顿直接丢弃
+    
+    缓冲区只在非 NORMAL 样式下记录样式范围，且删除不会撤销已记录的范围，
+    因此插入的合并与抵消只在确定为 NORMAL 样式时进行；其他样式（或屏障动作
+    之后样式未知）时插入原样保留。
+    
+    不变量：最终的文本、光标、选区、样式和样式范围与逐个执行原动作相同；
+    总时长等于各原动作时长之和（每个动作的时长只采样一次）。
+    """
+    
+    def __init__(self, style: Optional[TextStyle] = TextStyle.NORMAL):
+        """
+        Args:
+            style: 播放开始时缓冲区的当前样式，None 表示未知
+        """
+        self.output: list[Action] = []
+        # 当前样式，None 表示未知（屏障动作可能修改了样式）
+        self._style = style
+        # 由优化器创建、可以安全修改时长的输出动作
+        self._owned: Optional[Action] = None
+        # 尚未合并的插入文本片段与时长
+        self._run_parts: Optional[list[str]] = None
+        self._run_duration = 0.0
+        self._run_droppable = False
+        # 尚未归属的停顿时长
+        self._pending_wait = 0.0
+        # 当前是否确定没有非空选区
+        self._no_selection = False
+    
+    def optimize(self, actions: Iterable[Action]) -> list[Action]:
+        """优化动作序列"""
+        for action in actions:
+            self.feed(action)
+        self._flush_run()
+        if self._pending_wait > 0:
+            self.output.append(PauseAction(self._pending_wait))
+            self._pending_wait = 0.0
+        return self.output
+    
+    def feed(self, action: Action) -> None:
+        """处理单个动作"""
+        action_type = type(action)
+        
+        if action_type is CompositeAction:
+            for sub_action in action.actions:
+                self.feed(sub_action)
+        elif action_type is TypeTextAction or action_type is InsertTextAction:
+            if self._style is TextStyle.NORMAL:
+                self._feed_insert(action.text, action.get_duration())
+            else:
+                # 非 NORMAL 样式的每次插入各自记录样式范围，不能合并或抵消
+                self._barrier(action)
+                self._no_selection = True
+        elif action_type is BackspaceAction:
+            self._feed_backspace(action)
+        elif action_type is MoveCursorAction and (
+                action.position is not None or action.offset is not None):
+            self._flush_run()
+            self._feed_move(action)
+        elif action_type is PauseAction:
+            self._wait(action.get_duration())
+        elif action_type is SetStyleAction:
+            self._barrier(action)
+            self._style = action.style
+        else:
+            self._barrier(action)
+            if action_type not in _STYLE_NEUTRAL:
+                self._style = None
+    
+    # ==================== 各类动作 ====================
+    
+    def _feed_insert(self, text: str, duration: float) -> None:
+        if self._run_parts is None:
+            self._run_parts = []
+            self._run_duration = 0.0
+            # 这一串插入开始前的选区状态决定它能否被完全消去
+            self._run_droppable = self._no_selection
+        self._run_parts.append(text)
+        self._run_duration += duration
+    
+    def _feed_backspace(self, action: BackspaceAction) -> None:
+        count = action.count
+        if self._run_parts is not None:
+            # 插入后光标在插入文本末尾且没有非空选区，退格逐个删掉刚插入的字符
+            self._run_duration += action.get_duration()
+            while count > 0 and self._run_parts:
+                last = self._run_parts.pop()
+                if len(last) > count:
+                    self._run_parts.append(last[:len(last) - count])
+                    count = 0
+                else:
+                    count -= len(last)
+            if count == 0:
+                return
+            # 剩余退格的时长单独计算，已抵消部分的时长留在插入上
+            self._run_duration -= count * action.char_delay
+            self._flush_run()
+        
+        duration = count * action.char_delay
+        owned = self._owned
+        if (isinstance(owned, BackspaceAction) and self.output
+                and self.output[-1] is owned and count > 0):
+            total = owned.get_duration() + duration
+            owned.count += count
+            owned.char_delay = total / owned.count
+        elif count > 0:
+            self._emit(BackspaceAction(count=count, char_delay=action.char_delay), duration)
+        else:
+            self._wait(duration)
+            return
+        self._no_selection = True
+    
+    def _feed_move(self, action: MoveCursorAction) -> None:
+        owned = self._owned
+        if isinstance(owned, MoveCursorAction) and self.output and self.output[-1] is owned:
+            merged = _fold_moves(owned, action)
+            if merged is not None:
+                owned.position, owned.offset, owned.clear_selection = merged
+                owned.duration += action.get_duration()
+                if action.clear_selection:
+                    self._no_selection = True
+                return
+        
+        self._emit(MoveCursorAction(position=action.position, offset=action.offset,
+                                    clear_selection=action.clear_selection,
+                                    duration=action.get_duration()))
+        if action.clear_selection:
+            self._no_selection = True
+    
+    def _wait(self, duration: float) -> None:
+        if duration <= 0:
+            return
+        if self._run_parts is not None:
+            self._run_duration += duration
+        elif self._owned is not None and self.output and self.output[-1] is self._owned:
+            self._add_duration(self._owned, duration)
+        else:
+            self._pending_wait += duration
+    
+    def _barrier(self, action: Action) -> None:
+        self._flush_run()
+        if self._pending_wait > 0:
+            self.output.append(PauseAction(self._pending_wait))
+            self._pending_wait = 0.0
+        self.output.append(action)
+        self._owned = None
+        self._no_selection = False
+    
+    # ==================== 输出 ====================
+    
+    def _flush_run(self) -> None:
+        if self._run_parts is None:
+            return
+        text = ''.join(self._run_parts)
+        duration = self._run_duration
+        self._run_parts = None
+        if not text and self._run_droppable:
+            # 插入后又全部删除，且开始前没有选区可删：只剩时长
+            self._wait(duration)
+        else:
+            self._emit(InsertTextAction(text=text, duration=0.0), duration)
+        self._no_selection = True
+    
+    def _emit(self, action: Action, duration: Optional[float] = None) -> None:
+        """追加一个优化器创建的动作，并把待归属的停顿并入其时长"""
+        self.output.append(action)
+        self._owned = action
+        if duration is not None:
+            self._set_duration(action, duration)
+        if self._pending_wait > 0:
+            self._add_duration(action, self._pending_wait)
+            self._pending_wait = 0.0
+    
+    @staticmethod
+    def _set_duration(action: Action, duration: float) -> None:
+        if isinstance(action, BackspaceAction):
+            action.char_delay = duration / action.count
+        else:
+            action.duration = duration
+    
+    @classmethod
+    def _add_duration(cls, action: Action, duration: float) -> None:
+        cls._set_duration(action, action.get_duration() + duration)
+
+
+def _fold_moves(first: MoveCursorAction, second: MoveCursorAction):
+    """
+    折叠两个连续的光标移动
+    
+    Returns:
+        (position, offset, clear_selection)，无法等价折叠时返回 None
+    """
+    clear = first.clear_selection or second.clear_selection
+    if second.position is not None:
+        # 绝对定位覆盖前一次移动的光标结果
+        return second.position, None, clear
+    if first.offset is not None and (first.offset >= 0) == (second.offset >= 0):
+        # 同向的相对移动：两次边界截断等价于一次
+        return None, first.offset + second.offset, clear
+    return None
+
+
+def optimize_actions(actions: Iterable[Action],
+                     style: Optional[TextStyle] = TextStyle.NORMAL) -> list[Action]:
+    """
+    对动作序列做窥孔优化（用于只关心最终结果的非实时播放）
+    
+    Args:
+        actions: 动作序列
+        style: 播放开始时缓冲区的当前样式，None 表示未知
+    
+    Returns:
+        优化后的动作列表
+    """
+    return ActionOptimizer(style).optimize(actions)
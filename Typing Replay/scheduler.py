@@ -4,20 +4,28 @@
 """
 
 from dataclasses import dataclass, field
-from typing import Optional, Callable, Iterator
+from itertools import islice
+from typing import Optional, Callable, Iterable, Iterator
 import time
 
-from buffer import TextBuffer, EditorState
-from actions import Action
+from buffer import TextBuffer, EditorState, EditorStateView
+from actions import Action, iter_expanded
+from compiler import Program, compile_actions
+from optimizer import optimize_actions
+from events import EventBus, Subscription, ACTION_EXECUTED, STATE_CHANGED
+
+
+# 回放时每次编译的动作数：编译开销被分摊，流式播放的内存占用仍与脚本长度无关
+COMPILE_CHUNK = 1024
 
 
 @dataclass
 class PlaybackEvent:
-    """回放事件"""
+    """回放事件（前后状态是轻量视图，需要 EditorState 时调用 materialize()）"""
     timestamp: float  # 相对开始时间（秒）
     action: Action
-    state_before: EditorState
-    state_after: EditorState
+    state_before: EditorStateView
+    state_after: EditorStateView
     
     def __repr__(self) -> str:
         return (f"PlaybackEvent(t={self.timestamp:.3f}s, "
@@ -39,12 +47,18 @@ class PlaybackScheduler:
         """
         self.buffer = buffer or TextBuffer()
         self._actions: list[Action] = []
+        # play() 使用的编译结果 (展开后的动作, 程序)，动作序列变化时失效
+        self._compiled: Optional[tuple[list[Action], Program]] = None
         self._events: list[PlaybackEvent] = []
         self._current_time: float = 0.0
+        # 实时播放开始时的墙钟时间
+        self._wall_start: float = 0.0
         
         # 回调函数
         self._on_action_executed: Optional[Callable[[PlaybackEvent], None]] = None
-        self._on_state_changed: Optional[Callable[[EditorState], None]] = None
+        self._on_state_changed: Optional[Callable[[EditorStateView], None]] = None
+        # 多订阅者事件总线
+        self.bus = EventBus()
     
     # ==================== 动作管理 ====================
     
@@ -59,6 +73,7 @@ class PlaybackScheduler:
             self (支持链式调用)
         """
         self._actions.append(action)
+        self._compiled = None
         return self
     
     def add_actions(self, actions: list[Action]) -> 'PlaybackScheduler':
@@ -72,11 +87,13 @@ class PlaybackScheduler:
             self (支持链式调用)
         """
         self._actions.extend(actions)
+        self._compiled = None
         return self
     
     def clear_actions(self) -> None:
         """清空所有动作"""
         self._actions.clear()
+        self._compiled = None
         self._events.clear()
         self._current_time = 0.0
     
@@ -99,12 +116,12 @@ class PlaybackScheduler:
         self._on_action_executed = callback
         return self
     
-    def on_state_changed(self, callback: Callable[[EditorState], None]) -> 'PlaybackScheduler':
+    def on_state_changed(self, callback: Callable[[EditorStateView], None]) -> 'PlaybackScheduler':
         """
         设置状态变化回调
         
         Args:
-            callback: 回调函数，接收 EditorState 参数
+            callback: 回调函数，接收 EditorStateView 参数（属性与 EditorState 相同）
         
         Returns:
             self (支持链式调用)
@@ -112,102 +129,272 @@ class PlaybackScheduler:
         self._on_state_changed = callback
         return self
     
+    def subscribe(self, topic: str, callback: Optional[Callable] = None,
+                  mode: str = 'sync', **options) -> Subscription:
+        """
+        订阅回放事件（可以有多个订阅者，与 on_* 回调并存）
+        
+        Args:
+            topic: 'action'（PlaybackEvent）或 'state'（EditorStateView）
+            callback: 回调函数；thread 模式接收事件列表，asyncio 模式不需要
+            mode: 'sync'（回放线程中直接调用）、'thread'（工作线程成批投递）
+                  或 'asyncio'（在事件循环中 async for 读取）
+            **options: batch_size、maxsize、backpressure（'block'、'drop_oldest'、
+                       'coalesce'）、loop，见 EventBus.subscribe
+        
+        Returns:
+            订阅对象，调用 close() 取消订阅
+        """
+        return self.bus.subscribe(topic, callback, mode, **options)
+    
     # ==================== 回放控制 ====================
     
-    def play(self, real_time: bool = False, speed: float = 1.0) -> list[PlaybackEvent]:
+    def play(self, real_time: bool = False, speed: float = 1.0,
+             optimize: bool = False) -> list[PlaybackEvent]:
         """
         播放动作序列
         
+        动作序列编译一次后由解释器执行，编译结果在动作序列改变
+        (add_action / add_actions / clear_actions) 之前重复使用，
+        因此重复播放时打字延迟相同。
+        
         Args:
             real_time: 是否实时播放（按实际时间延迟）
             speed: 播放速度倍率 (仅在 real_time=True 时有效)
+            optimize: 是否先对动作做窥孔优化 (仅在 real_time=False 时有效)；
+                最终状态与总时长不变，但事件对应的是优化后的动作
         
         Returns:
             所有回放事件列表
         """
+        if optimize and real_time:
+            raise ValueError("optimize is only supported for non-real-time playback")
+        
         self._events.clear()
         self._current_time = 0.0
+        self._wall_start = time.perf_counter()
+        
+        # RepeatAction 展开后每一轮的子动作各自产生事件
+        if optimize:
+            optimized = optimize_actions(self._actions, self.buffer.current_style)
+            actions = list(iter_expanded(optimized))
+            program = compile_actions(actions, per_key=False)
+        else:
+            if self._compiled is None:
+                actions = list(iter_expanded(self._actions))
+                self._compiled = (actions, compile_actions(actions, per_key=False))
+            actions, program = self._compiled
+        self._play_program(actions, program, real_time, speed, record=True)
         
-        playback_start = time.time()
+        return self._events
+    
+    def play_stream(self, actions: Iterable[Action], real_time: bool = False,
+                    speed: float = 1.0) -> EditorState:
+        """
+        流式播放：边读取边执行，不保存动作和事件
         
-        for action in self._actions:
-            # 记录执行前状态
-            state_before = self.buffer.get_state(self._current_time)
+        适合 ScriptParser.iter_parse 产出的超大脚本，内存占用与脚本长度无关。
+        回调照常触发。
+        
+        Args:
+            actions: 动作迭代器
+            real_time: 是否实时播放
+            speed: 播放速度倍率 (仅在 real_time=True 时有效)
+        
+        Returns:
+            播放结束时的状态
+        """
+        self._events.clear()
+        self._current_time = 0.0
+        self._wall_start = time.perf_counter()
+        
+        self._play_compiled(iter_expanded(actions), real_time, speed, record=False)
+        
+        return self.get_current_state()
+    
+    def _play_compiled(self, actions: Iterable[Action], real_time: bool, speed: float,
+                       record: bool) -> Optional[PlaybackEvent]:
+        """按块编译并执行动作，内存占用与动作总数无关；返回最后一个事件"""
+        event = None
+        actions = iter(actions)
+        while True:
+            chunk = list(islice(actions, COMPILE_CHUNK))
+            if not chunk:
+                return event
+            program = compile_actions(chunk, per_key=False)
+            event = self._play_program(chunk, program, real_time, speed, record) or event
+    
+    def _play_program(self, actions: list[Action], program: Program, real_time: bool,
+                      speed: float, record: bool) -> Optional[PlaybackEvent]:
+        """
+        由解释器执行编译好的动作，在每个动作的指令边界推进时间、记录事件并触发回调
+        
+        打字动作降级为整段插入，事件和缓冲区状态与逐个调用 execute 相同。
+        回调收到的是轻量状态视图；既不记录也没有订阅者时整段执行，不创建事件。
+        
+        Returns:
+            最后一个事件（没有创建事件时为 None）
+        """
+        buffer = self.buffer
+        bus = self.bus
+        view = buffer.get_state_view
+        event = None
+        run, times = program.runner(buffer), program.times
+        offset = self._current_time
+        
+        on_action, on_state = self._on_action_executed, self._on_state_changed
+        notify_action = on_action is not None or bus.has_subscribers(ACTION_EXECUTED)
+        notify_state = on_state is not None or bus.has_subscribers(STATE_CHANGED)
+        need_event = record or notify_action
+        if not (need_event or notify_state or real_time):
+            run(0, len(program))
+            self._current_time = offset + program.total_duration
+            return None
+        
+        pc = 0
+        for action, stop in zip(actions, program.ends):
             
-            # 执行动作
-            action.execute(self.buffer)
+            # 记录执行前状态
+            state_before = view(self._current_time) if need_event else None
             
-            # 计算持续时间
-            duration = action.get_duration()
-            self._current_time += duration
+            # 执行动作对应的指令，时间推进到最后一条指令完成时
+            run(pc, stop)
+            if stop > pc:
+                self._current_time = offset + times[stop - 1]
             
             # 记录执行后状态
-            state_after = self.buffer.get_state(self._current_time)
+            state_after = view(self._current_time) if need_event or notify_state else None
             
             # 创建事件
-            event = PlaybackEvent(
-                timestamp=self._current_time,
-                action=action,
-                state_before=state_before,
-                state_after=state_after
-            )
-            self._events.append(event)
+            if need_event:
+                event = PlaybackEvent(self._current_time, action, state_before, state_after)
+                if record:
+                    self._events.append(event)
             
             # 触发回调
-            if self._on_action_executed:
-                self._on_action_executed(event)
+            if notify_action:
+                if on_action is not None:
+                    on_action(event)
+                bus.publish(ACTION_EXECUTED, event)
+            if notify_state:
+                if on_state is not None:
+                    on_state(state_after)
+                bus.publish(STATE_CHANGED, state_after)
             
-            if self._on_state_changed:
-                self._on_state_changed(state_after)
-            
-            # 实时延迟
-            if real_time and duration > 0:
-                adjusted_duration = duration / speed
-                time.sleep(adjusted_duration)
-        
-        return self._events
+            # 实时延迟：按墙钟截止时间等待，回调耗费的时间不会累积为回放误差
+            if real_time and stop > pc:
+                delay = self._wall_start + self._current_time / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            pc = stop
+        return event
     
     def play_with_frame_callback(
         self,
-        frame_callback: Callable[[EditorState, float], None],
-        fps: int = 30
+        frame_callback: Callable[[Optional[EditorState], float], None],
+        fps: int = 30,
+        dedupe: bool = False
     ) -> None:
         """
         以固定帧率播放，适合生成动画
         
+        动作先被编译为逐键指令，因此帧能反映打字过程中的中间状态。
+        
         Args:
             frame_callback: 每帧回调函数，接收 (state, timestamp) 参数
             fps: 目标帧率
+            dedupe: 为 True 时，与上一帧内容相同的帧以 state=None 调用回调，
+                表示"重复上一帧"；比较的是缓冲区指纹，不比较文本
         """
+        program = self.compile()
+        total_duration = program.total_duration
         frame_duration = 1.0 / fps
-        total_duration = self.get_total_duration()
         
+        frame_index = 0
+        pc = 0
         current_time = 0.0
-        action_index = 0
-        action_start_time = 0.0
+        previous = None
         
         while current_time <= total_duration:
-            # 执行到当前时间的所有动作
-            while action_index < len(self._actions):
-                action = self._actions[action_index]
-                action_duration = action.get_duration()
-                action_end_time = action_start_time + action_duration
-                
-                if action_end_time <= current_time:
-                    # 动作已完成，执行它
-                    action.execute(self.buffer)
-                    action_index += 1
-                    action_start_time = action_end_time
-                else:
-                    # 动作还未完成
-                    break
+            # 执行到当前时间已完成的所有指令
+            pc = program.run_until(self.buffer, current_time, pc)
             
             # 生成当前帧
-            state = self.buffer.get_state(current_time)
-            frame_callback(state, current_time)
+            fingerprint = self.buffer.fingerprint() if dedupe else None
+            if fingerprint is not None and fingerprint == previous:
+                frame_callback(None, current_time)
+            else:
+                previous = fingerprint
+                frame_callback(self.buffer.get_state(current_time), current_time)
             
             # 推进时间
-            current_time += frame_duration
+            frame_index += 1
+            current_time = frame_index * frame_duration
+    
+    def iter_frame_runs(self, fps: int = 30) -> Iterator[tuple[EditorState, float]]:
+        """
+        以固定帧率播放，把内容相同的连续帧合并为一帧
+        
+        与 play_with_frame_callback 采样相同的帧，停顿和慢速输入期间的重复帧
+        只产出一次，下游只需编码一次。
+        
+        Args:
+            fps: 目标帧率
+        
+        Yields:
+            (state, duration)：state.timestamp 为该帧首次出现的时间，
+            duration 为它持续的帧数 / fps
+        """
+        program = self.compile()
+        total_duration = program.total_duration
+        frame_duration = 1.0 / fps
+        
+        frame_index = 0
+        pc = 0
+        current_time = 0.0
+        state, start_index, previous = None, 0, None
+        
+        while current_time <= total_duration:
+            pc = program.run_until(self.buffer, current_time, pc)
+            fingerprint = self.buffer.fingerprint()
+            if fingerprint != previous:
+                if state is not None:
+                    yield state, (frame_index - start_index) * frame_duration
+                state, start_index, previous = (self.buffer.get_state(current_time),
+                                                frame_index, fingerprint)
+            frame_index += 1
+            current_time = frame_index * frame_duration
+        
+        if state is not None:
+            yield state, (frame_index - start_index) * frame_duration
+    
+    def export_frames(self, render: Callable[[EditorState, float], object],
+                      fps: int = 30, workers: Optional[int] = None) -> list:
+        """
+        多进程渲染与 play_with_frame_callback 相同的帧
+        
+        时间线按帧切分为分片，主进程在分片起点保存缓冲区关键帧，
+        各工作进程从关键帧出发渲染自己的分片，结果按帧顺序拼接。
+        
+        Args:
+            render: 渲染函数 render(state, timestamp)，须定义在模块顶层，返回值须可序列化
+            fps: 目标帧率
+            workers: 工作进程数（默认 CPU 核数）
+        
+        Returns:
+            按帧顺序排列的渲染结果
+        """
+        from frame_export import export_frames
+        return export_frames(self.compile(), render, fps, workers, buffer=self.buffer)
+    
+    def compile(self) -> Program:
+        """
+        把当前动作序列编译为扁平操作码程序
+        
+        Returns:
+            Program（逐键指令 + 预先计算的时间戳）
+        """
+        return compile_actions(self._actions)
     
     def replay_events(self) -> Iterator[PlaybackEvent]:
         """
@@ -241,7 +428,7 @@ class PlaybackScheduler:
         """
         for event in self._events:
             if event.timestamp >= timestamp:
-                return event.state_after
+                return event.state_after.materialize()
         return None
     
     def reset(self) -> None:
@@ -307,31 +494,7 @@ class InteractiveScheduler(PlaybackScheduler):
             return None
         
         action = self._actions[self._current_action_index]
-        
-        # 记录状态
-        state_before = self.buffer.get_state(self._current_time)
-        action.execute(self.buffer)
-        
-        duration = action.get_duration()
-        self._current_time += duration
-        
-        state_after = self.buffer.get_state(self._current_time)
-        
-        # 创建事件
-        event = PlaybackEvent(
-            timestamp=self._current_time,
-            action=action,
-            state_before=state_before,
-            state_after=state_after
-        )
-        self._events.append(event)
-        
-        # 触发回调
-        if self._on_action_executed:
-            self._on_action_executed(event)
-        
-        if self._on_state_changed:
-            self._on_state_changed(state_after)
+        event = self._play_compiled([action], real_time=False, speed=1.0, record=True)
         
         self._current_action_index += 1
         return event
@@ -353,11 +516,9 @@ class InteractiveScheduler(PlaybackScheduler):
         self._events.clear()
         
         # 重新执行到当前位置
-        for i in range(self._current_action_index):
-            action = self._actions[i]
-            action.execute(self.buffer)
-            duration = action.get_duration()
-            self._current_time += duration
+        program = compile_actions(self._actions[:self._current_action_index], per_key=False)
+        program.run(self.buffer)
+        self._current_time = program.total_duration
         
         return True
     
@@ -0,0 +1,272 @@
+"""
+编译脚本缓存
+按脚本内容哈希把解析结果以二进制格式缓存到磁盘，命中时跳过解析
+"""
+
+import hashlib
+import os
+import struct
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional, Union
+
+from actions import Action, emoji_shortcuts_fingerprint
+from binary_script import BinaryScript, BINARY_SUFFIX, FORMAT_VERSION, write_binary
+from version import __version__
+
+
+# 损坏的缓存条目（截断、写了一半）在打开或解码时可能抛出的异常
+_CORRUPT_ERRORS = (ValueError, TypeError, IndexError, KeyError, OverflowError, struct.error)
+
+
+def _qualified_name(obj) -> str:
+    return f"{getattr(obj, '__module__', '?')}.{getattr(obj, '__qualname__', '<unknown>')}"
+
+
+def parser_fingerprint(parser=None) -> Optional[str]:
+    """
+    解析器指纹：解析器类及其动作类型注册表中各构造函数的限定名
+    
+    子类或插件注册的类型会改变解析结果，缓存时应把它计入键中。
+    类或构造函数定义在函数内部（如 lambda）时无法由名字区分，返回 None。
+    
+    Args:
+        parser: 解析器类（默认 ScriptParser）
+    """
+    if parser is None:
+        from script_parser import ScriptParser
+        parser = ScriptParser
+    names = [_qualified_name(parser)]
+    names.extend(f"{type_name}={_qualified_name(constructor)}"
+                 for type_name, constructor in sorted(parser._registry.items()))
+    if any('<' in name for name in names):
+        return None
+    return hashlib.sha256('\n'.join(names).encode('utf-8')).hexdigest()
+
+
+class ScriptCache:
+    """
+    磁盘上的编译脚本缓存
+    
+    - 键：脚本内容 + 引擎版本 + 二进制格式版本 + emoji 快捷码表指纹 + 解析器指纹 的 SHA-256
+    - 解析器指纹无法确定（类或构造函数定义在函数内部，如 lambda）时不使用缓存
+    - 写入：先写临时文件再 os.replace，读者只会看到完整的文件
+    - 淘汰：命中时刷新修改时间，总大小超过上限时按修改时间从旧到新删除
+    - 多进程：不使用锁；并发写入同一键得到相同内容，条目一次性读入内存，
+      被其他进程删除的条目按未命中处理
+    - 损坏的条目按未命中处理：删除后重新解析
+    """
+    
+    # 超过该时长仍未完成的临时文件视为写入进程已崩溃
+    STALE_TEMP_SECONDS = 3600
+    
+    def __init__(self, directory: Union[str, Path], max_bytes: int = 256 * 1024 * 1024):
+        """
+        Args:
+            directory: 缓存目录（不存在时自动创建）
+            max_bytes: 缓存总大小上限（字节）
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+    
+    # ==================== 键 ====================
+    
+    def key(self, content: bytes, parser=None) -> str:
+        """
+        计算脚本内容的缓存键
+        
+        Args:
+            content: 脚本原始内容
+            parser: 解析器类（默认 ScriptParser）
+        
+        Raises:
+            ValueError: 解析器无法计算指纹（见 parser_fingerprint）
+        """
+        fingerprint = parser_fingerprint(parser)
+        if fingerprint is None:
+            raise ValueError(f"Parser {parser!r} cannot be fingerprinted for caching")
+        digest = hashlib.sha256()
+        digest.update(f"{__version__}\0{FORMAT_VERSION}\0{emoji_shortcuts_fingerprint()}\0"
+                      f"{fingerprint}\0".encode('utf-8'))
+        digest.update(content)
+        return digest.hexdigest()
+    
+    def path_for(self, key: str) -> Path:
+        """缓存条目的文件路径"""
+        return self.directory / f"{key}{BINARY_SUFFIX}"
+    
+    # ==================== 读写 ====================
+    
+    def get(self, content: bytes, parser=None) -> Optional[BinaryScript]:
+        """
+        查找缓存
+        
+        Args:
+            content: 脚本原始内容
+            parser: 解析器类（默认 ScriptParser）
+        
+        Returns:
+            命中时返回 BinaryScript（调用方负责 close），未命中返回 None
+        """
+        path = self.path_for(self.key(content, parser))
+        script = self._open(path)
+        if script is None:
+            self.misses += 1
+            return None
+        self._touch(path)
+        self.hits += 1
+        return script
+    
+    def put(self, content: bytes, actions: list[Action], parser=None) -> Path:
+        """
+        写入缓存条目并按需淘汰
+        
+        Args:
+            content: 脚本原始内容
+            actions: 解析得到的动作列表
+            parser: 解析器类（默认 ScriptParser）
+        
+        Returns:
+            缓存文件路径
+        """
+        path = self.path_for(self.key(content, parser))
+        fd, temp_name = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        os.close(fd)
+        try:
+            write_binary(actions, temp_name)
+            os.replace(temp_name, path)
+        except BaseException:
+            self._remove(Path(temp_name))
+            raise
+        
+        self.evict(keep=path)
+        return path
+    
+    def load(self, filepath: Union[str, Path], parser=None) -> list[Action]:
+        """
+        加载脚本文件，命中缓存时直接解码，否则解析后写入缓存
+        
+        解析器无法计算指纹时直接解析，不读写缓存。
+        
+        Args:
+            filepath: 脚本文件路径
+            parser: 解析器类（默认 ScriptParser）
+        
+        Returns:
+            动作列表
+        """
+        if parser is None:
+            from script_parser import ScriptParser
+            parser = ScriptParser
+        
+        if parser_fingerprint(parser) is None:
+            return parser.parse(filepath)
+        
+        content = Path(filepath).read_bytes()
+        path = self.path_for(self.key(content, parser))
+        cached = self._open(path)
+        if cached is not None:
+            try:
+                with cached:
+                    actions = list(cached)
+            except _CORRUPT_ERRORS:
+                # 头部完好但记录损坏
+                self._remove(path)
+            else:
+                self._touch(path)
+                self.hits += 1
+                return actions
+        self.misses += 1
+        
+        actions = parser.parse(filepath)
+        try:
+            self.put(content, actions, parser)
+        except ValueError:
+            # 含有无法编码的动作（如回调），只是不缓存
+            pass
+        return actions
+    
+    # ==================== 淘汰 ====================
+    
+    def evict(self, keep: Optional[Path] = None) -> int:
+        """
+        淘汰最久未使用的条目直到总大小不超过上限
+        
+        Args:
+            keep: 不参与淘汰的条目（通常是刚写入的那个）
+        
+        Returns:
+            删除的条目数
+        """
+        entries = []
+        total = 0
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if entry.name.startswith('.tmp-'):
+                if now - stat.st_mtime > self.STALE_TEMP_SECONDS:
+                    self._remove(Path(entry.path))
+                continue
+            if not entry.name.endswith(BINARY_SUFFIX):
+                continue
+            total += stat.st_size
+            entries.append((stat.st_mtime, stat.st_size, Path(entry.path)))
+        
+        removed = 0
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if keep is not None and path == keep:
+                continue
+            if self._remove(path):
+                removed += 1
+            total -= size
+        return removed
+    
+    def clear(self) -> None:
+        """删除所有缓存条目"""
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(BINARY_SUFFIX) and not entry.name.startswith('.tmp-'):
+                self._remove(Path(entry.path))
+    
+    def _open(self, path: Path) -> Optional[BinaryScript]:
+        """一次性读入条目并打开；不存在时返回 None，损坏时删除后返回 None"""
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        try:
+            return BinaryScript(data)
+        except _CORRUPT_ERRORS:
+            self._remove(path)
+            return None
+    
+    @staticmethod
+    def _touch(path: Path) -> None:
+        # 刷新修改时间，作为 LRU 的最近使用时间
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+    
+    @staticmethod
+    def _remove(path: Path) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+        except OSError:
+            # 其他进程仍映射着该文件（Windows）等情况，下次再淘汰
+            return False
+    
+    def __repr__(self) -> str:
+        return f"ScriptCache({str(self.directory)!r}, hits={self.hits}, misses={self.misses})"
@@ -4,17 +4,24 @@
 """
 
 import json
-from typing import Any, Union
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, Optional, Union
 from pathlib import Path
 
 from actions import (
     Action, TypeTextAction, InsertTextAction, BackspaceAction,
     DeleteAction, ReplaceTextAction, MoveCursorAction, SetSelectionAction,
     SelectRangeAction, ClearSelectionAction, DeleteSelectionAction,
-    SetStyleAction, PauseAction, CompositeAction,
+    SetStyleAction, PauseAction, CompositeAction, RepeatAction,
     type_text, pause, backspace
 )
 from buffer import TextStyle
+from timing import create_timing_model
+from binary_script import (
+    BinaryScript, BinaryScriptWriter, SegmentedScript, BINARY_SUFFIX,
+    encode_actions, is_binary_script, write_binary
+)
 
 
 class ScriptParser:
@@ -43,8 +50,69 @@ class ScriptParser:
         'wait': 'parse_pause',
         'composite': 'parse_composite',
         'group': 'parse_composite',
+        'repeat': 'parse_repeat',
+        'loop': 'parse_repeat',
     }
     
+    # 类型名 -> 构造函数（由 ACTION_TYPES 预先绑定，另含插件注册的类型）
+    _registry: dict[str, Callable[[dict], Action]] = {}
+    
+    def __init_subclass__(cls, **kwargs):
+        """
+        子类复制父类的注册表
+        
+        父类中仍是默认解析方法的条目重新绑定到子类，使子类重写的 parse_* 生效；
+        插件在子类定义之前注册的覆盖保持不变，除非子类自己重写了对应的 parse_* 方法。
+        """
+        super().__init_subclass__(**kwargs)
+        owner = next(base for base in cls.__mro__[1:] if '_registry' in vars(base))
+        registry = dict(owner._registry)
+        for name, method_name in cls.ACTION_TYPES.items():
+            if (name not in registry or method_name in vars(cls)
+                    or registry[name] == getattr(owner, method_name, None)):
+                registry[name] = getattr(cls, method_name)
+        cls._registry = registry
+    
+    @classmethod
+    def _bind_action_types(cls) -> None:
+        for name, method_name in cls.ACTION_TYPES.items():
+            cls._registry[name] = getattr(cls, method_name)
+    
+    @classmethod
+    def register_action_type(cls, name: str, constructor: Callable[[dict], Action],
+                             aliases: Iterable[str] = ()) -> None:
+        """
+        注册自定义动作类型（无需继承解析器）
+        
+        注册会同时作用于尚未覆盖该类型名的子类。
+        
+        Args:
+            name: 脚本中的类型名（不区分大小写）
+            constructor: 接收动作字典、返回 Action 的可调用对象
+            aliases: 其他别名
+        
+        Example:
+            ScriptParser.register_action_type(
+                'shout', lambda data: InsertTextAction(data['text'].upper())
+            )
+        """
+        for type_name in [name] + list(aliases):
+            type_name = type_name.lower()
+            cls._set_action_type(type_name, cls._registry.get(type_name), constructor)
+    
+    @classmethod
+    def _set_action_type(cls, type_name: str, previous, constructor) -> None:
+        # 子类中仍沿用父类条目（未自行覆盖）的一并更新
+        for subclass in cls.__subclasses__():
+            if subclass._registry.get(type_name) is previous:
+                subclass._set_action_type(type_name, previous, constructor)
+        cls._registry[type_name] = constructor
+    
+    @classmethod
+    def action_types(cls) -> list[str]:
+        """所有可用的动作类型名"""
+        return sorted(cls._registry)
+    
     @classmethod
     def parse(cls, script: Union[str, dict, list, Path]) -> list[Action]:
         """
@@ -63,6 +131,11 @@ class ScriptParser:
         # 处理文件路径
         if isinstance(script, (str, Path)):
             path = Path(script)
+            if path.suffix == '.jsonl' and path.is_file():
+                return list(cls.iter_parse(path))
+            if path.is_file() and is_binary_script(path):
+                with BinaryScript(path) as binary:
+                    return list(binary)
             if path.exists() and path.is_file():
                 with open(path, 'r', encoding='utf-8') as f:
                     script = json.load(f)
@@ -86,24 +159,162 @@ class ScriptParser:
         
         raise ValueError(f"Unsupported script format: {type(script)}")
     
+    @classmethod
+    def iter_parse(cls, source: Union[str, Path, Iterable[str]]) -> Iterator[Action]:
+        """
+        流式解析 JSON Lines 脚本（每行一个动作）
+        
+        逐行读取并产出动作，不会把整个文件或全部动作留在内存中。
+        空行会被跳过。
+        
+        Args:
+            source: .jsonl 文件路径，或逐行产出文本的可迭代对象（如打开的文件）
+        
+        Yields:
+            Action
+        """
+        if isinstance(source, (str, Path)):
+            with open(source, 'r', encoding='utf-8') as f:
+                yield from cls.iter_parse(f)
+            return
+        
+        for line_number, line in enumerate(source, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                action_data = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Invalid JSON on line {line_number}: {e}") from e
+            yield cls.parse_action(action_data)
+    
+    @classmethod
+    def iter_file(cls, filepath: Union[str, Path]) -> Iterator[Action]:
+        """
+        按文件格式读取脚本文件并逐个产出动作
+        
+        JSON Lines 和二进制脚本流式读取，JSON 脚本整体解析后产出；
+        格式的判断与 parse 相同，供导出工具的命令行入口使用。
+        
+        Args:
+            filepath: 脚本文件路径（.json / .jsonl / .trb）
+        
+        Yields:
+            Action
+        """
+        path = Path(filepath)
+        if path.suffix == '.jsonl':
+            yield from cls.iter_parse(path)
+        elif is_binary_script(path):
+            with BinaryScript(path) as binary:
+                yield from binary
+        else:
+            yield from cls.parse(path)
+    
+    @classmethod
+    def parse_cached(cls, filepath: Union[str, Path], cache: 'ScriptCache') -> list[Action]:
+        """
+        通过磁盘缓存解析脚本文件
+        
+        内容未变化时直接解码缓存中的二进制脚本，跳过 JSON 解析和 emoji 展开。
+        
+        Args:
+            filepath: 脚本文件路径
+            cache: ScriptCache 实例
+        
+        Returns:
+            动作列表
+        """
+        return cache.load(filepath, parser=cls)
+    
+    @staticmethod
+    def open_binary(filepath: Union[str, Path]) -> BinaryScript:
+        """
+        打开二进制脚本（mmap，动作按需解码）
+        
+        Args:
+            filepath: .trb 文件路径
+        
+        Returns:
+            BinaryScript（可按下标访问或迭代的动作序列）
+        """
+        return BinaryScript(filepath)
+    
+    @classmethod
+    def parse_parallel(cls, filepath: Union[str, Path], workers: Optional[int] = None,
+                       chunk_size: int = 4 * 1024 * 1024) -> SegmentedScript:
+        """
+        多进程分块解析大型脚本
+        
+        JSON Lines 脚本按字节切分为以换行对齐的块，每块在工作进程中解析并编码为
+        二进制段，再按原顺序拼接。二进制脚本本身已是编译形式，直接作为单个段打开。
+        
+        工作进程通过导入本模块重建解析器，因此 register_action_type 注册的类型
+        只在 fork 启动方式下可见；自定义解析器子类需定义在模块顶层。
+        回调等无法二进制编码的动作会引发 ValueError。
+        
+        Args:
+            filepath: .jsonl 或 .trb 文件路径
+            workers: 工作进程数（默认 CPU 核数）
+            chunk_size: 每块的大致字节数
+        
+        Returns:
+            SegmentedScript（调用方负责 close）
+        """
+        if is_binary_script(filepath):
+            return SegmentedScript([BinaryScript(filepath)])
+        
+        ranges = _chunk_ranges(filepath, chunk_size)
+        if len(ranges) <= 1 or workers == 1:
+            results = [_parse_jsonl_chunk(cls, filepath, start, end) for start, end in ranges]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(_parse_jsonl_chunk, cls, filepath, start, end)
+                           for start, end in ranges]
+                results = []
+                for future in futures:
+                    try:
+                        results.append(future.result())
+                    except _ChunkParseError as e:
+                        results.append(e)
+                        for pending in futures:
+                            pending.cancel()
+                        break
+        
+        # 块内行号加上前面各块的行数，得到文件中的行号
+        line_offset = 0
+        segments = []
+        for result in results:
+            if isinstance(result, _ChunkParseError):
+                line, problem, detail = result.args
+                raise ValueError(f"{problem} on line {line_offset + line}: {detail}")
+            data, lines = result
+            segments.append(BinaryScript(data))
+            line_offset += lines
+        return SegmentedScript(segments)
+    
     @classmethod
     def parse_actions(cls, actions_data: list) -> list[Action]:
         """解析动作列表"""
-        return [cls.parse_action(action_data) for action_data in actions_data]
+        parse_action = cls.parse_action
+        return [parse_action(action_data) for action_data in actions_data]
     
     @classmethod
     def parse_action(cls, action_data: dict) -> Action:
         """解析单个动作"""
-        if 'type' not in action_data:
-            raise ValueError(f"Action must have 'type' field: {action_data}")
+        try:
+            action_type = action_data['type']
+        except KeyError:
+            raise ValueError(f"Action must have 'type' field: {action_data}") from None
         
-        action_type = action_data['type'].lower()
+        constructor = cls._registry.get(action_type)
+        if constructor is None:
+            action_type = action_type.lower()
+            constructor = cls._registry.get(action_type)
+            if constructor is None:
+                raise ValueError(f"Unknown action type: {action_type}")
         
-        if action_type not in cls.ACTION_TYPES:
-            raise ValueError(f"Unknown action type: {action_type}")
-        
-        parser_method = getattr(cls, cls.ACTION_TYPES[action_type])
-        return parser_method(action_data)
+        return constructor(action_data)
     
     # ==================== 解析器方法 ====================
     
@@ -122,7 +333,15 @@ class ScriptParser:
         
         delay_variance = data.get('delay_variance', avg_delay * 0.3)
         
-        return TypeTextAction(text, avg_delay, delay_variance)
+        # 支持 timing 参数（时间模型名或 {'model': 名称, ...} 字典）
+        timing_model = None
+        if data.get('timing') is not None:
+            timing_model = create_timing_model(data['timing'], avg_delay, delay_variance)
+        
+        return TypeTextAction(text, avg_delay, delay_variance,
+                              expand_emoji=data.get('expand_emoji', True),
+                              char_delays=data.get('char_delays'),
+                              timing_model=timing_model)
     
     @staticmethod
     def parse_insert_text(data: dict) -> InsertTextAction:
@@ -220,6 +439,64 @@ class ScriptParser:
         """解析组合动作"""
         sub_actions = cls.parse_actions(data.get('actions', []))
         return CompositeAction(actions=sub_actions)
+    
+    @classmethod
+    def parse_repeat(cls, data: dict) -> RepeatAction:
+        """解析重复动作（子动作只解析一次）"""
+        sub_actions = cls.parse_actions(data.get('actions', []))
+        return RepeatAction(count=data.get('count', 1), actions=sub_actions)
+
+
+ScriptParser._bind_action_types()
+
+
+class _ChunkParseError(ValueError):
+    """工作进程中的解析错误，args 为 (块内行号, 问题, 详情)"""
+
+
+def _chunk_ranges(filepath: Union[str, Path], chunk_size: int) -> list[tuple[int, int]]:
+    """把文件切分为以换行结尾的字节范围"""
+    size = os.path.getsize(filepath)
+    ranges = []
+    with open(filepath, 'rb') as f:
+        start = 0
+        while start < size:
+            f.seek(min(start + chunk_size, size))
+            f.readline()
+            end = min(f.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def _parse_jsonl_chunk(parser, filepath: Union[str, Path],
+                       start: int, end: int) -> tuple[bytes, int]:
+    """
+    解析 JSON Lines 文件的一个字节范围（在工作进程中执行）
+    
+    Returns:
+        (二进制段, 块内行数)
+    """
+    with open(filepath, 'rb') as f:
+        f.seek(start)
+        lines = f.read(end - start).split(b'\n')
+    if lines and not lines[-1]:
+        lines.pop()
+    
+    writer = BinaryScriptWriter()
+    parse_action = parser.parse_action
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            action_data = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise _ChunkParseError(line_number, "Invalid JSON", str(e)) from None
+        try:
+            writer.add(parse_action(action_data))
+        except ValueError as e:
+            raise _ChunkParseError(line_number, "Invalid action", str(e)) from None
+    return writer.to_bytes(), len(lines)
 
 
 class ScriptBuilder:
@@ -228,13 +505,19 @@ class ScriptBuilder:
     def __init__(self):
         self.actions = []
     
-    def type(self, text: str, wpm: int = 60) -> 'ScriptBuilder':
-        """添加打字动作"""
-        self.actions.append({
+    def type(self, text: str, wpm: int = 60, expand_emoji: bool = True,
+             timing: Optional[Union[str, dict]] = None) -> 'ScriptBuilder':
+        """添加打字动作（timing 为时间模型名或参数字典）"""
+        action = {
             'type': 'type',
             'text': text,
             'wpm': wpm
-        })
+        }
+        if not expand_emoji:
+            action['expand_emoji'] = False
+        if timing is not None:
+            action['timing'] = timing
+        self.actions.append(action)
         return self
     
     def insert(self, text: str) -> 'ScriptBuilder':
@@ -261,6 +544,25 @@ class ScriptBuilder:
         })
         return self
     
+    def delete(self, count: int = 1) -> 'ScriptBuilder':
+        """添加向后删除"""
+        self.actions.append({
+            'type': 'delete',
+            'count': count
+        })
+        return self
+    
+    def move_cursor(self, position: Optional[int] = None,
+                    offset: Optional[int] = None) -> 'ScriptBuilder':
+        """添加光标移动（绝对位置或相对偏移）"""
+        action = {'type': 'cursor'}
+        if position is not None:
+            action['position'] = position
+        if offset is not None:
+            action['offset'] = offset
+        self.actions.append(action)
+        return self
+    
     def select(self, start: int, end: int) -> 'ScriptBuilder':
         """添加选区"""
         self.actions.append({
@@ -277,6 +579,15 @@ class ScriptBuilder:
         })
         return self
     
+    def repeat(self, count: int, body: 'ScriptBuilder') -> 'ScriptBuilder':
+        """添加重复块（body 为另一个构建器）"""
+        self.actions.append({
+            'type': 'repeat',
+            'count': count,
+            'actions': body.actions
+        })
+        return self
+    
     def style(self, style: str) -> 'ScriptBuilder':
         """设置样式"""
         self.actions.append({
@@ -293,10 +604,28 @@ class ScriptBuilder:
         """导出为 JSON"""
         return json.dumps(self.build(), indent=indent, ensure_ascii=False)
     
+    def to_jsonl(self) -> str:
+        """导出为 JSON Lines（每行一个动作）"""
+        return ''.join(json.dumps(action, ensure_ascii=False) + '\n'
+                       for action in self.actions)
+    
+    def to_binary(self) -> bytes:
+        """导出为二进制脚本"""
+        return encode_actions(ScriptParser.parse(self.build()))
+    
     def save(self, filepath: Union[str, Path]) -> None:
-        """保存到文件"""
+        """保存到文件（.jsonl 后缀保存为 JSON Lines，.trb 后缀保存为二进制脚本）"""
+        if Path(filepath).suffix == BINARY_SUFFIX:
+            write_binary(ScriptParser.parse(self.build()), filepath)
+            return
+        
         with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(self.build(), f, indent=2, ensure_ascii=False)
+            if Path(filepath).suffix == '.jsonl':
+                for action in self.actions:
+                    f.write(json.dumps(action, ensure_ascii=False))
+                    f.write('\n')
+            else:
+                json.dump(self.build(), f, indent=2, ensure_ascii=False)
 
 
 # ==================== 预设脚本模板 ====================
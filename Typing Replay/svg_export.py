@@ -0,0 +1,302 @@
+"""
+SVG 动画导出 (SVG Exporter)
+把回放导出为单个使用 SMIL 动画的 SVG 文件
+
+视口的每一行切分为以单词为单位的片段，每个片段在内容或位置变化时才结束显示区间。
+相同的片段（文本与选区）只在 <defs> 中定义一次，各处通过 <use> 按 id 复用，
+文件大小与编辑次数成正比，而不是与帧数 × 文档长度成正比。
+"""
+
+import sys
+from pathlib import Path
+from typing import IO, Iterable, Optional, Union
+from xml.sax.saxutils import escape
+
+from buffer import TextBuffer
+from actions import Action
+from compiler import iter_keystrokes
+from viewport import Viewport
+
+
+STYLE = ("text{fill:#d4d4d4}"
+         ".s{fill:#569cd6;text-decoration:underline}"
+         ".c{fill:#d4d4d4}")
+BACKGROUND = '#1e1e1e'
+
+
+def _number(value: float, digits: int = 2) -> str:
+    """去掉多余零的小数"""
+    return f"{value:.{digits}f}".rstrip('0').rstrip('.')
+
+
+def _seconds(value: float) -> str:
+    """SMIL 时间值（毫秒精度）"""
+    return _number(value, 3) + 's'
+
+
+def _position(x: float, y: float) -> str:
+    """<use> 的 x、y 属性，为 0 时省略"""
+    x, y = _number(x), _number(y)
+    return (f' x="{x}"' if x != '0' else '') + (f' y="{y}"' if y != '0' else '')
+
+
+class SvgAnimation:
+    """
+    SVG 动画写入器
+    
+    按时间顺序调用 frame() 提交视口状态，最后调用 finish()。
+    片段定义在首次出现时写出，显示区间在结束时写出，只有光标的关键帧留在内存中。
+    """
+    
+    def __init__(self, stream: IO[str], viewport: Viewport, font_size: float = 14):
+        """
+        Args:
+            stream: 文本输出流
+            viewport: 提供各行内容的视口
+            font_size: 字号（像素）
+        """
+        self.stream = stream
+        self.viewport = viewport
+        self.font_size = font_size
+        self.char_width = round(font_size * 0.6, 2)
+        self.line_height = round(font_size * 1.25, 2)
+        self.segments = 0
+        # (片段文本, 是否选中) -> 定义 id
+        self._definitions: dict[tuple[str, bool], str] = {}
+        # 按文档行号记录：各行的内容键，以及正在显示的片段 {(列, 定义 id): 开始时间}
+        self._keys: dict[int, tuple] = {}
+        self._open: dict[int, dict[tuple[int, str], float]] = {}
+        # 滚动和光标的关键帧 [(时间, 首行行号)]、[(时间, 文档行号, 列)]
+        self._scroll: list[tuple[float, int]] = []
+        self._cursor: list[tuple[float, int, int]] = []
+        self._write_header()
+    
+    def _write_header(self) -> None:
+        viewport = self.viewport
+        padding = self.char_width
+        inner_width = _number(viewport.width * self.char_width)
+        inner_height = _number(viewport.height * self.line_height)
+        width = _number(viewport.width * self.char_width + 2 * padding)
+        height = _number(viewport.height * self.line_height + 2 * padding)
+        # 外层组裁剪到视口，内层组随滚动平移
+        self.stream.write(
+            f'<svg xmlns="http://www.w3.org/2000/svg" '
+            f'xmlns:xlink="http://www.w3.org/1999/xlink" '
+            f'width="{width}" height="{height}" viewBox="0 0 {width} {height}" '
+            f'font-family="monospace" font-size="{self.font_size}" xml:space="preserve">\n'
+            f'<style>{STYLE}</style>\n'
+            f'<defs><clipPath id="viewport"><rect width="{inner_width}" height="{inner_height}"/>'
+            f'</clipPath></defs>\n'
+            f'<rect width="100%" height="100%" fill="{BACKGROUND}"/>\n'
+            f'<g transform="translate({_number(padding)},{_number(padding)})" '
+            f'clip-path="url(#viewport)"><g>\n'
+        )
+    
+    def frame(self, timestamp: float) -> None:
+        """提交视口在 timestamp 时的状态"""
+        viewport = self.viewport
+        lines, selections, left = viewport.lines, viewport.selections, viewport.left
+        top_line, height = viewport.top_line, viewport.height
+        keys, opened = self._keys, self._open
+        
+        if _add_keyframe(self._scroll, timestamp, (top_line,)):
+            # 滚出视口的行结束显示
+            for line_number in [n for n in opened if not top_line <= n < top_line + height]:
+                for run, begin in opened.pop(line_number).items():
+                    self._write_use(line_number, run, begin, timestamp)
+                del keys[line_number]
+        
+        definitions = []
+        for row in range(height):
+            line_number = top_line + row
+            key = (lines[row], selections[row], left)
+            if key == keys.get(line_number):
+                continue
+            keys[line_number] = key
+            
+            # 只结束消失的片段、开始新出现的片段，不变的片段继续显示
+            shown = opened.setdefault(line_number, {})
+            runs = self._runs_of(viewport.cells(row), definitions)
+            for run in shown.keys() - runs:
+                self._write_use(line_number, run, shown.pop(run), timestamp)
+            for run in runs:
+                if run not in shown:
+                    shown[run] = timestamp
+        if definitions:
+            self.stream.write('<defs>' + ''.join(definitions) + '</defs>\n')
+        
+        _add_keyframe(self._cursor, timestamp, (top_line + viewport.cursor_row,
+                                                viewport.cursor_column))
+    
+    def _runs_of(self, cells: list[tuple[str, bool]], definitions: list[str]) -> list[tuple[int, str]]:
+        """
+        把一行切分为片段 [(列, 定义 id)]
+        
+        在单词开头和选中状态变化处切分，打字时只有正在输入的单词会变化；
+        未选中的空白不需要绘制。首次出现的片段定义加入 definitions。
+        """
+        pieces = []
+        start = 0
+        for column in range(1, len(cells) + 1):
+            if column < len(cells):
+                char, selected = cells[column]
+                previous, previous_selected = cells[column - 1]
+                if selected == previous_selected and not (previous.isspace() and not char.isspace()):
+                    continue
+            pieces.append((start, column))
+            start = column
+        
+        runs = []
+        for start, end in pieces:
+            selected = cells[start][1]
+            text = ''.join([char for char, _ in cells[start:end]])
+            if not selected:
+                text = text.rstrip()
+                if not text:
+                    continue
+            runs.append((start, self._define(text, selected, definitions)))
+        return runs
+    
+    def _define(self, text: str, selected: bool, definitions: list[str]) -> str:
+        """片段的定义 id，相同的片段只定义一次"""
+        key = (text, selected)
+        run_id = self._definitions.get(key)
+        if run_id is None:
+            run_id = self._definitions[key] = f"r{len(self._definitions)}"
+            css = ' class="s"' if selected else ''
+            definitions.append(f'<text id="{run_id}"{css} y="{self.font_size}">{escape(text)}</text>')
+        return run_id
+    
+    def _write_use(self, line_number: int, run: tuple[int, str], begin: float,
+                   end: Optional[float]) -> None:
+        """写出一个片段的显示区间；end 为 None 表示一直显示到最后"""
+        if end is not None and end <= begin:
+            # 同一时刻即被替换，不可见
+            return
+        column, run_id = run
+        end = '' if end is None else f' end="{_seconds(end)}"'
+        self.stream.write(
+            f'<use xlink:href="#{run_id}"{_position(column * self.char_width, line_number * self.line_height)} '
+            f'visibility="hidden"><set attributeName="visibility" to="visible" '
+            f'begin="{_seconds(begin)}"{end}/></use>\n'
+        )
+        self.segments += 1
+    
+    def finish(self, duration: float) -> None:
+        """写出剩余的区间和动画并结束文档"""
+        for line_number, shown in self._open.items():
+            for run, begin in shown.items():
+                self._write_use(line_number, run, begin, None)
+        self._open.clear()
+        
+        scroll = self._scroll or [(0.0, 0)]
+        offsets = [f"0 {_number(-line * self.line_height)}" for _, line in scroll]
+        self.stream.write(_discrete_animation('animateTransform', 'transform', scroll,
+                                              offsets, duration, ' type="translate"'))
+        
+        cursor = self._cursor or [(0.0, 0, 0)]
+        xs = [_number(column * self.char_width) for _, _, column in cursor]
+        ys = [_number(line * self.line_height) for _, line, _ in cursor]
+        self.stream.write(
+            f'<rect class="c" x="{xs[0]}" y="{ys[0]}" width="2" '
+            f'height="{_number(self.line_height)}">'
+            + _discrete_animation('animate', 'x', cursor, xs, duration)
+            + _discrete_animation('animate', 'y', cursor, ys, duration)
+            + '<animate attributeName="opacity" values="1;0" dur="1s" '
+              'calcMode="discrete" repeatCount="indefinite"/></rect>\n'
+        )
+        self.stream.write('</g></g>\n</svg>\n')
+
+
+def _add_keyframe(keyframes: list[tuple], timestamp: float, value: tuple) -> bool:
+    """追加关键帧（同一时刻的关键帧只保留最后一个），返回值是否变化"""
+    if keyframes and keyframes[-1][0] == timestamp:
+        keyframes.pop()
+    if keyframes and keyframes[-1][1:] == value:
+        return False
+    keyframes.append((timestamp, *value))
+    return True
+
+
+def _discrete_animation(element: str, attribute: str, keyframes: list[tuple],
+                        values: list[str], duration: float, extra: str = '') -> str:
+    """离散动画：各关键帧的值保持到下一个关键帧；只有一个关键帧时不需要动画"""
+    if len(keyframes) < 2 or duration <= 0:
+        if element == 'animateTransform' and values[0] != '0 0':
+            return f'<set attributeName="{attribute}" to="translate({values[0]})"/>'
+        return ''
+    key_times = ';'.join(_number(keyframe[0] / duration, 6) for keyframe in keyframes)
+    return (f'<{element} attributeName="{attribute}"{extra} calcMode="discrete" '
+            f'dur="{_seconds(duration)}" fill="freeze" keyTimes="{key_times}" '
+            f'values="{";".join(values)}"/>')
+
+
+def write_svg(actions: Iterable[Action], stream: IO[str], width: int = 80,
+              height: int = 24, speed: float = 1.0, font_size: float = 14,
+              buffer: Optional[TextBuffer] = None) -> int:
+    """
+    把动作序列的回放写为 SVG 动画
+    
+    Args:
+        actions: 动作序列（可以是 ScriptParser.iter_parse 等迭代器）
+        stream: 文本输出流
+        width: 视口列数
+        height: 视口行数
+        speed: 播放速度倍率
+        font_size: 字号（像素）
+        buffer: 回放使用的缓冲区（默认新建）
+    
+    Returns:
+        写入的显示区间（<use> 元素）数
+    """
+    if speed <= 0:
+        raise ValueError("Speed must be positive")
+    if buffer is None:
+        buffer = TextBuffer()
+    
+    viewport = Viewport(width, height)
+    animation = SvgAnimation(stream, viewport, font_size)
+    viewport.update(buffer.text, buffer.cursor, buffer.selection)
+    animation.frame(0.0)
+    
+    duration = 0.0
+    for timestamp, _ in iter_keystrokes(actions, buffer):
+        duration = timestamp / speed
+        viewport.update(buffer.text, buffer.cursor, buffer.selection)
+        animation.frame(duration)
+    
+    animation.finish(duration)
+    return animation.segments
+
+
+def export_svg(actions: Iterable[Action], output: Union[str, Path], **options) -> int:
+    """
+    把动作序列的回放导出为 .svg 文件
+    
+    Args:
+        actions: 动作序列
+        output: 输出文件路径
+        **options: 传给 write_svg 的参数
+    
+    Returns:
+        写入的显示区间数
+    """
+    with open(output, 'w', encoding='utf-8') as f:
+        return write_svg(actions, f, **options)
+
+
+def main(argv: list[str]) -> int:
+    """svg_export.py SCRIPT OUTPUT.svg [SPEED]：把脚本导出为 SVG 动画"""
+    if len(argv) < 2:
+        print("usage: svg_export.py SCRIPT OUTPUT.svg [SPEED]")
+        return 2
+    from script_parser import ScriptParser
+    
+    speed = float(argv[2]) if len(argv) > 2 else 1.0
+    count = export_svg(ScriptParser.iter_file(argv[0]), argv[1], speed=speed)
+    print(f"Wrote {count} line segments to {argv[1]}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,213 @@
+"""
+脚本模板 (Script Template)
+带 {{name}} 占位符的参数化脚本，以及按公共前缀共享执行的批量渲染
+"""
+
+import json
+import re
+from pathlib import Path
+from typing import Any, Iterable, Optional, Union
+
+from buffer import TextBuffer, EditorState
+from actions import Action
+
+
+PLACEHOLDER_PATTERN = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+
+
+class ScriptTemplate:
+    """
+    参数化脚本
+    
+    脚本中任意字符串值都可以包含 {{name}} 占位符；
+    整个字符串恰好是一个占位符时保留变量值的类型（例如用变量指定 wpm）。
+    """
+    
+    def __init__(self, script: Union[dict, list]):
+        """
+        Args:
+            script: 脚本字典（含 'actions'）或动作字典列表
+        """
+        self.actions: list[dict] = script['actions'] if isinstance(script, dict) else list(script)
+        # 每个动作是否含有占位符
+        self.dynamic = [bool(self._collect(action, set())) for action in self.actions]
+        self.variables = sorted(self._collect(self.actions, set()))
+    
+    @classmethod
+    def from_file(cls, filepath: Union[str, Path]) -> 'ScriptTemplate':
+        """从 JSON 文件加载模板"""
+        with open(filepath, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+    
+    def render(self, values: dict) -> list[dict]:
+        """
+        代入变量值
+        
+        Args:
+            values: 变量名 -> 值
+        
+        Returns:
+            动作字典列表
+        """
+        self.check(values)
+        return [self._substitute(action, values) if dynamic else action
+                for action, dynamic in zip(self.actions, self.dynamic)]
+    
+    def render_action(self, index: int, values: dict) -> dict:
+        """代入单个动作的变量值（不检查缺失的变量）"""
+        return self._substitute(self.actions[index], values)
+    
+    def check(self, values: dict) -> None:
+        """检查变量值是否齐全"""
+        missing = [name for name in self.variables if name not in values]
+        if missing:
+            raise ValueError(f"Missing template variables: {', '.join(missing)}")
+    
+    def parse(self, values: dict, parser=None) -> list[Action]:
+        """代入变量值并解析为动作"""
+        if parser is None:
+            from script_parser import ScriptParser
+            parser = ScriptParser
+        return parser.parse_actions(self.render(values))
+    
+    @classmethod
+    def _collect(cls, value: Any, names: set) -> set:
+        if isinstance(value, str):
+            names.update(PLACEHOLDER_PATTERN.findall(value))
+        elif isinstance(value, dict):
+            for item in value.values():
+                cls._collect(item, names)
+        elif isinstance(value, list):
+            for item in value:
+                cls._collect(item, names)
+        return names
+    
+    @classmethod
+    def _substitute(cls, value: Any, values: dict) -> Any:
+        if isinstance(value, str):
+            match = PLACEHOLDER_PATTERN.fullmatch(value)
+            if match:
+                return values[match.group(1)]
+            return PLACEHOLDER_PATTERN.sub(lambda m: str(values[m.group(1)]), value)
+        if isinstance(value, dict):
+            return {key: cls._substitute(item, values) for key, item in value.items()}
+        if isinstance(value, list):
+            return [cls._substitute(item, values) for item in value]
+        return value
+    
+    def __repr__(self) -> str:
+        return f"ScriptTemplate({len(self.actions)} actions, variables={self.variables})"
+
+
+class _TrieNode:
+    """前缀树节点：一个动作，以及在此结束的变体"""
+    
+    __slots__ = ('action', 'children', 'variants')
+    
+    def __init__(self, action: Optional[Action] = None):
+        self.action = action
+        self.children: dict[Union[int, str], '_TrieNode'] = {}
+        self.variants: list[int] = []
+
+
+class TemplateRenderer:
+    """
+    批量渲染模板的多个变体（非实时）
+    
+    各变体渲染出的动作序列按动作内容组织成前缀树，公共前缀只解析、执行一次；
+    在分支点复制缓冲区，各分支只执行自己的后缀。
+    结果与逐个变体用 PlaybackScheduler 非实时播放相同（时长各自采样）。
+    """
+    
+    def __init__(self, template: ScriptTemplate, parser=None):
+        """
+        Args:
+            template: 脚本模板
+            parser: 解析器类（默认 ScriptParser）
+        """
+        if parser is None:
+            from script_parser import ScriptParser
+            parser = ScriptParser
+        self.template = template
+        self.parser = parser
+        # 统计：实际执行的动作数、所有变体独立执行所需的动作数
+        self.executed_actions = 0
+        self.total_actions = 0
+    
+    def render_batch(self, variants: Iterable[dict]) -> list[EditorState]:
+        """
+        渲染一批变体
+        
+        Args:
+            variants: 每个变体的变量值字典
+        
+        Returns:
+            各变体的最终状态（顺序与输入相同，timestamp 为总时长）
+        """
+        root = self._build_trie(variants)
+        results: list[Optional[EditorState]] = [None] * self._count
+        
+        # 显式栈深度优先遍历，避免长脚本触发递归深度限制
+        stack = [(root, TextBuffer(), 0.0)]
+        while stack:
+            node, buffer, elapsed = stack.pop()
+            for index in node.variants:
+                results[index] = buffer.get_state(elapsed)
+            
+            children = list(node.children.values())
+            if not children:
+                continue
+            # 先为其他分支保存分支点状态，最后一个分支直接沿用当前缓冲区
+            buffers = [buffer.copy() for _ in children[:-1]] + [buffer]
+            for child, child_buffer in zip(children, buffers):
+                child.action.execute(child_buffer)
+                self.executed_actions += 1
+                stack.append((child, child_buffer, elapsed + child.action.get_duration()))
+        
+        return results
+    
+    def _build_trie(self, variants: Iterable[dict]) -> _TrieNode:
+        template = self.template
+        # 不含占位符的动作只解析一次，在树中以下标作为键
+        static = [None if dynamic else self.parser.parse_action(action)
+                  for action, dynamic in zip(template.actions, template.dynamic)]
+        
+        root = _TrieNode()
+        self._count = 0
+        for index, values in enumerate(variants):
+            template.check(values)
+            node = root
+            for position, action in enumerate(static):
+                if action is None:
+                    action_data = template.render_action(position, values)
+                    key = json.dumps(action_data, sort_keys=True, ensure_ascii=False)
+                else:
+                    key = position
+                child = node.children.get(key)
+                if child is None:
+                    if action is None:
+                        action = self.parser.parse_action(action_data)
+                    child = _TrieNode(action)
+                    node.children[key] = child
+                node = child
+            self.total_actions += len(static)
+            node.variants.append(index)
+            self._count = index + 1
+        return root
+
+
+def render_variants(template: Union[ScriptTemplate, dict, list],
+                    variants: Iterable[dict]) -> list[EditorState]:
+    """
+    批量渲染模板变体的便捷函数
+    
+    Args:
+        template: ScriptTemplate 或模板脚本
+        variants: 每个变体的变量值字典
+    
+    Returns:
+        各变体的最终状态
+    """
+    if not isinstance(template, ScriptTemplate):
+        template = ScriptTemplate(template)
+    return TemplateRenderer(template).render_batch(variants)
@@ -4,13 +4,23 @@
 """
 
 import unittest
-from buffer import TextBuffer, Selection, TextStyle
+from buffer import TextBuffer, Selection, TextStyle, EditorState, EditorStateView
 from actions import (
     TypeTextAction, BackspaceAction, MoveCursorAction,
-    SetSelectionAction, DeleteSelectionAction, type_text, pause
+    SetSelectionAction, DeleteSelectionAction, PauseAction, RepeatAction, InsertTextAction, SetStyleAction,
+    type_text, pause,
+    expand_emoji_shortcuts, register_emoji_shortcuts, EMOJI_SHORTCUTS
 )
 from scheduler import PlaybackScheduler, InteractiveScheduler
+from events import EventBus
 from script_parser import ScriptParser, ScriptBuilder
+from compiler import Op, compile_actions, iter_keystrokes
+from optimizer import optimize_actions
+from dry_run import dry_run
+from diff_synth import diff_opcodes, text_edits, synthesize_revisions
+from keylog import import_keylog
+from timing import BigramTimingModel, KeyboardTimingModel
+from template import ScriptTemplate, TemplateRenderer
 
 
 class TestTextBuffer(unittest.TestCase):
@@ -127,6 +137,66 @@ class TestTextBuffer(unittest.TestCase):
         
         self.assertEqual(self.buffer.text, "Hello Python")
         self.assertEqual(self.buffer.cursor, 12)
+    
+    def test_edit_listener(self):
+        """测试编辑监听器在修改前收到旧文本坐标下的编辑"""
+        edits = []
+        self.buffer.add_edit_listener(
+            lambda start, end, text: edits.append((start, end, text, self.buffer.text)))
+        self.buffer.insert_text("Hello World")
+        self.buffer.delete_char()
+        self.buffer.set_selection(0, 5)
+        self.buffer.insert_text("Hi")
+        self.buffer.replace_text(3, 6, "X")
+        
+        self.assertEqual(edits, [
+            (0, 0, "Hello World", ""),
+            (10, 11, "", "Hello World"),
+            (0, 5, "", "Hello Worl"),
+            (0, 0, "Hi", " Worl"),
+            (3, 6, "X", "Hi Worl"),
+        ])
+        # 副本不继承监听器
+        self.buffer.copy().insert_text("!")
+        self.assertEqual(len(edits), 5)
+    
+    def test_fingerprint(self):
+        """测试状态指纹随文本、光标、选区和样式变化"""
+        fingerprints = [self.buffer.fingerprint()]
+        self.buffer.insert_text("Hello")
+        fingerprints.append(self.buffer.fingerprint())
+        self.buffer.move_cursor(2)
+        fingerprints.append(self.buffer.fingerprint())
+        self.buffer.set_selection(0, 2)
+        fingerprints.append(self.buffer.fingerprint())
+        self.buffer.set_style(TextStyle.BOLD)
+        fingerprints.append(self.buffer.fingerprint())
+        self.assertEqual(len(set(fingerprints)), len(fingerprints))
+        
+        # 没有修改时不变；副本与原缓冲区分别修改后不会相同
+        self.assertEqual(self.buffer.fingerprint(), fingerprints[-1])
+        clone = self.buffer.copy()
+        self.assertEqual(clone.fingerprint(), fingerprints[-1])
+        clone.insert_text("X")
+        self.buffer.insert_text("Y")
+        self.assertNotEqual(clone.fingerprint(), self.buffer.fingerprint())
+    
+    def test_state_view(self):
+        """测试状态视图是快照，并能转换为 EditorState"""
+        self.buffer.insert_text("Hello")
+        self.buffer.set_selection(0, 2)
+        view = self.buffer.get_state_view(1.5)
+        self.buffer.insert_text("Hi")
+        
+        self.assertEqual(view.text, "Hello")
+        self.assertEqual(view.cursor_pos, 2)
+        self.assertEqual(view.selection, Selection(0, 2))
+        state = view.materialize()
+        self.assertIsInstance(state, EditorState)
+        self.assertIs(view.materialize(), state)
+        self.assertEqual(state.timestamp, 1.5)
+        self.assertEqual(view, state)
+        self.assertFalse(hasattr(view, '__dict__'))
 
 
 class TestActions(unittest.TestCase):
@@ -190,6 +260,41 @@ class TestActions(unittest.TestCase):
         self.assertIsNone(self.buffer.selection)
 
 
+class TestEmojiShortcuts(unittest.TestCase):
+    """测试 emoji 快捷码展开"""
+    
+    def setUp(self):
+        self._saved = dict(EMOJI_SHORTCUTS)
+    
+    def tearDown(self):
+        EMOJI_SHORTCUTS.clear()
+        register_emoji_shortcuts(self._saved)
+    
+    def test_expand(self):
+        """测试基本展开"""
+        self.assertEqual(expand_emoji_shortcuts("Hi :smile: :rocket:"), "Hi 😊 🚀")
+        self.assertEqual(expand_emoji_shortcuts("no codes :unknown:"), "no codes :unknown:")
+    
+    def test_matches_sequential_replace(self):
+        """测试与逐条 replace 的结果一致"""
+        text = ":100::fire: a:b :heart::cat:dog: :smile"
+        expected = text
+        for shortcut, emoji in EMOJI_SHORTCUTS.items():
+            expected = expected.replace(shortcut, emoji)
+        self.assertEqual(expand_emoji_shortcuts(text), expected)
+    
+    def test_longest_match(self):
+        """测试重叠快捷码取最长"""
+        register_emoji_shortcuts({':cat:': 'C', ':cat_face:': 'F', ':ca': 'X'})
+        self.assertEqual(expand_emoji_shortcuts(":cat_face: :cat: :cab"), "F C Xb")
+    
+    def test_register_applies_to_actions(self):
+        """测试注册的快捷码对新动作生效"""
+        register_emoji_shortcuts({':taco:': '🌮'})
+        action = TypeTextAction("I want :taco:")
+        self.assertEqual(action.text, "I want 🌮")
+
+
 class TestScheduler(unittest.TestCase):
     """测试调度器"""
     
@@ -217,6 +322,47 @@ class TestScheduler(unittest.TestCase):
         self.assertEqual(len(events), 3)
         self.assertEqual(scheduler.buffer.text, "Hello World")
     
+    def test_play_runs_compiled_program(self):
+        """测试播放由编译好的程序执行，事件位于动作边界，结果与逐个 execute 相同"""
+        actions = [
+            SetStyleAction(TextStyle.BOLD),
+            TypeTextAction("Hello", avg_char_delay=0.1, delay_variance=0.0),
+            BackspaceAction(count=0),
+            SetSelectionAction(0, 2),
+            InsertTextAction("J", duration=0.2),
+            RepeatAction(2, [BackspaceAction(count=1, char_delay=0.05)]),
+        ]
+        scheduler = PlaybackScheduler()
+        scheduler.add_actions(actions)
+        events = scheduler.play()
+        
+        reference = TextBuffer()
+        for action in actions:
+            action.execute(reference)
+        self.assertEqual(scheduler.buffer.text, reference.text)
+        self.assertEqual(scheduler.buffer.get_style_ranges(), reference.get_style_ranges())
+        
+        # 重复轮次各自产生事件；没有指令的动作不推进时间
+        self.assertEqual(len(events), 7)
+        expected = 0.0
+        for event in events:
+            expected += event.action.get_duration()
+            self.assertAlmostEqual(event.timestamp, expected)
+        self.assertEqual(events[2].timestamp, events[1].timestamp)
+        self.assertEqual(events[4].state_before.text, "Hello")
+        self.assertEqual(events[4].state_after.text, "Jllo")
+        
+        # 编译结果被复用，添加动作后失效
+        program = scheduler._compiled[1]
+        scheduler.buffer = TextBuffer()
+        scheduler.play()
+        self.assertIs(scheduler._compiled[1], program)
+        scheduler.add_action(InsertTextAction("!"))
+        scheduler.buffer = TextBuffer()
+        scheduler.play()
+        self.assertIsNot(scheduler._compiled[1], program)
+        self.assertEqual(scheduler.buffer.text, "!" + reference.text)
+    
     def test_callbacks(self):
         """测试回调"""
         scheduler = PlaybackScheduler()
@@ -265,6 +411,578 @@ class TestScheduler(unittest.TestCase):
         self.assertTrue(scheduler.is_finished())
 
 
+class TestCompiler(unittest.TestCase):
+    """测试动作编译器"""
+    
+    def _script(self):
+        return ScriptParser.parse({'actions': [
+            {'type': 'type', 'text': 'Hello World', 'wpm': 60},
+            {'type': 'backspace', 'count': 5},
+            {'type': 'style', 'style': 'bold'},
+            {'type': 'type', 'text': 'There', 'wpm': 60},
+            {'type': 'cursor', 'offset': -5},
+            {'type': 'select', 'start': 0, 'end': 5},
+            {'type': 'insert', 'text': 'Hi'},
+            {'type': 'select', 'start': 0, 'end': 1},
+            {'type': 'type', 'text': ''},
+            {'type': 'pause', 'duration': 0.5},
+            {'type': 'replace', 'start': 3, 'end': 8, 'new_text': 'all'},
+            {'type': 'group', 'actions': [
+                {'type': 'cursor', 'position': 0},
+                {'type': 'delete', 'count': 1},
+            ]},
+        ]})
+    
+    def test_matches_action_execution(self):
+        """测试编译执行与逐动作执行结果一致"""
+        actions = self._script()
+        expected = TextBuffer()
+        for action in actions:
+            action.execute(expected)
+        
+        for per_key in (True, False):
+            buffer = TextBuffer()
+            compile_actions(actions, per_key=per_key).run(buffer)
+            
+            self.assertEqual(buffer.text, expected.text)
+            self.assertEqual(buffer.cursor, expected.cursor)
+            self.assertEqual(buffer.selection, expected.selection)
+            self.assertEqual(buffer.current_style, expected.current_style)
+    
+    def test_empty_type_deletes_selection(self):
+        """测试空文本的打字动作在逐键程序中同样删除选区"""
+        actions = [InsertTextAction("Hello"), SetSelectionAction(1, 4), TypeTextAction("")]
+        expected = TextBuffer()
+        for action in actions:
+            action.execute(expected)
+        
+        for per_key in (True, False):
+            buffer = TextBuffer()
+            compile_actions(actions, per_key=per_key).run(buffer)
+            self.assertEqual((buffer.text, buffer.cursor, buffer.selection),
+                             (expected.text, expected.cursor, expected.selection))
+        self.assertEqual(expected.text, "Ho")
+    
+    def test_keystroke_granularity(self):
+        """测试打字按字符降级，时间戳单调递增"""
+        program = compile_actions([type_text("abc"), pause(0.5), BackspaceAction(count=2)])
+        
+        self.assertEqual(list(program.ops), [Op.INSERT] * 3 + [Op.WAIT] + [Op.DELETE_BACK] * 2)
+        self.assertEqual(list(program.source), [0, 0, 0, 1, 2, 2])
+        self.assertEqual(list(program.times), sorted(program.times))
+        self.assertAlmostEqual(program.times[4] - program.times[3], 0.05)
+    
+    def test_run_until(self):
+        """测试按时间执行"""
+        program = compile_actions([
+            TypeTextAction("ab", avg_char_delay=0.1, delay_variance=0.0),
+            pause(1.0)
+        ])
+        buffer = TextBuffer()
+        pc = program.run_until(buffer, 0.15)
+        self.assertEqual(buffer.text, "a")
+        program.run_until(buffer, 0.2, pc)
+        self.assertEqual(buffer.text, "ab")
+        self.assertAlmostEqual(program.total_duration, 1.2)
+    
+    def test_custom_action_fallback(self):
+        """测试自定义动作降级为 CALL"""
+        from actions import CallbackAction
+        calls = []
+        program = compile_actions([CallbackAction(lambda b: calls.append(b.text), duration=0.3)])
+        
+        self.assertEqual(list(program.ops), [Op.CALL])
+        program.run(TextBuffer())
+        self.assertEqual(calls, [""])
+    
+    def test_frame_callback_shows_partial_typing(self):
+        """测试帧回放能看到打字中间状态"""
+        scheduler = PlaybackScheduler()
+        scheduler.add_action(TypeTextAction("abcd", avg_char_delay=0.1, delay_variance=0.0))
+        
+        frames = []
+        scheduler.play_with_frame_callback(lambda s, t: frames.append(s.text), fps=20)
+        
+        self.assertIn("ab", frames)
+        self.assertEqual(frames[-1], "abcd")
+    
+    def test_frame_dedupe(self):
+        """测试重复帧以 None 标记，合并后的帧覆盖相同的时间"""
+        def build():
+            scheduler = PlaybackScheduler()
+            scheduler.add_action(TypeTextAction("ab", avg_char_delay=0.1, delay_variance=0.0))
+            scheduler.add_action(PauseAction(1.0))
+            scheduler.add_action(MoveCursorAction(position=0))
+            scheduler.add_action(PauseAction(0.5))
+            return scheduler
+        
+        frames = []
+        build().play_with_frame_callback(lambda s, t: frames.append(s and s.text), fps=20)
+        deduped = []
+        build().play_with_frame_callback(lambda s, t: deduped.append(s and s.text),
+                                         fps=20, dedupe=True)
+        self.assertEqual(len(deduped), len(frames))
+        self.assertGreater(deduped.count(None), len(frames) // 2)
+        # 用上一帧替换标记后与逐帧结果相同
+        for index, text in enumerate(deduped):
+            if text is None:
+                deduped[index] = deduped[index - 1]
+        self.assertEqual(deduped, frames)
+        
+        runs = list(build().iter_frame_runs(fps=20))
+        self.assertLess(len(runs), 6)
+        self.assertAlmostEqual(sum(duration for _, duration in runs), len(frames) / 20)
+        self.assertEqual(runs[-1][0].cursor_pos, 0)
+        self.assertEqual([state.text for state, _ in runs][-2:], ["ab", "ab"])
+    
+    
+    def test_iter_keystrokes_streams_program(self):
+        """测试流式逐键执行与整体编译的时间线一致"""
+        # 固定延迟，两次降级得到相同的时间
+        actions = [action for action in self._script() if not isinstance(action, TypeTextAction)]
+        actions.insert(0, TypeTextAction("Hello World", avg_char_delay=0.1, delay_variance=0.0))
+        program = compile_actions(actions)
+        buffer = TextBuffer()
+        steps = list(iter_keystrokes(iter(actions), buffer))
+        
+        self.assertEqual(len(steps), len(program))
+        for (timestamp, source), expected_time, expected_source in zip(
+                steps, program.times, program.source):
+            self.assertAlmostEqual(timestamp, expected_time)
+            self.assertEqual(source, expected_source)
+        
+        expected = TextBuffer()
+        program.run(expected)
+        self.assertEqual(buffer.text, expected.text)
+
+
+class TestOptimizer(unittest.TestCase):
+    """测试窥孔优化器"""
+    
+    def _run(self, actions):
+        buffer = TextBuffer()
+        for action in actions:
+            action.execute(buffer)
+        duration = sum(action.get_duration() for action in actions)
+        return (buffer.text, buffer.cursor, buffer.selection, buffer.current_style,
+                buffer.get_style_ranges()), duration
+    
+    def _assert_equivalent(self, actions):
+        optimized = optimize_actions(actions)
+        expected_state, expected_duration = self._run(actions)
+        state, duration = self._run(optimized)
+        self.assertEqual(state, expected_state)
+        self.assertAlmostEqual(duration, expected_duration)
+        return optimized
+    
+    def test_style_ranges_preserved(self):
+        """测试非 NORMAL 样式下的插入不合并、不抵消，样式范围与原动作相同"""
+        optimized = self._assert_equivalent([
+            TypeTextAction("ab", 0.1, 0.0),
+            SetStyleAction(TextStyle.BOLD),
+            TypeTextAction("cd", 0.1, 0.0),
+            TypeTextAction("ef", 0.1, 0.0),
+            BackspaceAction(count=2),
+            SetStyleAction(TextStyle.NORMAL),
+            TypeTextAction("gh", 0.1, 0.0),
+            TypeTextAction("ij", 0.1, 0.0),
+            BackspaceAction(count=2),
+        ])
+        inserts = [action.text for action in optimized
+                   if isinstance(action, (TypeTextAction, InsertTextAction))]
+        self.assertEqual(inserts, ["ab", "cd", "ef", "gh"])
+        
+        # 开始时样式未知或非 NORMAL 时同样保守处理
+        actions = [TypeTextAction("ab", 0.1, 0.0), TypeTextAction("c", 0.1, 0.0)]
+        self.assertEqual(len(optimize_actions(actions, None)), 2)
+        self.assertEqual(len(optimize_actions(actions, TextStyle.CODE)), 2)
+        self.assertEqual(len(optimize_actions(actions)), 1)
+    
+    def test_merge_and_cancel(self):
+        """测试合并插入并抵消退格"""
+        optimized = self._assert_equivalent([
+            TypeTextAction("Hello", 0.1, 0.0),
+            PauseAction(0.5),
+            TypeTextAction(" Wrold", 0.1, 0.0),
+            BackspaceAction(count=4),
+            TypeTextAction("orld", 0.1, 0.0),
+        ])
+        self.assertEqual(len(optimized), 1)
+        self.assertEqual(optimized[0].text, "Hello World")
+    
+    def test_backspace_past_insert(self):
+        """测试退格超过插入长度时保留剩余退格"""
+        optimized = self._assert_equivalent([
+            MoveCursorAction(position=0),
+            TypeTextAction("ab", 0.1, 0.0),
+            BackspaceAction(count=5),
+            SetSelectionAction(0, 0),
+            TypeTextAction("xyz", 0.1, 0.0),
+            BackspaceAction(count=3),
+        ])
+        self.assertEqual(sum(isinstance(a, BackspaceAction) for a in optimized), 1)
+    
+    def test_fold_moves_and_drop_pauses(self):
+        """测试折叠光标移动并丢弃零时长停顿"""
+        actions = [
+            TypeTextAction("Hello World", 0.1, 0.0),
+            SetSelectionAction(0, 5),
+            MoveCursorAction(offset=-2, clear_selection=False),
+            PauseAction(0.0),
+            MoveCursorAction(offset=-3, clear_selection=False),
+            MoveCursorAction(offset=4),
+            MoveCursorAction(position=2),
+        ]
+        optimized = self._assert_equivalent(actions)
+        self.assertEqual(len(optimized), 4)
+        self.assertFalse(any(isinstance(a, PauseAction) for a in optimized))
+    
+    def test_play_optimized(self):
+        """测试调度器的优化播放"""
+        scheduler = PlaybackScheduler()
+        scheduler.add_actions([type_text("Hello!"), pause(0.3), BackspaceAction(count=1)])
+        scheduler.play(optimize=True)
+        self.assertEqual(scheduler.buffer.text, "Hello")
+        with self.assertRaises(ValueError):
+            scheduler.play(real_time=True, optimize=True)
+
+
+class TestDryRun(unittest.TestCase):
+    """测试符号化试运行"""
+    
+    def test_matches_buffer(self):
+        """测试推演结果与真实执行一致"""
+        actions = ScriptParser.parse({'actions': [
+            {'type': 'type', 'text': 'Hello World', 'wpm': 60},
+            {'type': 'select', 'start': 0, 'end': 5},
+            {'type': 'type', 'text': 'Hi', 'wpm': 60},
+            {'type': 'cursor', 'offset': 3},
+            {'type': 'backspace', 'count': 2},
+            {'type': 'replace', 'start': 0, 'end': 2, 'new_text': 'Hey'},
+        ]})
+        buffer = TextBuffer()
+        for action in actions:
+            action.execute(buffer)
+        
+        report = dry_run(actions)
+        
+        self.assertEqual(report.length, len(buffer.text))
+        self.assertEqual(report.cursor, buffer.cursor)
+        self.assertEqual(report.issues, [])
+        self.assertTrue(report.ok)
+    
+    def test_reports_clamping_and_invalid_ranges(self):
+        """测试报告截断和无效范围"""
+        actions = ScriptParser.parse({'actions': [
+            {'type': 'type', 'text': 'abc', 'wpm': 60},
+            {'type': 'select', 'start': 1, 'end': 10},
+            {'type': 'replace', 'start': 2, 'end': 1, 'new_text': 'x'},
+            {'type': 'cursor', 'position': 0},
+            {'type': 'backspace', 'count': 2},
+        ]})
+        
+        report = dry_run(actions)
+        
+        kinds = [(issue.index, issue.kind) for issue in report.issues]
+        self.assertEqual(kinds, [(1, 'clamped'), (2, 'invalid_range'), (4, 'clamped')])
+        self.assertFalse(report.ok)
+        self.assertEqual(report.selection, None)
+        self.assertEqual(report.length, 4)
+
+
+class TestDiffSynth(unittest.TestCase):
+    """测试差异合成器"""
+    
+    def _play(self, builder):
+        buffer = TextBuffer()
+        for action in ScriptParser.parse(builder.build()):
+            action.execute(buffer)
+        return buffer.text
+    
+    def test_diff_opcodes_minimal(self):
+        """测试 Myers 差异得到最少的编辑"""
+        a, b = list("abcabba"), list("cbabac")
+        opcodes = diff_opcodes(a, b)
+        matched = sum(i2 - i1 for tag, i1, i2, _, _ in opcodes if tag == 'equal')
+        self.assertEqual(matched, 4)
+        rebuilt = []
+        for tag, i1, i2, j1, j2 in opcodes:
+            rebuilt += a[i1:i2] if tag == 'equal' else b[j1:j2]
+        self.assertEqual(rebuilt, b)
+    
+    def test_diff_distance_cutoff(self):
+        """测试编辑距离超过上限且没有唯一公共元素时整段替换"""
+        import time
+        a, b = list(range(20000)), list(range(20000, 40000))
+        started = time.perf_counter()
+        self.assertEqual(diff_opcodes(a, b), [('replace', 0, 20000, 0, 20000)])
+        self.assertLess(time.perf_counter() - started, 5.0)
+        
+        # 前后缀仍然保留，只有中间部分整段替换
+        self.assertEqual(diff_opcodes([0] + a + [1], [0] + b + [1], max_d=10),
+                         [('equal', 0, 1, 0, 1), ('replace', 1, 20001, 1, 20001),
+                          ('equal', 20001, 20002, 20001, 20002)])
+        self.assertEqual(diff_opcodes(list("abcabba"), list("cbabac"), max_d=3),
+                         [('replace', 0, 7, 0, 6)])
+        
+        old = ''.join(f"old line {i}\n" for i in range(5000))
+        new = ''.join(f"new line {i}\n" for i in range(5000))
+        self.assertEqual(text_edits(old, new), [(0, len(old), new)])
+    
+    def test_diff_cutoff_keeps_scattered_edits_local(self):
+        """测试超过编辑距离上限时，分散的小修改仍得到局部的操作码"""
+        old = [f"line {i}\n" for i in range(10000)]
+        new = [f"changed {i}\n" if i % 19 == 0 else line for i, line in enumerate(old)]
+        changed = sum(1 for x, y in zip(old, new) if x != y)
+        self.assertGreater(2 * changed, 1000)
+        
+        opcodes = diff_opcodes(old, new)
+        self.assertEqual([op for op in opcodes if op[0] != 'equal'],
+                         [('replace', i, i + 1, i, i + 1) for i in range(0, 10000, 19)])
+        rebuilt = []
+        for tag, i1, i2, j1, j2 in opcodes:
+            rebuilt += old[i1:i2] if tag == 'equal' else new[j1:j2]
+        self.assertEqual(rebuilt, new)
+        
+        edits = text_edits(''.join(old), ''.join(new))
+        self.assertEqual(len(edits), changed)
+        self.assertTrue(all(end - start < 20 for start, end, _ in edits))
+    
+    def test_char_refinement(self):
+        """测试行内修改细化到字符"""
+        edits = text_edits("x = 1\ny = 2\n", "x = 1\ny = 42\n")
+        self.assertEqual(edits, [(10, 10, "4")])
+    
+    def test_revisions_replay(self):
+        """测试多个版本依次回放"""
+        revisions = [
+            "def f():\n    return 1\n",
+            "def f(x):\n    return x + 1\n",
+            "# :smile:\ndef f(x):\n    return x\n",
+        ]
+        builder = synthesize_revisions(revisions, revision_pause=0.5)
+        
+        self.assertEqual(builder.actions[0], {'type': 'insert', 'text': revisions[0]})
+        self.assertEqual(self._play(builder), revisions[-1])
+        self.assertEqual(self._play(synthesize_revisions(revisions, type_initial=True)),
+                         revisions[-1])
+
+
+class TestKeylog(unittest.TestCase):
+    """测试按键日志导入"""
+    
+    def test_import_csv(self):
+        """测试 CSV 日志合并为动作"""
+        log = [
+            "timestamp,key,modifiers",
+            "0.0,h,shift",
+            "0.1,i,",
+            "0.3,Space,",
+            "0.4,c,ctrl",
+            "0.45,x,",
+            "0.5,Backspace,",
+            "0.6,Backspace,",
+            "3.6,ArrowLeft,",
+            "3.7,!,shift",
+        ]
+        actions = list(import_keylog(log, format='csv'))
+        
+        self.assertEqual([type(a).__name__ for a in actions], [
+            'TypeTextAction', 'BackspaceAction', 'PauseAction',
+            'MoveCursorAction', 'TypeTextAction'
+        ])
+        self.assertEqual(actions[0].text, "Hi x")
+        self.assertEqual([round(d, 6) for d in actions[0].char_delays], [0.0, 0.1, 0.2, 0.15])
+        self.assertAlmostEqual(actions[2].get_duration(), 3.0)
+        
+        buffer = TextBuffer()
+        for action in actions:
+            action.execute(buffer)
+        self.assertEqual(buffer.text, "H!i")
+    
+    def test_line_navigation_and_selection(self):
+        """测试上下、行首行尾和 Shift 选区换算为绝对位置"""
+        import json
+        keys = (list("abc") + ["Enter"] + list("de") + ["Up", "X", "End", "!", "Down",
+                "Home", "shift+End", "Z", "ctrl+Home", "shift+Right", "shift+ArrowRight",
+                "Backspace"])
+        log = []
+        for i, key in enumerate(keys):
+            modifiers, _, key = key.rpartition('+') if len(key) > 1 else ('', '', key)
+            log.append(json.dumps({'timestamp': i * 0.1, 'key': key, 'modifiers': modifiers}))
+        actions = list(import_keylog(log))
+        
+        moves = [(a.position, a.offset) for a in actions if isinstance(a, MoveCursorAction)]
+        self.assertEqual(moves, [(2, None), (4, None), (6, None), (0, None)])
+        selections = [(a.start, a.end) for a in actions if isinstance(a, SetSelectionAction)]
+        self.assertEqual(selections, [(6, 8), (0, 2)])
+        
+        buffer = TextBuffer()
+        for action in actions:
+            action.execute(buffer)
+        self.assertEqual(buffer.text, "Xc!\nZ")
+    
+    def test_unsupported_cursor_keys(self):
+        """测试无法映射的光标按键默认报错，非严格模式下警告"""
+        import json
+        import warnings
+        log = ["timestamp,key,modifiers", "0.0,a,", "0.1,PageUp,", "0.2,b,"]
+        with self.assertRaisesRegex(ValueError, "PageUp"):
+            list(import_keylog(log, format='csv'))
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            actions = list(import_keylog(log, format='csv', strict=False))
+        self.assertEqual(len(caught), 1)
+        self.assertEqual([a.text for a in actions], ["ab"])
+        
+        for key, modifiers in (("Left", "ctrl"), ("v", "cmd")):
+            with self.assertRaises(ValueError):
+                list(import_keylog([json.dumps({'timestamp': 0, 'key': key,
+                                                'modifiers': modifiers})]))
+    
+    def test_char_delays_roundtrip(self):
+        """测试逐字符延迟经过解析和二进制格式保持不变"""
+        from binary_script import BinaryScript, encode_actions
+        records = [{'type': 'type', 'text': 'ab :smile:', 'expand_emoji': False,
+                    'char_delays': [0.1, 0.2, 0.3, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1]}]
+        actions = ScriptParser.parse_actions(records)
+        self.assertAlmostEqual(actions[0].get_duration(), 1.3)
+        
+        with BinaryScript(encode_actions(actions)) as script:
+            self.assertEqual(script[0].text, 'ab :smile:')
+            self.assertEqual(script[0].char_delays, records[0]['char_delays'])
+        
+        program = compile_actions(actions)
+        self.assertAlmostEqual(program.times[0], 0.1)
+        self.assertAlmostEqual(program.times[1], 0.3)
+
+
+class TestTimingModels(unittest.TestCase):
+    """测试打字时间模型"""
+    
+    def test_base_is_abstract(self):
+        """测试未实现 delays 的时间模型不能实例化"""
+        from timing import TimingModel
+        with self.assertRaises(TypeError):
+            TimingModel()
+        
+        class Constant(TimingModel):
+            def delays(self, text):
+                return [0.1] * len(text)
+        self.assertAlmostEqual(Constant().duration("abc"), 0.3)
+    
+    def test_bigram_table(self):
+        """测试双字母表决定延迟"""
+        model = BigramTimingModel({' a': 0.2, 'ab': 0.05}, default_delay=0.1, jitter=0.0)
+        self.assertEqual(model.delays("abc"), [0.2, 0.05, 0.1])
+        
+        action = TypeTextAction("abc", timing_model=model)
+        self.assertEqual(action.char_delays, [0.2, 0.05, 0.1])
+        self.assertAlmostEqual(action.get_duration(), 0.35)
+    
+    def test_default_table_and_jitter(self):
+        """测试默认表与抖动范围"""
+        model = BigramTimingModel(default_delay=0.1, jitter=0.2, seed=1)
+        delays = model.delays("the Quick\n" * 50)
+        self.assertEqual(len(delays), 500)
+        self.assertTrue(all(0.0 < d < 0.1 * 1.8 * 1.2 * 1.5 for d in delays))
+        # 常见组合比换行快
+        plain = BigramTimingModel(default_delay=0.1, jitter=0.0)
+        self.assertLess(plain.delays("th")[1], plain.delays("t\n")[1])
+    
+    def test_fit_from_keylog(self):
+        """测试从按键日志拟合"""
+        log, timestamp = [], 0.0
+        for char in "abababab":
+            timestamp += 0.3 if char == 'b' else 0.1
+            log.append('{"timestamp": %.3f, "key": "%s"}' % (timestamp, char))
+        
+        model = BigramTimingModel.fit(log, jitter=0.0)
+        
+        self.assertAlmostEqual(model.table['ab'], 0.3)
+        self.assertAlmostEqual(model.table['ba'], 0.1)
+        self.assertAlmostEqual(model.delays("xab")[2], 0.3)
+    
+    def test_keyboard_model(self):
+        """测试键盘距离模型"""
+        qwerty = KeyboardTimingModel('qwerty', default_delay=0.1, jitter=0.0)
+        delay = lambda model, bigram: model.delays(bigram)[1]
+        
+        # 左右手交替 < 同手 < 同指换键；需要 Shift 更慢
+        self.assertLess(delay(qwerty, 'fj'), delay(qwerty, 'fd'))
+        self.assertLess(delay(qwerty, 'fd'), delay(qwerty, 'fr'))
+        self.assertLess(delay(qwerty, 'fd'), delay(qwerty, 'fD'))
+        # 同样的字母在 Dvorak 上位置不同
+        dvorak = KeyboardTimingModel('dvorak', default_delay=0.1, jitter=0.0)
+        self.assertNotEqual(delay(qwerty, 'as'), delay(dvorak, 'as'))
+        self.assertIn('zé', KeyboardTimingModel('azerty').table)
+        
+        with self.assertRaises(ValueError):
+            KeyboardTimingModel('colemak')
+        action = ScriptParser.parse_action({'type': 'type', 'text': 'hello', 'wpm': 60,
+                                            'timing': {'model': 'keyboard', 'layout': 'azerty'}})
+        self.assertEqual(len(action.char_delays), 5)
+    
+    def test_parser_timing_option(self):
+        """测试脚本中的 timing 字段"""
+        actions = ScriptParser.parse_actions([
+            {'type': 'type', 'text': 'hello', 'wpm': 60, 'timing': 'bigram'},
+            {'type': 'type', 'text': 'hello', 'timing': {'model': 'gaussian', 'seed': 3}},
+        ])
+        self.assertEqual(len(actions[0].char_delays), 5)
+        self.assertEqual(actions[1].char_delays,
+                         ScriptParser.parse_action({'type': 'type', 'text': 'hello',
+                                                    'timing': {'model': 'gaussian', 'seed': 3}})
+                         .char_delays)
+        with self.assertRaises(ValueError):
+            ScriptParser.parse_action({'type': 'type', 'text': 'x', 'timing': 'nope'})
+
+
+class TestTemplate(unittest.TestCase):
+    """测试脚本模板与批量渲染"""
+    
+    TEMPLATE = {'actions': [
+        {'type': 'type', 'text': 'Dear ', 'wpm': 60},
+        {'type': 'type', 'text': '{{name}}', 'wpm': '{{speed}}'},
+        {'type': 'type', 'text': ', thanks for {{item}}!', 'wpm': 60},
+        {'type': 'select', 'start': 0, 'end': 4},
+        {'type': 'type', 'text': 'Hi', 'wpm': 60},
+    ]}
+    
+    def test_render(self):
+        """测试占位符代入"""
+        template = ScriptTemplate(self.TEMPLATE)
+        self.assertEqual(template.variables, ['item', 'name', 'speed'])
+        
+        actions = template.render({'name': 'Ann', 'speed': 90, 'item': 'tea'})
+        self.assertEqual(actions[1], {'type': 'type', 'text': 'Ann', 'wpm': 90})
+        self.assertEqual(actions[2]['text'], ', thanks for tea!')
+        with self.assertRaises(ValueError):
+            template.render({'name': 'Ann'})
+    
+    def test_batch_matches_sequential(self):
+        """测试批量渲染与逐个播放结果一致且共享前缀"""
+        template = ScriptTemplate(self.TEMPLATE)
+        variants = [{'name': name, 'speed': 60, 'item': item}
+                    for name in ('Ann', 'Bob', 'Cy') for item in ('tea', 'cake')]
+        variants.append(dict(variants[0]))
+        
+        renderer = TemplateRenderer(template)
+        states = renderer.render_batch(variants)
+        
+        for values, state in zip(variants, states):
+            buffer = TextBuffer()
+            for action in template.parse(values):
+                action.execute(buffer)
+            self.assertEqual(state.text, buffer.text)
+            self.assertEqual(state.cursor_pos, buffer.cursor)
+        self.assertEqual(states[1].text, "Hi Ann, thanks for cake!")
+        self.assertEqual(states[3].text, "Hi Bob, thanks for cake!")
+        self.assertEqual(renderer.total_actions, 35)
+        # 公共的第一个动作只执行一次，相同的变体不重复执行
+        self.assertEqual(renderer.executed_actions, 1 + 3 + 6 * 3)
+
+
 class TestScriptParser(unittest.TestCase):
     """测试脚本解析器"""
     
@@ -299,6 +1017,219 @@ class TestScriptParser(unittest.TestCase):
         self.assertEqual(len(actions), 1)
         self.assertEqual(actions[0].text, 'Test')
     
+    def test_parse_repeat(self):
+        """测试重复动作保持为单个节点"""
+        body = ScriptBuilder().type("ab", wpm=60).pause(0.1).backspace(2)
+        actions = ScriptParser.parse(ScriptBuilder().repeat(300, body).build())
+        
+        self.assertEqual(len(actions), 1)
+        self.assertIsInstance(actions[0], RepeatAction)
+        self.assertEqual(len(actions[0].actions), 3)
+        
+        scheduler = PlaybackScheduler()
+        scheduler.add_actions(actions + [type_text("done")])
+        events = scheduler.play()
+        
+        self.assertEqual(len(events), 300 * 3 + 1)
+        self.assertEqual(scheduler.buffer.text, "done")
+    
+    def test_repeat_duration(self):
+        """测试重复动作时长为次数乘以单轮时长"""
+        action = RepeatAction(4, [PauseAction(0.25), BackspaceAction(count=2)])
+        self.assertAlmostEqual(action.get_duration(), 4 * 0.35)
+        self.assertAlmostEqual(compile_actions([action]).total_duration, 4 * 0.35)
+    
+    def test_repeat_count_validation(self):
+        """测试重复次数必须是非负整数"""
+        for count in (-3, "3", 2.0, True, None):
+            with self.assertRaises(ValueError):
+                ScriptParser.parse([{"type": "repeat", "count": count, "actions": []}])
+        actions = ScriptParser.parse([{"type": "repeat", "count": 0, "actions": [
+            {"type": "pause", "duration": 1.0}]}])
+        self.assertEqual(actions[0].get_duration(), 0)
+    
+    def test_iter_parse_jsonl(self):
+        """测试流式解析 JSON Lines"""
+        import io
+        lines = io.StringIO(
+            '{"type": "type", "text": "Hello", "wpm": 60}\n'
+            '\n'
+            '{"type": "backspace", "count": 2}\n'
+        )
+        
+        actions = ScriptParser.iter_parse(lines)
+        self.assertIsInstance(next(actions), TypeTextAction)
+        self.assertIsInstance(next(actions), BackspaceAction)
+        self.assertIsNone(next(actions, None))
+        
+        with self.assertRaises(ValueError):
+            list(ScriptParser.iter_parse(['{"type": "pause"}', '{oops']))
+    
+    def test_jsonl_roundtrip_and_stream(self):
+        """测试保存 JSON Lines 并流式播放"""
+        import os
+        import tempfile
+        builder = ScriptBuilder().type("Hello", wpm=60).backspace(1).type("!", wpm=60)
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'script.jsonl')
+            builder.save(path)
+            self.assertEqual(len(ScriptParser.parse(path)), 3)
+            
+            scheduler = PlaybackScheduler()
+            states = []
+            scheduler.on_state_changed(states.append)
+            final = scheduler.play_stream(ScriptParser.iter_parse(path))
+        
+        self.assertEqual(final.text, "Hell!")
+        self.assertEqual(len(states), 3)
+        self.assertEqual(scheduler.get_events(), [])
+    
+    def test_binary_roundtrip(self):
+        """测试二进制脚本写入与 mmap 读取"""
+        import os
+        import tempfile
+        builder = ScriptBuilder().type("Hello :smile:", wpm=60).pause(0.5) \
+            .select(0, 5).type("Hi", wpm=60).repeat(3, ScriptBuilder().backspace(1))
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'script.trb')
+            builder.save(path)
+            
+            with ScriptParser.open_binary(path) as binary:
+                self.assertEqual(len(binary), 5)
+                self.assertEqual(binary[0].text, "Hello 😊")
+                self.assertIsInstance(binary[-1], RepeatAction)
+                self.assertEqual(binary.times[2], binary.times[1] + 0.5)
+                self.assertGreater(binary.total_duration, 0.5)
+            
+            actions = ScriptParser.parse(path)
+        
+        buffer = TextBuffer()
+        for action in actions:
+            action.execute(buffer)
+        self.assertEqual(buffer.text, " 😊")
+    
+    def test_parse_parallel(self):
+        """测试多进程分块解析 JSON Lines"""
+        import os
+        import tempfile
+        builder = ScriptBuilder()
+        for i in range(200):
+            builder.type(f"line {i}\n", wpm=60).backspace(1)
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'script.jsonl')
+            builder.save(path)
+            expected = list(ScriptParser.iter_parse(path))
+            
+            with ScriptParser.parse_parallel(path, workers=2, chunk_size=512) as script:
+                self.assertGreater(len(script.segments), 1)
+                self.assertEqual(len(script), len(expected))
+                self.assertEqual([a.text for a in script[::2]], [a.text for a in expected[::2]])
+                self.assertEqual(script[-1].count, 1)
+                self.assertEqual(len(list(script)), len(expected))
+            
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write('{oops\n')
+            with self.assertRaisesRegex(ValueError, "line 401"):
+                ScriptParser.parse_parallel(path, workers=2, chunk_size=512)
+    
+    def test_binary_rejects_truncated_and_bad_offsets(self):
+        """测试截断或段偏移错误的二进制脚本报 ValueError"""
+        import struct
+        from binary_script import BinaryScript, encode_actions, _HEADER
+        data = encode_actions([type_text("Hello", wpm=60), pause(0.5)])
+        
+        for size in range(len(data)):
+            with self.assertRaisesRegex(ValueError, "(?i)truncated|corrupt|magic"):
+                BinaryScript(data[:size])
+        
+        fields = list(_HEADER.unpack_from(data))
+        for field, delta in ((3, 1), (6, 8), (7, -8), (9, 4096)):
+            corrupt = list(fields)
+            corrupt[field] += delta
+            bad = _HEADER.pack(*corrupt) + data[_HEADER.size:]
+            with self.assertRaisesRegex(ValueError, "corrupt"):
+                BinaryScript(bad)
+        
+        # 段偏移正确但字符串表越界
+        last_offset = fields[9] - 8
+        bad = bytearray(data)
+        struct.pack_into('<Q', bad, last_offset, 10 ** 6)
+        with self.assertRaisesRegex(ValueError, "corrupt"):
+            BinaryScript(bytes(bad))
+    
+    def test_binary_foreign_byte_order(self):
+        """测试主机字节序与文件不同时数组段按交换后的字节序解码"""
+        import struct
+        import sys
+        from unittest import mock
+        import binary_script
+        # 以与本机相反的字节序打包，模拟大端序主机读取小端序文件
+        foreign = '>' if sys.byteorder == 'little' else '<'
+        data = memoryview(struct.pack(foreign + 'Qd', 7, 1.5))
+        with mock.patch.object(binary_script, '_NATIVE_LITTLE_ENDIAN', False):
+            self.assertEqual(list(binary_script._little_endian_array(data[:8], 'Q')), [7])
+            self.assertEqual(list(binary_script._little_endian_array(data[8:], 'd')), [1.5])
+    
+    def test_binary_rejects_callbacks(self):
+        """测试无法编码的动作"""
+        from actions import CallbackAction
+        from binary_script import encode_actions
+        with self.assertRaises(ValueError):
+            encode_actions([CallbackAction(lambda b: None)])
+    
+    def test_register_action_type(self):
+        """测试注册自定义动作类型"""
+        class CustomParser(ScriptParser):
+            @staticmethod
+            def parse_pause(data: dict) -> PauseAction:
+                return PauseAction(data.get('duration', 1.0) * 2)
+        
+        ScriptParser.register_action_type(
+            'shout', lambda data: InsertTextAction(data['text'].upper()), aliases=['Yell']
+        )
+        try:
+            actions = CustomParser.parse_actions([
+                {'type': 'SHOUT', 'text': 'hi'},
+                {'type': 'yell', 'text': 'there'},
+                {'type': 'pause', 'duration': 0.5},
+            ])
+            self.assertEqual([a.text for a in actions[:2]], ['HI', 'THERE'])
+            # 子类重写的解析方法仍然生效
+            self.assertEqual(actions[2].get_duration(), 1.0)
+            self.assertIn('shout', ScriptParser.action_types())
+        finally:
+            for name in ('shout', 'yell'):
+                ScriptParser._registry.pop(name, None)
+                CustomParser._registry.pop(name, None)
+        
+        with self.assertRaises(ValueError):
+            ScriptParser.parse_action({'type': 'shout', 'text': 'x'})
+    
+    def test_override_builtin_type_before_subclass(self):
+        """测试插件覆盖内置类型后定义的子类仍使用插件的构造函数"""
+        class BaseParser(ScriptParser):
+            pass
+        BaseParser.register_action_type('type', lambda data: InsertTextAction(data['text']))
+        
+        class SubParser(BaseParser):
+            @staticmethod
+            def parse_pause(data: dict) -> PauseAction:
+                return PauseAction(data.get('duration', 1.0) * 2)
+        
+        actions = SubParser.parse_actions([
+            {'type': 'type', 'text': 'hi'},
+            {'type': 'pause', 'duration': 0.5},
+            {'type': 'group', 'actions': [{'type': 'type', 'text': 'x'}]},
+        ])
+        self.assertIsInstance(actions[0], InsertTextAction)
+        self.assertEqual(actions[1].get_duration(), 1.0)
+        self.assertIsInstance(actions[2].actions[0], InsertTextAction)
+        self.assertIsInstance(ScriptParser.parse_action({'type': 'type', 'text': 'hi'}),
+                              TypeTextAction)
+    
     def test_script_builder(self):
         """测试脚本构建器"""
         builder = ScriptBuilder()
@@ -313,6 +1244,621 @@ class TestScriptParser(unittest.TestCase):
         self.assertEqual(script['actions'][0]['text'], 'Hello')
 
 
+class TestScriptCache(unittest.TestCase):
+    """测试编译脚本缓存"""
+    
+    def setUp(self):
+        import tempfile
+        from script_cache import ScriptCache
+        self._tmp = tempfile.TemporaryDirectory()
+        self.cache = ScriptCache(f"{self._tmp.name}/cache", max_bytes=10_000)
+        self.script = f"{self._tmp.name}/script.json"
+        ScriptBuilder().type("Hello :smile:", wpm=60).pause(0.5).save(self.script)
+    
+    def tearDown(self):
+        self._tmp.cleanup()
+    
+    def test_hit_after_miss(self):
+        """测试首次未命中、之后命中"""
+        first = ScriptParser.parse_cached(self.script, self.cache)
+        second = ScriptParser.parse_cached(self.script, self.cache)
+        
+        self.assertEqual((self.cache.misses, self.cache.hits), (1, 1))
+        self.assertEqual(second[0].text, first[0].text)
+        self.assertEqual(second[0].text, "Hello 😊")
+        
+        # 内容变化后重新解析
+        ScriptBuilder().type("Bye", wpm=60).save(self.script)
+        self.assertEqual(ScriptParser.parse_cached(self.script, self.cache)[0].text, "Bye")
+        self.assertEqual(self.cache.misses, 2)
+    
+    def test_eviction(self):
+        """测试超过大小上限时淘汰最旧条目"""
+        import os
+        paths = []
+        for i in range(30):
+            actions = [type_text("x" * 1000 + str(i))]
+            paths.append(self.cache.put(f"script {i}".encode(), actions))
+            os.utime(paths[-1], (i, i))
+        
+        total = sum(p.stat().st_size for p in paths if p.exists())
+        self.assertLessEqual(total, 10_000)
+        self.assertTrue(paths[-1].exists())
+        self.assertFalse(paths[0].exists())
+    
+    def test_truncated_entry_is_reparsed(self):
+        """测试截断的缓存条目被删除并重新解析"""
+        expected = ScriptParser.parse(self.script)
+        ScriptParser.parse_cached(self.script, self.cache)
+        path = next(self.cache.directory.glob('*.trb'))
+        data = path.read_bytes()
+        
+        for size in (len(data) - 1, len(data) // 2, 70, 10):
+            path.write_bytes(data[:size])
+            actions = self.cache.load(self.script)
+            self.assertEqual([type(a) for a in actions], [type(a) for a in expected])
+            self.assertEqual(actions[0].text, expected[0].text)
+            # 重新解析后写回完整的条目（随机延迟不同，长度相同）
+            self.assertEqual(len(path.read_bytes()), len(data))
+        self.assertEqual(self.cache.hits, 0)
+    
+    def test_parser_in_key(self):
+        """测试解析器及其注册的类型计入缓存键"""
+        from unittest import mock
+        from actions import InsertTextAction
+        content = b"script"
+        default_key = self.cache.key(content)
+        with mock.patch.dict(ScriptParser._registry, {'shout': InsertTextAction}):
+            self.assertNotEqual(self.cache.key(content), default_key)
+        self.assertEqual(self.cache.key(content), default_key)
+    
+    def test_local_parser_bypasses_cache(self):
+        """测试无法计算指纹的解析器不读写缓存"""
+        import os
+        from actions import InsertTextAction
+        
+        class ShoutParser(ScriptParser):
+            pass
+        ShoutParser.register_action_type('type', lambda data: InsertTextAction(data['text'].upper()))
+        
+        ScriptParser.parse_cached(self.script, self.cache)
+        actions = ShoutParser.parse_cached(self.script, self.cache)
+        
+        self.assertEqual(actions[0].text, "HELLO :SMILE:")
+        self.assertEqual((self.cache.misses, self.cache.hits), (1, 0))
+        self.assertEqual(len(os.listdir(self.cache.directory)), 1)
+    
+    def test_corrupt_entry_is_miss(self):
+        """测试损坏的条目按未命中处理"""
+        content = b"broken"
+        path = self.cache.path_for(self.cache.key(content))
+        path.write_bytes(b"TRPB")
+        
+        self.assertIsNone(self.cache.get(content))
+        self.assertFalse(path.exists())
+
+
+class TestIncrementalRenderer(unittest.TestCase):
+    """测试增量控制台渲染"""
+    
+    @staticmethod
+    def _emulate(output: str) -> list[str]:
+        """极简终端模拟：支持 \\r、\\n、CSI nE/nF/2K/J"""
+        import re
+        screen, row, col = [''], 0, 0
+        for token in re.findall(r'\x1b\[(\d*)([EFKJ])|(\r)|(\n)|([^\x1b\r\n]+)', output):
+            count, command, cr, lf, text = token
+            if command in ('E', 'F'):
+                row += int(count or 1) * (1 if command == 'E' else -1)
+                col = 0
+            elif command == 'K':
+                screen[row] = ''
+            elif command == 'J':
+                del screen[row + 1:]
+                screen[row] = screen[row][:col]
+            elif cr:
+                col = 0
+            elif lf:
+                row, col = row + 1, 0
+            else:
+                line = screen[row]
+                screen[row] = line[:col] + text + line[col + len(text):]
+                col += len(text)
+            while len(screen) <= row:
+                screen.append('')
+        return screen
+    
+    def test_only_changed_lines_rewritten(self):
+        """测试只重写变化的行，且屏幕内容与完整渲染一致"""
+        import io
+        from console import IncrementalRenderer
+        stream = io.StringIO()
+        renderer = IncrementalRenderer(stream=stream, width=200)
+        buffer = TextBuffer()
+        buffer.insert_text("first line\nsecond line\nthird")
+        
+        renderer.render_state(buffer.get_state(0.0))
+        first_frame = stream.getvalue()
+        
+        buffer.move_cursor(5)
+        buffer.delete_char()
+        renderer.render_state(buffer.get_state(0.5))
+        update = stream.getvalue()[len(first_frame):]
+        
+        self.assertNotIn("second line", update)
+        self.assertIn("firs |line", update)
+        expected = renderer._build_lines(buffer.get_state(0.5))
+        self.assertEqual(self._emulate(stream.getvalue()), expected + [''])
+        
+        # 行数减少时清除多余的行
+        buffer.replace_text(0, buffer.length, "x")
+        renderer.render_state(buffer.get_state(1.0))
+        expected = renderer._build_lines(buffer.get_state(1.0))
+        self.assertEqual(self._emulate(stream.getvalue()), expected + [''])
+    
+    def test_wide_characters_clipped_by_display_width(self):
+        """测试按显示宽度截断宽字符行，不会折行到下一屏幕行"""
+        import io
+        from console import IncrementalRenderer
+        from viewport import clip_line, line_width
+        self.assertEqual(clip_line("ab中文中文中", 9), "ab中文中")
+        self.assertEqual(clip_line("中文", 3), "中")
+        self.assertEqual(clip_line("\tab", 9), "\ta")
+        
+        stream = io.StringIO()
+        renderer = IncrementalRenderer(stream=stream, width=80, show_cursor=False)
+        buffer = TextBuffer()
+        buffer.insert_text("宽" * 100)
+        renderer.render_state(buffer.get_state(0.0))
+        
+        self.assertTrue(all(line_width(line) <= 79 for line in renderer._last_lines))
+        self.assertIn("宽" * 39, renderer._last_lines)
+        self.assertNotIn("宽" * 40, stream.getvalue())
+
+class TestConsoleFormat(unittest.TestCase):
+    """测试控制台文本格式化"""
+    
+    def _state(self, text, cursor, selection=None):
+        from buffer import EditorState
+        return EditorState(text, cursor, selection, TextStyle.NORMAL, 0.0)
+    
+    def test_markers(self):
+        """测试光标与选区标记（光标标记在光标所在字符之后）"""
+        from console import ConsoleRenderer
+        renderer = ConsoleRenderer()
+        
+        self.assertEqual(renderer._format_text(self._state("abc\n\nde", 1, Selection(1, 5))),
+                         ["a[b]|[c]", "(empty line)", "de"])
+        self.assertEqual(renderer._format_text(self._state("abc\n\nde", 4)),
+                         ["abc", "|", "de"])
+        self.assertEqual(renderer._format_text(self._state("abc", 3)), ["abc|"])
+    
+    def test_viewport(self):
+        """测试只格式化光标周围的行"""
+        from console import ConsoleRenderer
+        text = "\n".join(f"line {i}" for i in range(100))
+        renderer = ConsoleRenderer(viewport_lines=5)
+        
+        lines = renderer._format_text(self._state(text, text.index("line 50")))
+        
+        self.assertEqual(lines, ["... (48 lines above)", "line 48", "line 49",
+                                 "l|ine 50", "line 51", "line 52", "... (47 lines below)"])
+        self.assertEqual(renderer._format_text(self._state(text, 0))[:2], ["l|ine 0", "line 1"])
+
+
+class TestThrottledDisplay(unittest.TestCase):
+    """测试限帧显示"""
+    
+    def test_renders_latest_and_counts_drops(self):
+        """测试只渲染最新状态并统计丢弃的帧"""
+        import io
+        from console import IncrementalRenderer, ThrottledDisplay
+        stream = io.StringIO()
+        display = ThrottledDisplay(IncrementalRenderer(stream=stream, width=200), max_fps=5)
+        
+        scheduler = PlaybackScheduler()
+        scheduler.add_actions([type_text(f"{i} ", wpm=6000) for i in range(200)])
+        scheduler.on_state_changed(display.submit)
+        with display:
+            scheduler.play(real_time=False)
+        
+        stats = display.stats
+        self.assertEqual(stats['states_submitted'], 200)
+        self.assertGreaterEqual(stats['frames_rendered'], 1)
+        self.assertEqual(stats['frames_rendered'] + stats['frames_dropped'], 200)
+        self.assertLess(stats['frames_rendered'], 200)
+        # 最后一帧一定是最终状态
+        self.assertIn("Length: 690", stream.getvalue().rsplit("Time:", 1)[-1])
+
+
+class TestAsciicast(unittest.TestCase):
+    """测试 asciinema 录像导出"""
+    
+    def test_cast_events_are_minimal_diffs(self):
+        """测试录像头部、事件时间递增，且每个按键只输出变化的部分"""
+        import io
+        import json
+        from asciicast import write_cast
+        actions = [
+            TypeTextAction("ab\ncd", avg_char_delay=0.1, delay_variance=0.0),
+            PauseAction(0.5),
+            BackspaceAction(count=1, char_delay=0.2),
+        ]
+        stream = io.StringIO()
+        count = write_cast(actions, stream, width=10, height=4, title="demo")
+        
+        lines = stream.getvalue().splitlines()
+        header = json.loads(lines[0])
+        self.assertEqual((header['version'], header['width'], header['height']), (2, 10, 4))
+        self.assertEqual(header['title'], "demo")
+        
+        events = [json.loads(line) for line in lines[1:]]
+        # 停顿不改变屏幕，不产生事件
+        self.assertEqual(count, len(events))
+        self.assertEqual(len(events), 1 + 5 + 1)
+        times = [event[0] for event in events]
+        self.assertEqual(times, sorted(times))
+        self.assertAlmostEqual(times[-1], 1.2)
+        
+        # 第二行输入 'd' 只写这一个字符，然后定位光标
+        self.assertEqual(events[5][2], "\x1b[2;2Hd\x1b[2;3H")
+        # 退格只清除行尾
+        self.assertEqual(events[6][2], "\x1b[2;2H\x1b[K\x1b[2;2H")
+    
+    def test_main_accepts_any_script_format(self):
+        """测试命令行入口接受 JSON、JSON Lines 和二进制脚本"""
+        import contextlib
+        import io
+        import os
+        import tempfile
+        from asciicast import main
+        builder = ScriptBuilder().type("Hi\nthere", wpm=600).backspace(2)
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            outputs = []
+            for suffix in ('.json', '.jsonl', '.trb'):
+                script = os.path.join(tmp, 'script' + suffix)
+                output = os.path.join(tmp, suffix[1:] + '.cast')
+                builder.save(script)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    self.assertEqual(main([script, output]), 0)
+                with open(output, encoding='utf-8') as f:
+                    outputs.append(len(f.read().splitlines()))
+        self.assertEqual(outputs, [outputs[0]] * 3)
+        self.assertGreater(outputs[0], 1)
+    
+    def test_viewport_follows_cursor(self):
+        """测试光标移出视口时滚动，且屏幕内容正确"""
+        from asciicast import CastScreen
+        screen = CastScreen(width=5, height=2)
+        text = "l0\nl1\nl2\nl3"
+        screen.update(text, len(text))
+        self.assertEqual(screen.viewport.top, text.index("l2"))
+        
+        screen.update(text, 0)
+        self.assertEqual(screen.viewport.top, 0)
+        
+        # 超出宽度的行水平滚动
+        long_line = "0123456789"
+        output = screen.update(long_line, len(long_line))
+        self.assertEqual(screen.viewport.left, 6)
+        self.assertIn("6789", output)
+
+
+class TestSvgExport(unittest.TestCase):
+    """测试 SVG 动画导出"""
+    
+    def _export(self, actions, **options):
+        import io
+        import xml.etree.ElementTree as ET
+        from svg_export import write_svg
+        stream = io.StringIO()
+        count = write_svg(actions, stream, **options)
+        return count, ET.fromstring(stream.getvalue())
+    
+    def test_runs_defined_once_and_reused(self):
+        """测试相同的片段只定义一次，不变的片段不重复输出"""
+        svg = '{http://www.w3.org/2000/svg}'
+        actions = [TypeTextAction("ab ab", avg_char_delay=0.1, delay_variance=0.0)]
+        count, root = self._export(actions, width=20, height=3)
+        
+        texts = [element.text for element in root.iter(svg + 'text')]
+        self.assertEqual(len(texts), len(set(texts)))
+        self.assertEqual(texts, ['a', 'ab'])
+        
+        uses = list(root.iter(svg + 'use'))
+        self.assertEqual(len(uses), count)
+        # 'a' 两次、'ab' 两次；第一个 'ab' 在第二个单词输入时保持显示
+        self.assertEqual(count, 4)
+        final = [use for use in uses if use.find(svg + 'set').get('end') is None]
+        self.assertEqual(sorted(use.get('x', '0') for use in final), ['0', '25.2'])
+    
+    def test_main_accepts_any_script_format(self):
+        """测试命令行入口接受 JSON、JSON Lines 和二进制脚本"""
+        import contextlib
+        import io
+        import os
+        import tempfile
+        from svg_export import main
+        builder = ScriptBuilder().type("ab cd", wpm=600).backspace(1)
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            outputs = []
+            for suffix in ('.json', '.jsonl', '.trb'):
+                script = os.path.join(tmp, 'script' + suffix)
+                output = os.path.join(tmp, suffix[1:] + '.svg')
+                builder.save(script)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    self.assertEqual(main([script, output]), 0)
+                with open(output, encoding='utf-8') as f:
+                    outputs.append(f.read().count('<use '))
+        self.assertGreater(outputs[0], 0)
+        self.assertEqual(outputs, [outputs[0]] * 3)
+    
+    def test_size_scales_with_edits(self):
+        """测试停顿和滚动不会重复输出整屏内容"""
+        lines = [TypeTextAction(f"line {i}\n", avg_char_delay=0.01, delay_variance=0.0)
+                 for i in range(40)]
+        short, _ = self._export(lines[:20] + [PauseAction(5.0)] * 50, width=20, height=5)
+        long, _ = self._export(lines, width=20, height=5)
+        # 每行约 6 个区间：'l'、'li'、'lin'、'line' 和一到两位编号
+        self.assertLessEqual(short, 20 * 6)
+        self.assertAlmostEqual(long / short, 2.0, delta=0.3)
+
+
+class TestHtmlExport(unittest.TestCase):
+    """测试 HTML 播放器导出"""
+    
+    def test_delta_stream_rebuilds_text(self):
+        """测试按 UTF-16 偏移应用增量流能还原最终文本、光标和选区"""
+        import io
+        import json
+        import re
+        from html_export import write_html
+        actions = [
+            TypeTextAction("a😀b\nc", avg_char_delay=0.1, delay_variance=0.0,
+                           expand_emoji=False),
+            MoveCursorAction(offset=-2),
+            BackspaceAction(count=1),
+            PauseAction(1.0),
+            SetSelectionAction(0, 2),
+            InsertTextAction("中"),
+        ]
+        stream = io.StringIO()
+        count = write_html(actions, stream, title="<demo>")
+        html = stream.getvalue()
+        self.assertIn("<title>&lt;demo&gt;</title>", html)
+        
+        data = json.loads(re.search(r'id="replay-data">(.*?)</script>', html).group(1))
+        records = data['records']
+        self.assertEqual(len(records), count)
+        
+        text = data['text'].encode('utf-16-le')
+        clock = 0
+        for record in records:
+            clock += record[0]
+            if len(record) > 2:
+                position, deleted, inserted = record[2:5]
+                text = (text[:2 * position] + inserted.encode('utf-16-le')
+                        + text[2 * (position + deleted):])
+        
+        expected = TextBuffer()
+        for action in actions:
+            action.execute(expected)
+        self.assertEqual(text.decode('utf-16-le'), expected.text)
+        # 光标在 "中" 之后：'中' 占一个 UTF-16 码元
+        self.assertEqual(records[-1][1], 1)
+        self.assertEqual(clock, round(sum(action.get_duration() for action in actions) * 1000))
+        # 选区记录使用 UTF-16 偏移：'a😀' 占三个码元
+        selections = [record[5:] for record in records if len(record) > 5]
+        self.assertEqual(selections, [[0, 3]])
+    
+    def test_script_payload_escaped(self):
+        """测试嵌入脚本的数据转义 < > &，typed 文本不会改变 <script> 的解析"""
+        import io
+        import json
+        import re
+        from html_export import write_html
+        typed = "<!--<script>a && b</script>-->"
+        stream = io.StringIO()
+        write_html([InsertTextAction(typed)], stream)
+        html = stream.getvalue()
+        
+        payload = re.search(r'id="replay-data">(.*?)</script>', html).group(1)
+        self.assertFalse(set('<>&') & set(payload))
+        records = json.loads(payload)['records']
+        self.assertEqual(records[-1][4], typed)
+    
+    def test_main_accepts_any_script_format(self):
+        """测试命令行入口接受 JSON、JSON Lines 和二进制脚本"""
+        import contextlib
+        import io
+        import os
+        import tempfile
+        from html_export import main
+        builder = ScriptBuilder().type("Hi there", wpm=600).backspace(2)
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            outputs = []
+            for suffix in ('.json', '.jsonl', '.trb'):
+                script = os.path.join(tmp, 'script' + suffix)
+                output = os.path.join(tmp, suffix[1:] + '.html')
+                builder.save(script)
+                with contextlib.redirect_stdout(io.StringIO()) as printed:
+                    self.assertEqual(main([script, output]), 0)
+                outputs.append(printed.getvalue().split()[1])
+        self.assertEqual(outputs, ['10'] * 3)
+
+def _frame_summary(state, timestamp):
+    """并行帧导出测试用的渲染函数（须在模块顶层才能传给工作进程）"""
+    return (round(timestamp, 6), state.text, state.cursor_pos, state.selection)
+
+
+class TestFrameExport(unittest.TestCase):
+    """测试并行帧导出"""
+    
+    def _scheduler(self):
+        scheduler = PlaybackScheduler()
+        scheduler.add_actions([
+            TypeTextAction("Hello World", avg_char_delay=0.05),
+            PauseAction(0.3),
+            BackspaceAction(count=5, char_delay=0.04),
+            SetSelectionAction(0, 5),
+            InsertTextAction("Bye"),
+        ])
+        return scheduler
+    
+    def test_matches_frame_callback(self):
+        """测试多进程分片渲染与逐帧回调结果完全一致"""
+        from frame_export import export_frames, frame_count
+        scheduler = self._scheduler()
+        program = scheduler.compile()
+        
+        expected = []
+        reference = PlaybackScheduler()
+        reference.compile = lambda: program
+        reference.play_with_frame_callback(
+            lambda state, timestamp: expected.append(_frame_summary(state, timestamp)), fps=60)
+        self.assertEqual(len(expected), frame_count(program.total_duration, 60))
+        
+        buffer = TextBuffer()
+        frames = export_frames(program, _frame_summary, fps=60, workers=2, buffer=buffer)
+        self.assertEqual(frames, expected)
+        self.assertEqual(buffer.text, reference.buffer.text)
+        
+        # 渲染函数无法序列化时退回当前进程
+        inline = export_frames(program, lambda state, timestamp: _frame_summary(state, timestamp),
+                               fps=60, workers=2)
+        self.assertEqual(inline, expected)
+    
+    def test_scheduler_export_frames(self):
+        """测试调度器的并行导出入口"""
+        scheduler = self._scheduler()
+        frames = scheduler.export_frames(_frame_summary, fps=10, workers=2)
+        self.assertEqual(frames[0][1], "")
+        self.assertEqual(frames[-1][1], scheduler.buffer.text)
+
+
+class TestEventBus(unittest.TestCase):
+    """测试多订阅者事件总线"""
+    
+    def _scheduler(self):
+        scheduler = PlaybackScheduler()
+        scheduler.add_actions([
+            TypeTextAction("Hi", avg_char_delay=0.0, delay_variance=0.0),
+            MoveCursorAction(position=0),
+            InsertTextAction(">"),
+        ])
+        return scheduler
+    
+    def test_sync_subscribers_and_callbacks(self):
+        """测试多个同步订阅者与 on_* 回调并存，取消订阅后不再收到事件"""
+        scheduler = self._scheduler()
+        first, second, legacy = [], [], []
+        scheduler.on_state_changed(lambda state: legacy.append(state.text))
+        subscription = scheduler.subscribe('state', lambda state: first.append(state.text))
+        scheduler.subscribe('action', lambda event: second.append(event.action))
+        scheduler.play()
+        
+        self.assertEqual(first, ["Hi", "Hi", ">Hi"])
+        self.assertEqual(first, legacy)
+        self.assertEqual(len(second), 3)
+        
+        subscription.close()
+        scheduler.play()
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(second), 6)
+    
+    def test_callbacks_receive_state_views(self):
+        """测试回调和事件使用状态视图；没有消费者的流式播放不创建事件"""
+        scheduler = self._scheduler()
+        states = []
+        scheduler.on_state_changed(states.append)
+        events = scheduler.play()
+        self.assertTrue(all(isinstance(state, EditorStateView) for state in states))
+        self.assertIsInstance(events[0].state_before, EditorStateView)
+        self.assertEqual(events[-1].state_before.text, "Hi")
+        self.assertEqual(events[-1].state_after.text, ">Hi")
+        self.assertIsInstance(scheduler.get_state_at_time(0.0), EditorState)
+        
+        quiet = PlaybackScheduler()
+        self.assertIsNone(quiet._play_compiled([InsertTextAction("x")], False, 1.0, record=False))
+        self.assertEqual(quiet.play_stream(iter([InsertTextAction("y")])).text, "xy")
+    
+    def test_thread_subscriber_batches(self):
+        """测试线程订阅成批投递，关闭时投递完剩余事件"""
+        scheduler = self._scheduler()
+        batches, expected = [], []
+        subscription = scheduler.subscribe('state', batches.append, mode='thread', maxsize=2)
+        scheduler.subscribe('state', lambda state: expected.append(state.text))
+        for _ in range(5):
+            scheduler.play()
+        subscription.close()
+        
+        texts = [state.text for batch in batches for state in batch]
+        self.assertEqual(texts, expected)
+        self.assertEqual(len(texts), 15)
+        self.assertTrue(all(len(batch) <= 2 for batch in batches))
+        self.assertEqual(subscription.stats, {'delivered': 15, 'dropped': 0})
+    
+    def test_backpressure_drops(self):
+        """测试 drop_oldest 与 coalesce 在消费者阻塞时丢弃旧事件"""
+        import threading
+        for backpressure, kept in (('drop_oldest', 3), ('coalesce', 1)):
+            release = threading.Event()
+            received = []
+            
+            def consume(batch):
+                release.wait()
+                received.extend(batch)
+            
+            bus = EventBus()
+            subscription = bus.subscribe('action', consume, mode='thread',
+                                         maxsize=3, backpressure=backpressure)
+            bus.publish('action', 0)
+            # 等待工作线程取走第一个事件并阻塞在回调中
+            while subscription._mailbox._items:
+                pass
+            for item in range(1, 11):
+                bus.publish('action', item)
+            release.set()
+            bus.close()
+            
+            self.assertEqual(received, [0] + list(range(11 - kept, 11)))
+            self.assertEqual(subscription.dropped, 10 - kept)
+    
+    def test_asyncio_subscriber(self):
+        """测试 asyncio 订阅在事件循环中读取另一线程回放产生的事件"""
+        import asyncio
+        
+        async def run():
+            scheduler = self._scheduler()
+            subscription = scheduler.subscribe('state', mode='asyncio', maxsize=1)
+            received = []
+            
+            async def consume():
+                async for batch in subscription:
+                    received.extend(state.text for state in batch)
+            
+            consumer = asyncio.ensure_future(consume())
+            await asyncio.get_running_loop().run_in_executor(None, scheduler.play)
+            subscription.close()
+            await consumer
+            return received
+        
+        self.assertEqual(asyncio.run(run()), ["Hi", "Hi", ">Hi"])
+    
+    def test_invalid_subscription(self):
+        """测试未知主题、投递方式和背压策略"""
+        bus = EventBus()
+        with self.assertRaises(ValueError):
+            bus.subscribe('frame', print)
+        with self.assertRaises(ValueError):
+            bus.subscribe('state', print, mode='process')
+        with self.assertRaises(ValueError):
+            bus.subscribe('state', print, backpressure='latest')
+
+
 class TestIntegration(unittest.TestCase):
     """集成测试"""
     
@@ -0,0 +1,406 @@
+"""
+打字时间模型 (Timing Model)
+为一整段文本一次性生成逐字符延迟，供 TypeTextAction 使用
+"""
+
+import random
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from itertools import chain, cycle, islice, repeat
+from operator import add, mul
+from pathlib import Path
+from typing import Callable, Iterable, Optional, Union
+
+
+class TimingModel(ABC):
+    """时间模型基类"""
+    
+    @abstractmethod
+    def delays(self, text: str) -> list[float]:
+        """
+        生成逐字符延迟
+        
+        Args:
+            text: 要打出的文本
+        
+        Returns:
+            与 text 等长的延迟列表（秒）
+        """
+        pass
+    
+    def duration(self, text: str) -> float:
+        """打出整段文本的总时长"""
+        return sum(self.delays(text))
+
+
+class GaussianTimingModel(TimingModel):
+    """与 TypeTextAction 默认行为相同的独立高斯延迟"""
+    
+    def __init__(self, avg_char_delay: float = 0.1, delay_variance: float = 0.05,
+                 seed: Optional[int] = None):
+        self.avg_char_delay = avg_char_delay
+        self.delay_variance = delay_variance
+        self._random = random.Random(seed)
+    
+    def delays(self, text: str) -> list[float]:
+        gauss = self._random.gauss
+        avg, variance = self.avg_char_delay, self.delay_variance
+        return [max(0.01, gauss(avg, variance)) for _ in range(len(text))]
+    
+    def __repr__(self) -> str:
+        return f"GaussianTimingModel({self.avg_char_delay}, {self.delay_variance})"
+
+
+# 常见英文双字母组合（按键更连贯）
+COMMON_BIGRAMS = (
+    'th', 'he', 'in', 'er', 'an', 're', 'on', 'at', 'en', 'nd', 'ti', 'es', 'or',
+    'te', 'of', 'ed', 'is', 'it', 'al', 'ar', 'st', 'to', 'nt', 'ng', 'se', 'ha',
+    'as', 'ou', 'io', 'le', 've', 'co', 'me', 'de', 'hi', 'ri', 'ro', 'ic', 'ne',
+)
+
+# 默认表覆盖的字符
+DEFAULT_CHARSET = ''.join(chr(code) for code in range(32, 127)) + '\n\t'
+
+
+def _default_factor(previous: str, char: str) -> float:
+    """默认双字母表中相对于平均延迟的倍数"""
+    factor = 1.0
+    if (previous + char).lower() in _COMMON_BIGRAM_SET:
+        factor *= 0.75
+    if previous == char:
+        factor *= 0.85
+    if char == '\n':
+        factor *= 1.8
+    elif char == ' ':
+        factor *= 0.9
+    elif char.isupper():
+        factor *= 1.25
+    elif char.isdigit():
+        factor *= 1.2
+    elif not char.isalnum():
+        factor *= 1.3
+    if previous == '\n':
+        factor *= 1.5
+    elif previous == ' ':
+        factor *= 1.15
+    return factor
+
+
+_COMMON_BIGRAM_SET = frozenset(COMMON_BIGRAMS)
+
+
+@lru_cache(maxsize=None)
+def _default_factors() -> dict[str, float]:
+    return {previous + char: _default_factor(previous, char)
+            for previous in DEFAULT_CHARSET for char in DEFAULT_CHARSET}
+
+
+class BigramTimingModel(TimingModel):
+    """
+    双字母延迟模型
+    
+    每个字符的延迟取决于它和前一个字符组成的双字母，查预先计算好的表得到。
+    整段文本一次性求值：键的拼接、查表和抖动都在 map 中完成，不逐字符执行 Python 代码。
+    """
+    
+    # 抖动因子表的长度（循环使用，起点随机）
+    JITTER_TABLE_SIZE = 4096
+    
+    def __init__(self, table: Optional[dict[str, float]] = None,
+                 default_delay: float = 0.1, jitter: float = 0.15,
+                 seed: Optional[int] = None):
+        """
+        Args:
+            table: 双字母 -> 延迟（秒）；默认按常见英文输入习惯由 default_delay 生成
+            default_delay: 表中没有的双字母使用的延迟
+            jitter: 相对抖动幅度（0 表示完全确定）
+            seed: 随机种子
+        """
+        if table is None:
+            table = {bigram: default_delay * factor
+                     for bigram, factor in _default_factors().items()}
+        self.table = table
+        self.default_delay = default_delay
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._jitter_factors = [1.0 + jitter * (2.0 * self._random.random() - 1.0)
+                                for _ in range(self.JITTER_TABLE_SIZE)] if jitter else None
+    
+    def delays(self, text: str) -> list[float]:
+        # 第一个字符视为紧跟在空格之后
+        bigrams = map(add, chain(' ', text), text)
+        delays = map(self.table.get, bigrams, repeat(self.default_delay))
+        if self._jitter_factors is None:
+            return list(delays)
+        start = self._random.randrange(self.JITTER_TABLE_SIZE)
+        factors = islice(cycle(self._jitter_factors), start, None)
+        return list(map(mul, delays, factors))
+    
+    @classmethod
+    def from_records(cls, records: Iterable[dict], min_count: int = 2,
+                     **options) -> 'BigramTimingModel':
+        """
+        由打字动作记录（带 char_delays，如按键日志导入的结果）拟合
+        
+        Args:
+            records: 脚本动作字典；只使用带 char_delays 的打字动作
+            min_count: 双字母至少出现的次数，不足时使用整体平均延迟
+            **options: 传给构造函数的其他参数
+        """
+        sums: dict[str, float] = {}
+        counts: dict[str, int] = {}
+        total = 0.0
+        total_count = 0
+        for record in records:
+            delays = record.get('char_delays')
+            if record.get('type') != 'type' or not delays:
+                continue
+            text = record['text']
+            # 每段的第一个延迟跨越了其他动作，不计入
+            for index in range(1, min(len(text), len(delays))):
+                bigram = text[index - 1:index + 1]
+                delay = delays[index]
+                sums[bigram] = sums.get(bigram, 0.0) + delay
+                counts[bigram] = counts.get(bigram, 0) + 1
+                total += delay
+                total_count += 1
+        
+        fallback_delay = options.pop('default_delay', 0.1)
+        default_delay = total / total_count if total_count else fallback_delay
+        table = {bigram: sums[bigram] / count
+                 for bigram, count in counts.items() if count >= min_count}
+        return cls(table, default_delay=default_delay, **options)
+    
+    @classmethod
+    def fit(cls, source: Union[str, Path, Iterable[str]], format: Optional[str] = None,
+            time_scale: float = 1.0, pause_threshold: float = 2.0,
+            min_count: int = 2, **options) -> 'BigramTimingModel':
+        """
+        由按键日志拟合（流式读取，内存只与不同双字母的数量有关）
+        
+        Args:
+            source: 按键日志路径或逐行文本
+            format: 'csv' 或 'jsonl'（默认按文件后缀判断）
+            time_scale: 时间戳换算为秒的系数
+            pause_threshold: 超过该间隔的按键不计入（视为停顿）
+            min_count: 双字母至少出现的次数
+            **options: 传给构造函数的其他参数
+        """
+        import warnings
+        from keylog import KeylogImporter, iter_key_events
+        
+        # 只统计打字节奏，光标位置是否准确无关紧要，无法映射的按键直接跳过
+        importer = KeylogImporter(pause_threshold=pause_threshold, strict=False)
+        records = importer.iter_records(iter_key_events(source, format, time_scale))
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            return cls.from_records(records, min_count=min_count, **options)
+    
+    def __repr__(self) -> str:
+        return (f"BigramTimingModel({len(self.table)} bigrams, "
+                f"default={self.default_delay:.3f}s, jitter={self.jitter})")
+
+
+# ==================== 键盘距离模型 ====================
+
+# 布局：四行按键（数字行、上排、中排、下排），每行为 (起始列, 未按 Shift 的字符, 按 Shift 的字符)
+# 起始列为 -1 表示 ISO 键盘下排最左侧多出的一个键
+KEYBOARD_LAYOUTS = {
+    'qwerty': (
+        (0, "`1234567890-=", "~!@#$%^&*()_+"),
+        (0, "qwertyuiop[]\\", "QWERTYUIOP{}|"),
+        (0, "asdfghjkl;'", 'ASDFGHJKL:"'),
+        (0, "zxcvbnm,./", "ZXCVBNM<>?"),
+    ),
+    'azerty': (
+        (0, "²&é\"'(-è_çà)=", "~1234567890°+"),
+        (0, "azertyuiop^$", "AZERTYUIOP¨£"),
+        (0, "qsdfghjklmù*", "QSDFGHJKLM%µ"),
+        (-1, "<wxcvbn,;:!", ">WXCVBN?./§"),
+    ),
+    'dvorak': (
+        (0, "`1234567890[]", "~!@#$%^&*(){}"),
+        (0, "',.pyfgcrl/=\\", '"<>PYFGCRL?+|'),
+        (0, "aoeuidhtns-", 'AOEUIDHTNS_'),
+        (0, ";qjkxbmwvz", ":QJKXBMWVZ"),
+    ),
+}
+
+# 各行相对数字行的水平错位（以键宽为单位）
+_ROW_OFFSETS = (0.0, 1.5, 1.75, 2.25)
+
+# 各行每一列对应的手指：0-3 为左手小指到食指，4-7 为右手食指到小指
+_ROW_FINGERS = (
+    (0, 0, 1, 2, 3, 3, 4, 4, 5, 6, 7, 7, 7),
+    (0, 1, 2, 3, 3, 4, 4, 5, 6, 7, 7, 7, 7),
+    (0, 1, 2, 3, 3, 4, 4, 5, 6, 7, 7, 7),
+    (0, 1, 2, 3, 3, 4, 4, 5, 6, 7, 7),
+)
+
+# 相对平均延迟的倍数
+_REPEAT_FACTOR = 0.9       # 同一个键连按
+_ALTERNATE_FACTOR = 0.8    # 左右手交替
+_SAME_HAND_FACTOR = 1.0    # 同手不同指
+_SAME_FINGER_FACTOR = 1.25 # 同指换键
+_DISTANCE_FACTOR = 0.08    # 同手每键宽距离
+_SAME_FINGER_DISTANCE_FACTOR = 0.15
+_SHIFT_FACTOR = 0.3        # 需要按 Shift
+_SHIFT_SAME_HAND_FACTOR = 0.1  # Shift 要由刚打字的那只手按
+_SPACE_FACTOR = 0.9        # 拇指按空格
+
+
+def _layout_keys(layout: str) -> dict[str, tuple[float, float, int, bool]]:
+    """字符 -> (x, y, 手指, 是否需要 Shift)"""
+    try:
+        rows = KEYBOARD_LAYOUTS[layout.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown keyboard layout: {layout}") from None
+    
+    keys = {}
+    for row, (start, plain, shifted) in enumerate(rows):
+        fingers = _ROW_FINGERS[row]
+        for index, (char, shift_char) in enumerate(zip(plain, shifted)):
+            column = start + index
+            position = (_ROW_OFFSETS[row] + column, float(row),
+                        fingers[max(0, min(column, len(fingers) - 1))])
+            keys.setdefault(char, position + (False,))
+            keys.setdefault(shift_char, position + (True,))
+    # 换行由右手小指按回车，制表符由左手小指按
+    keys['\n'] = (_ROW_OFFSETS[2] + 12.5, 2.0, 7, False)
+    keys['\t'] = (0.0, 1.0, 0, False)
+    return keys
+
+
+@lru_cache(maxsize=None)
+def keyboard_factor_table(layout: str) -> dict[str, float]:
+    """
+    预先计算某个布局下所有双字母相对平均延迟的倍数（每个布局只计算一次）
+    
+    Args:
+        layout: 'qwerty' / 'azerty' / 'dvorak'
+    
+    Returns:
+        双字母 -> 倍数
+    """
+    keys = _layout_keys(layout)
+    table = {}
+    for previous, (x1, y1, finger1, _) in keys.items():
+        hand1 = finger1 >= 4
+        for char, (x2, y2, finger2, shift) in keys.items():
+            hand2 = finger2 >= 4
+            distance = ((x2 - x1) ** 2 + (y2 - y1) ** 2) ** 0.5
+            if previous == char:
+                factor = _REPEAT_FACTOR
+            elif hand1 != hand2:
+                factor = _ALTERNATE_FACTOR
+            elif finger1 == finger2:
+                factor = _SAME_FINGER_FACTOR + _SAME_FINGER_DISTANCE_FACTOR * distance
+            else:
+                factor = _SAME_HAND_FACTOR + _DISTANCE_FACTOR * distance
+            if shift:
+                # Shift 由另一只手按下
+                factor += _SHIFT_FACTOR
+                if hand1 != hand2:
+                    factor += _SHIFT_SAME_HAND_FACTOR
+            table[previous + char] = factor
+        table[previous + ' '] = _SPACE_FACTOR
+    for char in keys:
+        table[' ' + char] = keys[char][3] * _SHIFT_FACTOR + 1.0
+    table['  '] = _REPEAT_FACTOR
+    return table
+
+
+class KeyboardTimingModel(BigramTimingModel):
+    """
+    键盘距离模型
+    
+    延迟由物理键位决定：左右手交替最快，同手按距离增加，同指换键最慢，
+    需要 Shift 的字符额外加时。各布局的双字母倍数表只计算一次并缓存，
+    求值方式与 BigramTimingModel 相同。
+    """
+    
+    def __init__(self, layout: str = 'qwerty', default_delay: float = 0.1,
+                 jitter: float = 0.15, seed: Optional[int] = None):
+        """
+        Args:
+            layout: 'qwerty' / 'azerty' / 'dvorak'
+            default_delay: 平均延迟（布局外的字符直接使用）
+            jitter: 相对抖动幅度
+            seed: 随机种子
+        """
+        self.layout = layout.lower()
+        factors = keyboard_factor_table(self.layout)
+        table = dict(zip(factors, map(default_delay.__mul__, factors.values())))
+        super().__init__(table, default_delay=default_delay, jitter=jitter, seed=seed)
+    
+    def __repr__(self) -> str:
+        return (f"KeyboardTimingModel({self.layout!r}, "
+                f"default={self.default_delay:.3f}s, jitter={self.jitter})")
+
+
+# ==================== 注册表 ====================
+
+# 模型名 -> 工厂函数；工厂接收 avg_char_delay、delay_variance 和脚本中的其他参数
+TIMING_MODELS: dict[str, Callable[..., TimingModel]] = {}
+
+
+def register_timing_model(name: str, factory: Callable[..., TimingModel]) -> None:
+    """注册时间模型，供脚本中的 'timing' 字段使用"""
+    TIMING_MODELS[name.lower()] = factory
+
+
+@lru_cache(maxsize=32)
+def _fitted_bigram_model(path: str, jitter: float) -> BigramTimingModel:
+    # 同一份日志只拟合一次
+    return BigramTimingModel.fit(path, jitter=jitter)
+
+
+def _bigram_factory(avg_char_delay: float, delay_variance: float,
+                    keylog: Optional[str] = None, jitter: float = 0.15,
+                    seed: Optional[int] = None) -> BigramTimingModel:
+    if keylog is not None:
+        return _fitted_bigram_model(str(keylog), jitter)
+    return BigramTimingModel(default_delay=avg_char_delay, jitter=jitter, seed=seed)
+
+
+def _gaussian_factory(avg_char_delay: float, delay_variance: float,
+                      seed: Optional[int] = None) -> GaussianTimingModel:
+    return GaussianTimingModel(avg_char_delay, delay_variance, seed)
+
+
+def _keyboard_factory(avg_char_delay: float, delay_variance: float,
+                      layout: str = 'qwerty', jitter: float = 0.15,
+                      seed: Optional[int] = None) -> KeyboardTimingModel:
+    return KeyboardTimingModel(layout, default_delay=avg_char_delay, jitter=jitter, seed=seed)
+
+
+register_timing_model('gaussian', _gaussian_factory)
+register_timing_model('bigram', _bigram_factory)
+register_timing_model('keyboard', _keyboard_factory)
+
+
+def create_timing_model(spec: Union[str, dict, TimingModel], avg_char_delay: float = 0.1,
+                        delay_variance: float = 0.05) -> TimingModel:
+    """
+    根据脚本中的 'timing' 字段创建时间模型
+    
+    Args:
+        spec: 模型名（如 'bigram'），或 {'model': 名称, ...参数} 字典，或现成的模型
+        avg_char_delay: 动作的平均字符延迟
+        delay_variance: 动作的延迟抖动
+    
+    Returns:
+        TimingModel
+    """
+    if isinstance(spec, TimingModel):
+        return spec
+    if isinstance(spec, str):
+        name, params = spec, {}
+    else:
+        params = dict(spec)
+        name = params.pop('model', 'gaussian')
+    
+    factory = TIMING_MODELS.get(name.lower())
+    if factory is None:
+        raise ValueError(f"Unknown timing model: {name}")
+    return factory(avg_char_delay, delay_variance, **params)
@@ -0,0 +1,5 @@
+"""
+版本信息
+"""
+
+__version__ = '1.0.0'
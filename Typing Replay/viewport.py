@@ -0,0 +1,213 @@
+"""
+文本视口 (Viewport)
+跟随光标滚动的固定大小文本窗口，供各种导出器共用
+
+列宽按终端规则计算：制表符展开到制表位，东亚宽字符占两列。
+"""
+
+import unicodedata
+from typing import Optional
+
+
+TAB_WIDTH = 8
+
+
+def char_width(char: str) -> int:
+    """终端中字符占用的列数（东亚宽字符占两列）"""
+    if char < 'ᄀ':
+        return 1
+    return 2 if unicodedata.east_asian_width(char) in ('W', 'F') else 1
+
+
+def line_width(text: str) -> int:
+    """一行文本开头到末尾的显示宽度（制表符展开到制表位）"""
+    if text.isascii() and '\t' not in text:
+        return len(text)
+    column = 0
+    for char in text:
+        if char == '\t':
+            column += TAB_WIDTH - column % TAB_WIDTH
+        else:
+            column += char_width(char)
+    return column
+
+
+def clip_line(text: str, width: int) -> str:
+    """截取一行开头显示宽度不超过 width 的部分（不截断宽字符和制表符）"""
+    if text.isascii() and '\t' not in text:
+        return text[:width]
+    column = 0
+    for index, char in enumerate(text):
+        if char == '\t':
+            column += TAB_WIDTH - column % TAB_WIDTH
+        else:
+            column += char_width(char)
+        if column > width:
+            return text[:index]
+    return text
+
+
+def line_cells(line: str, sel_start: int, sel_end: int) -> list[tuple[str, bool]]:
+    """
+    把一行展开为终端单元格 [(字符, 是否选中)]
+    
+    制表符展开为空格；宽字符占两个单元格，第二个单元格的字符为空串。
+    """
+    if sel_start == sel_end and line.isascii() and '\t' not in line:
+        return [(char, False) for char in line]
+    cells = []
+    for offset, char in enumerate(line):
+        selected = sel_start <= offset < sel_end
+        if char == '\t':
+            cells.extend([(' ', selected)] * (TAB_WIDTH - len(cells) % TAB_WIDTH))
+        elif char_width(char) == 2:
+            cells.append((char, selected))
+            cells.append(('', selected))
+        else:
+            cells.append((char, selected))
+    return cells
+
+
+class Viewport:
+    """
+    跟随光标滚动的视口
+    
+    update() 之后：
+        top_line    视口首行的行号（滚动时更新）
+        lines       视口内各行的文本（不足的行为 None）
+        selections  各行与选区的交集（行内字符偏移）
+        cursor_row / cursor_column  光标在视口中的行和列
+    
+    超出宽度的行水平滚动，使光标始终可见。
+    """
+    
+    def __init__(self, width: int = 80, height: int = 24):
+        """
+        Args:
+            width: 列数
+            height: 行数
+        """
+        if width < 1 or height < 1:
+            raise ValueError("Viewport size must be positive")
+        self.width = width
+        self.height = height
+        # 视口首行在文本中的起始偏移，以及水平滚动的列数
+        self.top = 0
+        self.left = 0
+        self.top_line = 0
+        self.lines: list[Optional[str]] = [None] * height
+        self.selections: list[tuple[int, int]] = [(0, 0)] * height
+        self.cursor_row = 0
+        self.cursor_column = 0
+        # 上一次视口末尾的偏移和文本长度，用来估计本次视口的范围
+        self._window_end = 0
+        self._length = 0
+    
+    def update(self, text: str, cursor: int, selection=None) -> bool:
+        """
+        按当前文本和光标更新视口
+        
+        Args:
+            text: 当前文本
+            cursor: 光标位置
+            selection: 当前选区（None 或空选区表示无选区）
+        
+        Returns:
+            是否发生了水平滚动（所有行都需要重绘）
+        """
+        line_start = text.rfind('\n', 0, cursor) + 1
+        self._scroll_vertical(text, cursor, line_start)
+        column = line_width(text[line_start:cursor])
+        scrolled = self._scroll_horizontal(column)
+        
+        self.cursor_row = text.count('\n', self.top, cursor)
+        self.cursor_column = column - self.left
+        self.lines = self._window(text)
+        self.selections = self._row_selections(self.lines, selection)
+        return scrolled
+    
+    def cells(self, row: int) -> list[tuple[str, bool]]:
+        """一行的可见单元格 [(字符, 是否选中)]；被边界切开的宽字符显示为空格"""
+        line = self.lines[row]
+        if line is None:
+            return []
+        left, right = self.left, self.left + self.width
+        # 制表符和宽字符只会让行变宽，截取这么多字符足以覆盖可见列
+        cells = line_cells(line[:right], *self.selections[row])
+        visible = cells[left:right]
+        if visible and visible[0][0] == '':
+            visible[0] = (' ', visible[0][1])
+        if right < len(cells) and cells[right][0] == '':
+            visible[-1] = (' ', visible[-1][1])
+        return visible
+    
+    def _window(self, text: str) -> list[Optional[str]]:
+        """
+        视口内的各行文本，不足的行为 None
+        
+        按上一次视口的范围加上文本长度的变化估计本次范围，只切分这一小段；
+        估计不足时才逐行查找。
+        """
+        top, height = self.top, self.height
+        guess = max(top, self._window_end + len(text) - self._length) + 1
+        lines = text[top:guess].split('\n', height)
+        if len(lines) > height:
+            lines.pop()
+        elif guess < len(text):
+            end = top
+            for _ in range(height):
+                end = text.find('\n', end) + 1
+                if end == 0:
+                    end = len(text) + 1
+                    break
+            lines = text[top:end - 1].split('\n')
+        
+        self._window_end = top + sum(map(len, lines)) + len(lines) - 1
+        self._length = len(text)
+        if len(lines) < height:
+            lines.extend([None] * (height - len(lines)))
+        return lines
+    
+    def _row_selections(self, lines: list[Optional[str]], selection) -> list[tuple[int, int]]:
+        """各行与选区的交集（行内偏移）"""
+        if selection is None or selection.is_empty:
+            return [(0, 0)] * self.height
+        result = []
+        position = self.top
+        for line in lines:
+            if line is None:
+                result.append((0, 0))
+                continue
+            length = len(line)
+            result.append((min(length, max(0, selection.start - position)),
+                           min(length, max(0, selection.end - position))))
+            position += length + 1
+        return result
+    
+    def _scroll_vertical(self, text: str, cursor: int, line_start: int) -> None:
+        # 视口之外的编辑可能使 top 落在行中间或超出文本，先对齐到行首
+        top = min(self.top, len(text))
+        top = text.rfind('\n', 0, top) + 1 if top > 0 else 0
+        if cursor < top:
+            top = line_start
+        elif text.count('\n', top, cursor) >= self.height:
+            # 光标在视口下方：让光标所在行成为最后一行
+            top = line_start
+            for _ in range(self.height - 1):
+                if top == 0:
+                    break
+                top = text.rfind('\n', 0, top - 1) + 1
+        if top != self.top:
+            # 只在滚动时重新计数；视口外的编辑可能使行号整体偏移，但各行的相对位置不变
+            self.top_line = text.count('\n', 0, top)
+        self.top = top
+    
+    def _scroll_horizontal(self, cursor_column: int) -> bool:
+        left = self.left
+        if cursor_column < left:
+            left = cursor_column
+        elif cursor_column >= left + self.width:
+            left = cursor_column - self.width + 1
+        changed = left != self.left
+        self.left = left
+        return changed